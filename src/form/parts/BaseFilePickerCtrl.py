@@ -7,6 +7,7 @@ import re
 import wx
 import logging
 from mmd.PmxReader import PmxReader
+from mmd.VmdData import VmdMotion
 from mmd.VmdReader import VmdReader
 from mmd.VpdReader import VpdReader
 from utils import MFileUtils
@@ -48,6 +49,10 @@ class BaseFilePickerCtrl():
         self.set_no = set_no
         self.required = required
         self.data = None
+        # 読み込んだファイルの変更検知用シグネチャ（サイズ・更新日時・部分ハッシュ）
+        self.data_signature = None
+        # 読み込んだ時のリーダーのオプション（展開対象ボーン・モーフ等）
+        self.data_load_options = None
         self.astr_path = None
         self.target_paths = []
 
@@ -218,6 +223,15 @@ class BaseFilePickerCtrl():
             logger.error("{0}{1}の拡張子が正しくありません。\n入力パス: {2}\n設定可能拡張子: {3}".format(
                 display_set_no, self.title, self.file_ctrl.GetPath(), self.file_type), decoration=MLogger.DECORATION_BOX)
             return False
+
+        if not self.is_save and ext[1:].lower() in ["pmx", "vmd", "vpd"]:
+            # ヘッダだけ読み込んで、データ形式が正しいかチェック
+            try:
+                create_reader(file_path).read_metadata()
+            except Exception:
+                logger.error("{0}{1}のデータ形式が正しくありません。\n入力パス: {2}".format(
+                    display_set_no, self.title, self.file_ctrl.GetPath()), decoration=MLogger.DECORATION_BOX)
+                return False
         
         # 親ディレクトリ取得
         if self.is_save:
@@ -258,7 +272,7 @@ class BaseFilePickerCtrl():
         results[target] = self.load()
 
     # ファイル読み込み処理
-    def load(self, file_idx=0, is_check=True):
+    def load(self, file_idx=0, is_check=True, is_mmap=False, bone_names=None, morph_names=None):
         if not self.is_set_path():
             # パスが指定されてない場合、そのまま終了
             self.data = None
@@ -297,7 +311,7 @@ class BaseFilePickerCtrl():
 
             # 拡張子別にリーダー生成
             if input_ext.lower() == ".vmd":
-                reader = VmdReader(file_path)
+                reader = VmdReader(file_path, is_mmap=is_mmap, bone_names=bone_names, morph_names=morph_names)
             elif input_ext.lower() == ".vpd":
                 reader = VpdReader(file_path)
             elif input_ext.lower() == ".pmx":
@@ -306,20 +320,31 @@ class BaseFilePickerCtrl():
                 logger.error("%s%s 読み込み失敗(拡張子不正): %s", display_set_no, self.title, os.path.basename(file_path), decoration=MLogger.DECORATION_BOX)
                 return False
             
-            # ハッシュ値取得
-            new_data_digest = reader.hexdigest()
-
-            # 新規データがあり、かつハッシュが違う場合、置き換え
-            if new_data_digest and ((self.data and self.data.digest != new_data_digest) or not self.data):
-                # ハッシュが取得できてて、過去データがないかハッシュが違う場合、読み込み
-                self.data = reader.read_data()
-                    
-                logger.info("%s%s 読み込み成功: %s", display_set_no, self.title, os.path.basename(file_path))
-                return True
-            elif new_data_digest and self.data and self.data.digest == new_data_digest:
-                # ハッシュが同じ場合、そのままスルー
+            # 読み込みオプションが前回読み込み時と違う場合、ファイルが同じでも読み込み結果は使い回さない
+            new_data_load_options = reader.get_load_options()
+            is_reusable = bool(self.data) and self.data_load_options == new_data_load_options
+
+            # 変更検知用シグネチャが前回読み込み時と同じ場合、ハッシュ値も求めずにそのままスルー
+            new_data_signature = MFileUtils.get_file_signature(file_path)
+            if is_reusable and self.data_signature == new_data_signature:
                 logger.info("%s%s 読み込み成功: %s", display_set_no, self.title, os.path.basename(file_path))
                 return True
+
+            if is_reusable:
+                # 過去データがある場合、ハッシュ値（ファイルが変わってない場合はキャッシュ）が同じなら、そのままスルー
+                new_data_digest = reader.hexdigest()
+                if new_data_digest and self.data.digest == new_data_digest:
+                    self.data_signature = new_data_signature
+                    logger.info("%s%s 読み込み成功: %s", display_set_no, self.title, os.path.basename(file_path))
+                    return True
+
+            # 過去データがないかハッシュが違う場合、読み込み（ハッシュ値は読み込みと同時に求める）
+            self.data = reader.read_data()
+            self.data_signature = new_data_signature
+            self.data_load_options = new_data_load_options
+
+            logger.info("%s%s 読み込み成功: %s", display_set_no, self.title, os.path.basename(file_path))
+            return True
         except MKilledException:
             logger.warning("読み込み処理を中断します。", decoration=MLogger.DECORATION_BOX)
         except SizingException as se:
@@ -332,6 +357,14 @@ class BaseFilePickerCtrl():
         logger.error("%s%s 読み込み失敗: %s", display_set_no, self.title, os.path.basename(file_path), decoration=MLogger.DECORATION_BOX)
         return False
 
+    # 読み込み結果を手放す（メモリマップは閉じて、次回は読み直す）
+    def close_data(self):
+        if isinstance(self.data, VmdMotion):
+            self.data.close()
+
+        self.data = None
+        self.data_signature = None
+
 
 class FileModelCtrl():
 
@@ -371,19 +404,13 @@ class FileModelCtrl():
             else:
                 file_path = self.picker.file_ctrl.GetPath()
 
-            file_name, input_ext = os.path.splitext(os.path.basename(file_path))
-
             model_name = "未設定"
-            if input_ext.lower() == ".vmd":
-                reader = VmdReader(file_path)
-            elif input_ext.lower() == ".vpd":
-                reader = VpdReader(file_path)
-            elif input_ext.lower() == ".pmx":
-                reader = PmxReader(file_path)
-            else:
+            reader = create_reader(file_path)
+            if not reader:
                 return "対象外拡張子"
             
             try:
+                # ヘッダだけ読み込んでモデル名を取得
                 model_name = reader.read_model_name()
             except Exception:
                 model_name = "取得失敗"
@@ -397,6 +424,20 @@ class FileModelCtrl():
             return "取得失敗"
 
 
+# 拡張子別に、ヘッダ取得用のリーダー生成（対象外拡張子の場合、None）
+def create_reader(file_path: str):
+    _, input_ext = os.path.splitext(os.path.basename(file_path))
+
+    if input_ext.lower() == ".vmd":
+        return VmdReader(file_path)
+    elif input_ext.lower() == ".vpd":
+        return VpdReader(file_path)
+    elif input_ext.lower() == ".pmx":
+        return PmxReader(file_path)
+
+    return None
+
+
 class MFileDropTarget(wx.FileDropTarget):
     def __init__(self, parent, is_aster):
         self.parent = parent
@@ -34,7 +34,8 @@ class ArmTwistOffWorkerThread(BaseWorkerThread):
         try:
             start = time.time()
 
-            self.result = self.frame.arm_twist_off_panel_ctrl.arm_twist_off_vmd_file_ctrl.load() and self.result
+            # 捩りOFFは腕系ボーンしか触らないので、それ以外は展開せずにメモリマップのまま保持する
+            self.result = self.frame.arm_twist_off_panel_ctrl.arm_twist_off_vmd_file_ctrl.load(is_mmap=True) and self.result
             self.result = self.frame.arm_twist_off_panel_ctrl.arm_twist_off_model_file_ctrl.load(is_check=False) and self.result
 
             if self.result:
@@ -56,6 +57,9 @@ class ArmTwistOffWorkerThread(BaseWorkerThread):
         except Exception as e:
             logger.critical("捩りOFF変換処理が意図せぬエラーで終了しました。", e, decoration=MLogger.DECORATION_BOX)
         finally:
+            # 読み込み元VMDのメモリマップを閉じる（読み込み結果は使い回さず、次回は読み直す）
+            self.frame.arm_twist_off_panel_ctrl.arm_twist_off_vmd_file_ctrl.close_data()
+
             try:
                 logger.debug("★★★result: %s, is_killed: %s", self.result, self.is_killed)
                 if self.is_out_log or (not self.result and not self.is_killed):
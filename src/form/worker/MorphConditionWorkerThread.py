@@ -33,7 +33,10 @@ class MorphConditionWorkerThread(BaseWorkerThread):
         try:
             start = time.time()
 
-            self.result = self.frame.morph_condition_panel_ctrl.morph_condition_vmd_file_ctrl.load() and self.result
+            # 条件対象のモーフだけ展開して、他は読み込み時のまま出力する
+            target_morph_names = [target_morph[0] for target_morph in self.frame.morph_condition_panel_ctrl.morph_dialog.get_morph_list()]
+            self.result = self.frame.morph_condition_panel_ctrl.morph_condition_vmd_file_ctrl.load(bone_names=[], morph_names=target_morph_names) \
+                and self.result
 
             if self.result:
                 self.options = MMorphConditionOptions(
@@ -34,7 +34,9 @@ class ParentWorkerThread(BaseWorkerThread):
         try:
             start = time.time()
 
-            self.result = self.frame.parent_panel_ctrl.parent_vmd_file_ctrl.load() and self.result
+            # 全親移植対象のボーンだけ展開して、他は読み込み時のまま出力する
+            self.result = self.frame.parent_panel_ctrl.parent_vmd_file_ctrl.load(bone_names=ConvertParentService.TARGET_BONE_NAMES, morph_names=[]) \
+                and self.result
             self.result = self.frame.parent_panel_ctrl.parent_model_file_ctrl.load(is_check=False) and self.result
 
             if self.result:
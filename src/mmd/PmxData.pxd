@@ -168,3 +168,8 @@ cdef class PmxModel:
     cdef public dict wrist_entity_vertex
     cdef public dict elbow_entity_vertex
     cdef public dict elbow_middle_entity_vertex
+    cdef public dict bone_children
+    cdef public dict bone_ancestors
+    cdef public dict bone_defined_ancestors
+    cdef public list bone_topology
+    cdef public list lazy_bone_names
@@ -4,6 +4,7 @@ import _pickle as cPickle
 from abc import ABCMeta, abstractmethod
 from collections import OrderedDict
 import math
+import threading
 import numpy as np
 
 from module.MParams import BoneLinks # noqa
@@ -14,6 +15,9 @@ from utils.MLogger import MLogger # noqa
 
 logger = MLogger(__name__, level=MLogger.DEBUG_INFO)
 
+# ボーン追加・隣接情報生成のロック（サイジング用ボーンは複数スレッドから参照された時に生成される）
+bone_lock = threading.RLock()
+
 
 cdef class Deform:
     def __init__(self, index0):
@@ -1012,6 +1016,115 @@ cdef class Capsule(OBB):
         return (collision, near_collision, x_distance, z_plus_distance, z_minus_distance, rep_x_collision_vec, rep_z_plus_collision_vec, rep_z_minus_collision_vec)
 
 
+# 複数の点と複数の剛体の衝突判定をまとめて行う
+# obbs: OBB（Sphere, Box, Capsule）のリスト（M件）
+# points: 判定対象の点（N×3）
+# 戻り値: 衝突しているか（N×M）、近くにあるか（N×M）、衝突している点を剛体の外まで押し出すベクトル（N×M×3）
+def get_collisions(obbs: list, points, base_size=1.0):
+    # get_collistion と同じく、比率はfloat精度で持つ
+    min_ratio = float(np.float32(float(np.float32(base_size)) - 0.02))
+    max_ratio = float(np.float32(float(np.float32(base_size)) + 0.02))
+
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+
+    collisions = np.zeros((len(points), len(obbs)), dtype=np.bool_)
+    near_collisions = np.zeros((len(points), len(obbs)), dtype=np.bool_)
+    penetrations = np.zeros((len(points), len(obbs), 3), dtype=np.float64)
+
+    # 形状ごとにまとめて判定する
+    for shape_class, calc_collisions in [(Sphere, calc_sphere_collisions), (Box, calc_box_collisions), (Capsule, calc_capsule_collisions)]:
+        oidxs = [oidx for oidx, obb in enumerate(obbs) if type(obb) is shape_class]
+        if len(oidxs) == 0:
+            continue
+
+        shape_collisions, shape_near_collisions, shape_penetrations = calc_collisions([obbs[oidx] for oidx in oidxs], points, min_ratio, max_ratio)
+        collisions[:, oidxs] = shape_collisions
+        near_collisions[:, oidxs] = shape_near_collisions
+        penetrations[:, oidxs] = shape_penetrations
+
+    return collisions, near_collisions, penetrations
+
+# 球剛体の衝突判定（Sphere.get_collistion と同じ判定）
+def calc_sphere_collisions(obbs: list, points, min_ratio: float, max_ratio: float):
+    origins = np.array([obb.origin.data() for obb in obbs], dtype=np.float64)
+    radiuses = np.array([obb.shape_size.x() for obb in obbs], dtype=np.float64)
+
+    # 原点との距離が半径未満なら衝突
+    return calc_radius_collisions(points[:, np.newaxis, :] - origins[np.newaxis, :, :], radiuses, min_ratio, max_ratio)
+
+# カプセル剛体の衝突判定（Capsule.get_collistion と同じ判定）
+def calc_capsule_collisions(obbs: list, points, min_ratio: float, max_ratio: float):
+    matrixes = np.array([obb.rotated_matrix.data() for obb in obbs], dtype=np.float64)
+    heights = np.array([obb.shape_size.y() for obb in obbs], dtype=np.float64)
+    radiuses = np.array([obb.shape_size.x() for obb in obbs], dtype=np.float64)
+
+    # 下辺・上辺
+    b1 = matrixes[:, :3, 3] - matrixes[:, :3, 1] * heights[:, np.newaxis]
+    t1 = matrixes[:, :3, 3] + matrixes[:, :3, 1] * heights[:, np.newaxis]
+
+    # 垂線を下ろした座標
+    v = t1 - b1
+    lensq = np.sum(v ** 2, axis=1)
+    ts = np.sum(v[np.newaxis, :, :] * (points[:, np.newaxis, :] - b1[np.newaxis, :, :]), axis=2) / np.where(lensq == 0, 1, lensq)
+    ts[:, lensq == 0] = 0
+    hs = b1[np.newaxis, :, :] + v[np.newaxis, :, :] * ts[:, :, np.newaxis]
+
+    segment_lengths = np.sqrt(lensq)[np.newaxis, :]
+    b_distances = np.linalg.norm(hs - b1[np.newaxis, :, :], axis=2)
+    t_distances = np.linalg.norm(hs - t1[np.newaxis, :, :], axis=2)
+
+    # b1側の外分点
+    is_b1 = (segment_lengths < b_distances) & (b_distances < t_distances)
+    hs = np.where(is_b1[:, :, np.newaxis], b1[np.newaxis, :, :], hs)
+    # t1側の外分点
+    is_t1 = ~is_b1 & (segment_lengths < t_distances) & (t_distances < b_distances)
+    hs = np.where(is_t1[:, :, np.newaxis], t1[np.newaxis, :, :], hs)
+
+    # カプセルの線分から半径以内なら中に入っている
+    return calc_radius_collisions(points[:, np.newaxis, :] - hs, radiuses, min_ratio, max_ratio)
+
+# 中心からの距離で衝突判定を行い、衝突している点は半径の外まで押し出す
+def calc_radius_collisions(diffs, radiuses, min_ratio: float, max_ratio: float):
+    distances = np.linalg.norm(diffs, axis=2)
+
+    collisions = (0 < distances) & (distances < radiuses[np.newaxis, :] * min_ratio)
+    near_collisions = (0 <= distances) & (distances <= radiuses[np.newaxis, :] * max_ratio)
+
+    # 中心から点への方向に、半径(max_ratio)の位置まで押し出す
+    push_lengths = np.where(collisions, radiuses[np.newaxis, :] * max_ratio - distances, 0)
+    penetrations = diffs / np.where(distances == 0, 1, distances)[:, :, np.newaxis] * push_lengths[:, :, np.newaxis]
+
+    return collisions, near_collisions, penetrations
+
+# 箱剛体の衝突判定（Box.get_collistion と同じ内外判定）
+def calc_box_collisions(obbs: list, points, min_ratio: float, max_ratio: float):
+    matrixes = np.array([obb.matrix.data() for obb in obbs], dtype=np.float64)
+    origins = np.array([obb.origin.data() for obb in obbs], dtype=np.float64)
+    shape_sizes = np.array([obb.shape_size.data() for obb in obbs], dtype=np.float64)
+
+    # 各辺の方向（M×3軸×3）と長さ（M×3軸）
+    axis_vecs = np.transpose(matrixes[:, :3, :3], (0, 2, 1)) * shape_sizes[:, :, np.newaxis] * 2
+    sizes = np.linalg.norm(axis_vecs, axis=2)
+    dirs = axis_vecs / np.where(sizes == 0, 1, sizes)[:, :, np.newaxis]
+
+    # 原点から点への各辺方向の距離（N×M×3軸）
+    dir_vecs = points[:, np.newaxis, :] - origins[np.newaxis, :, :]
+    local_lengths = np.einsum('nmj,mij->nmi', dir_vecs, dirs)
+
+    # 3方向の間に点が含まれていたら衝突あり
+    collisions = np.all(np.abs(local_lengths) * 2 < sizes[np.newaxis, :, :], axis=2)
+    near_collisions = np.all(np.abs(local_lengths) * 2 < sizes[np.newaxis, :, :] * max_ratio, axis=2)
+
+    # 一番浅い面の方向に、面の外(max_ratio)まで押し出す
+    depths = sizes[np.newaxis, :, :] * max_ratio / 2 - np.abs(local_lengths)
+    push_axises = np.argmin(depths, axis=2)
+    push_lengths = np.take_along_axis(depths, push_axises[:, :, np.newaxis], axis=2)[:, :, 0]
+    push_signs = np.where(np.take_along_axis(local_lengths, push_axises[:, :, np.newaxis], axis=2)[:, :, 0] < 0, -1, 1)
+    push_dirs = dirs[np.arange(len(obbs))[np.newaxis, :], push_axises]
+    penetrations = push_dirs * (np.where(collisions, push_lengths, 0) * push_signs)[:, :, np.newaxis]
+
+    return collisions, near_collisions, penetrations
+
 # ジョイント構造-----------------------
 class Joint:
     def __init__(self, name, english_name, joint_type, rigidbody_index_a, rigidbody_index_b, position, rotation, \
@@ -1106,6 +1219,147 @@ cdef class PmxModel:
         self.elbow_entity_vertex = {}
         # 左右ひじ手首中間頂点
         self.elbow_middle_entity_vertex = {}
+        # 子ボーンリスト（キー：親ボーンINDEX、値：子ボーンリスト）
+        self.bone_children = None
+        # 祖先ボーン名リスト（キー：ボーン名、値：自身から親を辿ったボーン名リスト）
+        self.bone_ancestors = None
+        # 準標準定義の祖先ボーン名リスト（キー：ボーン名、値：自身から親を辿ったボーン名リスト）
+        self.bone_defined_ancestors = None
+        # 親から順に並べたボーン名リスト
+        self.bone_topology = None
+        # 初めて参照された時に生成するサイジング用ボーン名リスト
+        self.lazy_bone_names = []
+    
+    # ボーン追加
+    def append_bone(self, bone: Bone):
+        with bone_lock:
+            self.bones[bone.name] = bone
+            self.bone_indexes[bone.index] = bone.name
+            # ボーン構成が変わったので隣接情報は作り直し
+            self.clear_bone_adjacency()
+
+    # ボーン隣接情報クリア
+    def clear_bone_adjacency(self):
+        self.bone_children = None
+        self.bone_ancestors = None
+        self.bone_defined_ancestors = None
+        self.bone_topology = None
+
+    # ボーン隣接情報生成
+    def build_bone_adjacency(self):
+        bone_children = {}
+        for bone in self.bones.values():
+            if bone.parent_index != bone.index:
+                # 自分自身を親にしているボーンは除く
+                bone_children.setdefault(bone.parent_index, []).append(bone)
+
+        # 祖先ボーン名リスト（親INDEXが辿れないボーン、循環しているボーンは登録しない）
+        bone_ancestors = {}
+        for bone_name in self.bones.keys():
+            path = []
+            ancestors = []
+            now_name = bone_name
+            while now_name not in bone_ancestors:
+                if now_name in path or now_name not in self.bones:
+                    path = None
+                    break
+
+                path.append(now_name)
+                parent_index = self.bones[now_name].parent_index
+                if parent_index < 0:
+                    break
+
+                if parent_index not in self.bone_indexes:
+                    path = None
+                    break
+
+                now_name = self.bone_indexes[parent_index]
+            else:
+                ancestors = bone_ancestors[now_name]
+
+            if path is None:
+                continue
+
+            # 根元側から順に登録
+            for pidx in range(len(path) - 1, -1, -1):
+                ancestors = [path[pidx]] + ancestors
+                bone_ancestors[path[pidx]] = ancestors
+
+        # 親から順に並べる（親が辿れないボーンを起点とする）
+        bone_topology = []
+        visited_names = set()
+        queue_bones = [bone for bone in self.bones.values() if bone.parent_index < 0 or bone.parent_index == bone.index or bone.parent_index not in self.bone_indexes]
+        qidx = 0
+        while qidx < len(queue_bones):
+            bone = queue_bones[qidx]
+            qidx += 1
+
+            if bone.name in visited_names:
+                continue
+
+            visited_names.add(bone.name)
+            bone_topology.append(bone.name)
+            queue_bones.extend(bone_children.get(bone.index, []))
+
+        self.bone_children = bone_children
+        self.bone_ancestors = bone_ancestors
+        self.bone_defined_ancestors = {}
+        self.bone_topology = bone_topology
+
+    # 子ボーンリスト取得
+    def get_bone_children(self, bone_index: int):
+        bone_children = self.bone_children
+        if bone_children is None:
+            with bone_lock:
+                if self.bone_children is None:
+                    self.build_bone_adjacency()
+                bone_children = self.bone_children
+
+        return bone_children.get(bone_index, [])
+
+    # 親から順に並べたボーン名リスト取得
+    def get_bone_topology(self):
+        bone_topology = self.bone_topology
+        if bone_topology is None:
+            with bone_lock:
+                if self.bone_topology is None:
+                    self.build_bone_adjacency()
+                bone_topology = self.bone_topology
+
+        return bone_topology
+
+    # 自身から親を辿ったボーン名リスト取得（辿れない場合、None）
+    def get_bone_ancestors(self, bone_name: str, is_defined: bool):
+        bone_ancestors = self.bone_ancestors
+        bone_defined_ancestors = self.bone_defined_ancestors
+        if bone_ancestors is None or bone_defined_ancestors is None:
+            with bone_lock:
+                if self.bone_ancestors is None or self.bone_defined_ancestors is None:
+                    self.build_bone_adjacency()
+                bone_ancestors = self.bone_ancestors
+                bone_defined_ancestors = self.bone_defined_ancestors
+
+        if not is_defined:
+            return bone_ancestors.get(bone_name, None)
+
+        if bone_name in bone_defined_ancestors:
+            return bone_defined_ancestors[bone_name]
+
+        ancestors = []
+        now_name = bone_name
+        while now_name:
+            if now_name in ancestors or now_name not in self.bones or now_name not in self.PARENT_BORN_PAIR:
+                # 準標準の定義で辿れない場合、None
+                ancestors = None
+                break
+
+            ancestors.append(now_name)
+            # 親子関係のボーンリストから存在する親ボーンを取得
+            now_name = next((pname for pname in self.PARENT_BORN_PAIR[now_name] if pname in self.bones), None)
+
+        bone_defined_ancestors[bone_name] = ancestors
+
+        return ancestors
     
     # ローカルX軸の取得
     def get_local_x_axis(self, bone_name: str):
@@ -1224,6 +1478,127 @@ cdef class PmxModel:
 
         return True
     
+    # 頂点から求めるサイジング用ボーン名リスト（初めて参照された時に生成する）
+    LAZY_SIZING_BONE_NAMES = ["頭頂実体", "右足底実体", "左足底実体", "右つま先実体", "左つま先実体"] \
+        + ["{0}{1}先実体".format(direction, finger_name) for direction in ["左", "右"] for finger_name in ["親指", "人指", "中指", "薬指", "小指"]]
+
+    # 未生成のサイジング用ボーンを生成（ボーン名指定なしの場合、全部）
+    def prepare_sizing_bones(self, *bone_names):
+        for bone_name in (bone_names if bone_names else list(self.lazy_bone_names)):
+            if bone_name not in self.lazy_bone_names:
+                # 遅延対象外もしくは生成済みの場合、スルー
+                continue
+
+            with bone_lock:
+                if bone_name not in self.lazy_bone_names:
+                    # 他スレッドで生成済み
+                    continue
+
+                try:
+                    if bone_name == "頭頂実体":
+                        self.create_head_top_bone()
+                    elif bone_name.endswith("足底実体"):
+                        self.create_sole_bone(bone_name[0])
+                    elif bone_name.endswith("つま先実体"):
+                        self.create_toe_bone(bone_name[0])
+                    else:
+                        self.create_finger_tail_bone(bone_name)
+                finally:
+                    # 生成し終わってから、他スレッドに生成済みとして見せる
+                    self.lazy_bone_names.remove(bone_name)
+
+    # 頭頂ボーン生成
+    def create_head_top_bone(self):
+        if "頭" not in self.bones:
+            return
+
+        head_top_vertex = self.get_head_top_vertex()
+        self.head_top_vertex = head_top_vertex
+        head_top_bone = Bone("頭頂実体", "head_top", head_top_vertex.position.copy(), self.bones["頭"].index, self.bones["頭"].layer, 0, tail_position=MVector3D(0, -1, 0), is_sizing=True)
+        head_top_bone.index = len(self.bones.keys())
+        self.append_bone(head_top_bone)
+
+    # 足底実体ボーン生成
+    def create_sole_bone(self, direction: str):
+        sole_vertex = None
+        if "{0}足先EX".format(direction) in self.bones:
+            toe_ex_bone = self.bones["{0}足先EX".format(direction)]
+            sole_vertex = Vertex(-1, MVector3D(toe_ex_bone.position.x(), 0, toe_ex_bone.position.z()), MVector3D(), MVector2D(), [], Bdef1(-1), -1)
+            parent_bone = toe_ex_bone
+        elif "{0}足ＩＫ".format(direction) in self.bones:
+            sole_vertex = self.get_sole_vertex(direction)
+            parent_bone = self.bones["{0}足ＩＫ".format(direction)]
+
+        if not sole_vertex:
+            return
+
+        if direction == "右":
+            self.right_sole_vertex = sole_vertex
+            sole_bone = Bone("右足底実体", "right sole entity", sole_vertex.position.copy(), -1, 0, 0, is_sizing=True)
+        else:
+            self.left_sole_vertex = sole_vertex
+            sole_bone = Bone("左足底実体", "left sole entity", sole_vertex.position.copy(), -1, 0, 0, is_sizing=True)
+
+        sole_bone.index = len(self.bones.keys())
+        sole_bone.parent_index = parent_bone.index
+        sole_bone.layer = parent_bone.layer
+
+        logger.debug("%s: %s, parent: %s(%s)", sole_bone.name, sole_bone.index, sole_bone.parent_index, self.bone_indexes[sole_bone.parent_index])
+
+        self.append_bone(sole_bone)
+
+    # つま先実体ボーン生成
+    def create_toe_bone(self, direction: str):
+        if "{0}足ＩＫ".format(direction) not in self.bones and "{0}つま先ＩＫ".format(direction) not in self.bones:
+            return
+
+        # 親になる足底実体を先に生成
+        self.prepare_sizing_bones("{0}足底実体".format(direction))
+
+        toe_vertex = self.get_toe_vertex(direction)
+        if not toe_vertex:
+            return
+
+        toe_pos = toe_vertex.position.copy()
+        toe_pos.setY(0)
+
+        if direction == "右":
+            self.right_toe_vertex = toe_vertex
+            toe_bone = Bone("右つま先実体", "right toe entity", toe_pos, -1, 0, 0, is_sizing=True)
+        else:
+            self.left_toe_vertex = toe_vertex
+            toe_bone = Bone("左つま先実体", "left toe entity", toe_pos, -1, 0, 0, is_sizing=True)
+
+        toe_bone.index = len(self.bones.keys())
+
+        if "{0}足底実体".format(direction) in self.bones:
+            parent_bone = self.bones["{0}足底実体".format(direction)]
+        else:
+            parent_bone = self.bones["{0}つま先ＩＫ".format(direction)]
+        toe_bone.parent_index = parent_bone.index
+        toe_bone.layer = parent_bone.layer
+
+        logger.debug("%s: %s, parent: %s(%s)", toe_bone.name, toe_bone.index, toe_bone.parent_index, self.bone_indexes[toe_bone.parent_index])
+
+        self.append_bone(toe_bone)
+
+    # 指先実体ボーン生成（指先ボーンがない場合の代替）
+    def create_finger_tail_bone(self, to_joint_name: str):
+        end_joint_name = to_joint_name.replace("先実体", "２" if "親指" in to_joint_name else "３")
+
+        if end_joint_name not in self.bones:
+            return
+
+        finger_tail_vertex = self.get_finger_tail_vertex(end_joint_name, to_joint_name)
+        if finger_tail_vertex:
+            self.finger_tail_vertex = finger_tail_vertex
+            finger_tail_pos = finger_tail_vertex.position.copy()
+            finger_tail_bone = Bone(to_joint_name, "", finger_tail_pos, -1, 0, 0, is_sizing=True)
+            finger_tail_bone.index = len(self.bones.keys())
+            finger_tail_bone.parent_index = self.bones[end_joint_name].index
+            finger_tail_bone.layer = self.bones[end_joint_name].layer
+            self.append_bone(finger_tail_bone)
+
     # ボーンリンク生成
     def create_link_2_top_lr(self, *target_bone_types, **kwargs):
         is_defined = kwargs["is_defined"] if "is_defined" in kwargs else True
@@ -1241,14 +1616,18 @@ cdef class PmxModel:
         is_defined = kwargs["is_defined"] if "is_defined" in kwargs else True
 
         for target_bone_name in target_bone_names:
+            # サイジング用ボーンが未生成の場合、ここで生成
+            self.prepare_sizing_bones(target_bone_name)
+
             links = self.create_link_2_top(target_bone_name, None, is_defined)
 
             if links and target_bone_name in links.all():
                 reversed_links = BoneLinks()
                 
                 # リンクがある場合、反転させて返す
-                for lname in reversed(links.all()):
-                    reversed_links.append(links.get(lname))
+                for lname in reversed(links.names()):
+                    # 生成したリンクのボーンは既にコピーなので、そのまま登録
+                    reversed_links.append(links.get(lname), is_copy=False)
 
                 return reversed_links
         
@@ -1260,6 +1639,14 @@ cdef class PmxModel:
         if not links:
             # まだリンクが生成されていない場合、順序保持辞書生成
             links = BoneLinks()
+
+            # 隣接情報から親までのボーン名リストが取得できる場合、そのまま登録
+            ancestors = self.get_bone_ancestors(target_bone_name, is_defined)
+            if ancestors:
+                for bone_name in ancestors:
+                    links.append(self.bones[bone_name])
+
+                return links
         
         if target_bone_name not in self.bones and target_bone_name not in self.PARENT_BORN_PAIR:
             # 開始ボーン名がなければ終了
@@ -1309,13 +1696,9 @@ cdef class PmxModel:
         if not bone_list:
             bone_list = []
         
-        child_bone_list = []
-
-        for child_bone in self.bones.values():
-            if child_bone.index != target_bone.index and child_bone.parent_index == target_bone.index:
-                # 処理対象ボーンが親INDEXに入ってる場合、処理対象
-                bone_list.append(child_bone)
-                child_bone_list.append(child_bone)
+        # 処理対象ボーンが親INDEXに入ってる場合、処理対象
+        child_bone_list = [child_bone for child_bone in self.get_bone_children(target_bone.index) if child_bone.index != target_bone.index]
+        bone_list.extend(child_bone_list)
 
         for child_bone in child_bone_list:
             self.get_child_bones(child_bone, bone_list)
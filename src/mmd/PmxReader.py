@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
 #
+import os
 import struct
-import hashlib
 import random
 import string
 
 from mmd.PmxData import PmxModel, Bone, RigidBody, Vertex, Material, Morph, DisplaySlot, RigidBody, Joint, Ik, IkLink, Bdef1, Bdef2, Bdef4, Sdef, Qdef, MaterialMorphData, UVMorphData, BoneMorphData, VertexMorphOffset, GroupMorphData # noqa
 from module.MMath import MRect, MVector2D, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
+from utils import MFileUtils
 from utils.MLogger import MLogger # noqa
 from utils.MException import SizingException, MKilledException, MParseException
 
@@ -14,12 +15,17 @@ logger = MLogger(__name__, level=1)
 
 
 class PmxReader:
+    # ヘッダ取得時に最初に読み込むバイト数
+    METADATA_READ_SIZE = 65536
+
     def __init__(self, file_path, is_check=True, is_sizing=True):
         self.file_path = file_path
         self.is_check = is_check
         self.is_sizing = is_sizing
         self.offset = 0
         self.buffer = None
+        # バッファを読む前のファイル情報（ハッシュ値キャッシュ用）
+        self.buffer_stat = None
         self.vertex_index_size = 0
         self.texture_index_size = 0
         self.material_index_size = 0
@@ -27,75 +33,108 @@ class PmxReader:
         self.morph_index_size = 0
         self.rigidbody_index_size = 0
 
+    # 読み込み結果に影響するオプション（同じファイルでもオプションが違えば読み込み結果は使い回せない）
+    def get_load_options(self):
+        return (self.is_check, self.is_sizing)
+
+    # モデル名だけ取得
     def read_model_name(self):
-        model_name = ""
+        return self.read_metadata()["model_name"]
+
+    # ヘッダ・モデル名・コメント・頂点数だけ取得（頂点以降の本体は読まない）
+    def read_metadata(self):
+        file_size = os.path.getsize(self.file_path)
+        read_size = self.METADATA_READ_SIZE
+
         with open(self.file_path, "rb") as f:
-            # PMXファイルをバイナリ読み込み
-            self.buffer = f.read()
-            # logger.test("hashlib.algorithms_available: %s", hashlib.algorithms_available)
-
-            # pmx宣言
-            signature = self.unpack(4, "4s")
-            logger.test("signature: %s (%s)", signature, self.offset)
-
-            # pmxバージョン
-            version = self.read_float()
-            logger.test("version: %s (%s)", version, self.offset)
-
-            if signature[:3] != b"PMX" or (version != 2.0 and version != 2.1):
-                # 整合性チェック
-                raise MParseException("PMX2.0/2.1形式外のデータです。signature: {0}, version: {1} ".format(signature, version))
-
-            # flag
-            flag_bytes = self.read_int(1)
-            logger.test("flag_bytes: %s (%s)", flag_bytes, self.offset)
-
-            # エンコード方式
-            text_encoding = self.read_int(1)
-            logger.test("text_encoding: %s (%s)", text_encoding, self.offset)
-            # エンコードに基づいて文字列解凍処理を定義
-            self.read_text = self.define_read_text(text_encoding)
-
-            # 追加UV数
-            extended_uv = self.read_int(1)
-            logger.test("extended_uv: %s (%s)", extended_uv, self.offset)
-
-            # 頂点Indexサイズ
-            self.vertex_index_size = self.read_int(1)
-            logger.test("vertex_index_size: %s (%s)", self.vertex_index_size, self.offset)
-            # サイズに基づいて頂点INDEX解凍処理を定義
-            self.read_vertex_index_size = self.define_read_vertex_idx(self.vertex_index_size)
-
-            # テクスチャIndexサイズ
-            self.texture_index_size = self.read_int(1)
-            logger.test("texture_index_size: %s (%s)", self.texture_index_size, self.offset)
-            self.read_texture_index_size = lambda: self.read_int(self.texture_index_size)
-
-            # 材質Indexサイズ
-            self.material_index_size = self.read_int(1)
-            logger.test("material_index_size: %s (%s)", self.material_index_size, self.offset)
-            self.read_material_index_size = lambda: self.read_int(self.material_index_size)
-
-            # ボーンIndexサイズ
-            self.bone_index_size = self.read_int(1)
-            logger.test("bone_index_size: %s (%s)", self.bone_index_size, self.offset)
-            self.read_bone_index_size = lambda: self.read_int(self.bone_index_size)
-
-            # モーフIndexサイズ
-            self.morph_index_size = self.read_int(1)
-            logger.test("morph_index_size: %s (%s)", self.morph_index_size, self.offset)
-            self.read_morph_index_size = lambda: self.read_int(self.morph_index_size)
-
-            # 剛体Indexサイズ
-            self.rigidbody_index_size = self.read_int(1)
-            logger.test("rigidbody_index_size: %s (%s)", self.rigidbody_index_size, self.offset)
-            self.read_rigidbody_index_size = lambda: self.read_int(self.rigidbody_index_size)
-
-            # モデル名（日本語）
-            model_name = self.read_text()
-            logger.test("name: %s (%s)", model_name, self.offset)
-
-        return model_name
+            while True:
+                # 先頭から決まったサイズだけ読み込む
+                f.seek(0)
+                self.buffer = f.read(read_size)
+                self.offset = 0
+
+                try:
+                    return self.parse_metadata(file_size)
+                except struct.error as e:
+                    if read_size >= file_size:
+                        # ファイル全体を読んでも足りない場合、壊れている
+                        raise MParseException("PMXヘッダの読み込みに失敗しました。: {0}".format(e))
+
+                    # コメントが長くて足りなかった場合、読み込みサイズを増やして再読み込み
+                    read_size *= 4
+
+    # 読み込み済みのバッファからヘッダ情報を解析する
+    def parse_metadata(self, file_size: int):
+        # pmx宣言
+        signature = self.unpack(4, "4s")
+        logger.test("signature: %s (%s)", signature, self.offset)
+
+        # pmxバージョン
+        version = self.read_float()
+        logger.test("version: %s (%s)", version, self.offset)
+
+        if signature[:3] != b"PMX" or (version != 2.0 and version != 2.1):
+            # 整合性チェック
+            raise MParseException("PMX2.0/2.1形式外のデータです。signature: {0}, version: {1} ".format(signature, version))
+
+        # flag
+        flag_bytes = self.read_int(1)
+        logger.test("flag_bytes: %s (%s)", flag_bytes, self.offset)
+
+        # エンコード方式
+        text_encoding = self.read_int(1)
+        logger.test("text_encoding: %s (%s)", text_encoding, self.offset)
+        # エンコードに基づいて文字列解凍処理を定義
+        self.read_text = self.define_read_text(text_encoding)
+
+        # 追加UV数
+        extended_uv = self.read_int(1)
+        logger.test("extended_uv: %s (%s)", extended_uv, self.offset)
+
+        # 頂点Indexサイズ
+        self.vertex_index_size = self.read_int(1)
+        logger.test("vertex_index_size: %s (%s)", self.vertex_index_size, self.offset)
+        # サイズに基づいて頂点INDEX解凍処理を定義
+        self.read_vertex_index_size = self.define_read_vertex_idx(self.vertex_index_size)
+
+        # テクスチャIndexサイズ
+        self.texture_index_size = self.read_int(1)
+        logger.test("texture_index_size: %s (%s)", self.texture_index_size, self.offset)
+        self.read_texture_index_size = lambda: self.read_int(self.texture_index_size)
+
+        # 材質Indexサイズ
+        self.material_index_size = self.read_int(1)
+        logger.test("material_index_size: %s (%s)", self.material_index_size, self.offset)
+        self.read_material_index_size = lambda: self.read_int(self.material_index_size)
+
+        # ボーンIndexサイズ
+        self.bone_index_size = self.read_int(1)
+        logger.test("bone_index_size: %s (%s)", self.bone_index_size, self.offset)
+        self.read_bone_index_size = lambda: self.read_int(self.bone_index_size)
+
+        # モーフIndexサイズ
+        self.morph_index_size = self.read_int(1)
+        logger.test("morph_index_size: %s (%s)", self.morph_index_size, self.offset)
+        self.read_morph_index_size = lambda: self.read_int(self.morph_index_size)
+
+        # 剛体Indexサイズ
+        self.rigidbody_index_size = self.read_int(1)
+        logger.test("rigidbody_index_size: %s (%s)", self.rigidbody_index_size, self.offset)
+        self.read_rigidbody_index_size = lambda: self.read_int(self.rigidbody_index_size)
+
+        metadata = {"signature": signature, "version": version, "text_encoding": text_encoding, "extended_uv": extended_uv, "file_size": file_size}
+
+        # モデル名・コメント
+        metadata["model_name"] = self.read_text()
+        metadata["english_model_name"] = self.read_text()
+        metadata["comment"] = self.read_text()
+        metadata["english_comment"] = self.read_text()
+
+        # 頂点数
+        metadata["vertex_cnt"] = self.read_int(4)
+        logger.test("metadata: %s", metadata)
+
+        return metadata
 
     def read_data(self):
         # Pmxモデル生成
@@ -105,6 +144,7 @@ class PmxReader:
         try:
             # PMXファイルをバイナリ読み込み
             with open(self.file_path, "rb") as f:
+                self.buffer_stat = os.fstat(f.fileno())
                 self.buffer = f.read()
                 # logger.test("hashlib.algorithms_available: %s", hashlib.algorithms_available)
 
@@ -292,8 +332,7 @@ class PmxReader:
                     sizing_root_bone = Bone("SIZING_ROOT_BONE", "SIZING_ROOT_BONE", MVector3D(), -1, 0, 0, is_sizing=True)
                     sizing_root_bone.index = -1
                     sizing_root_bone.is_sizing = True
-                    pmx.bones[sizing_root_bone.name] = sizing_root_bone
-                    pmx.bone_indexes[sizing_root_bone.index] = sizing_root_bone.name
+                    pmx.append_bone(sizing_root_bone)
 
                 # ボーンデータリスト
                 for bone_idx in range(self.read_int(4)):
@@ -369,108 +408,8 @@ class PmxReader:
                 
                 if self.is_sizing:
                     # サイジング用ボーン ---------
-                    if "頭" in pmx.bones:
-                        # 頭頂ボーン
-                        head_top_vertex = pmx.get_head_top_vertex()
-                        pmx.head_top_vertex = head_top_vertex
-                        head_top_bone = Bone("頭頂実体", "head_top", head_top_vertex.position.copy(), pmx.bones["頭"].index, pmx.bones["頭"].layer, 0, tail_position=MVector3D(0, -1, 0), is_sizing=True)
-                        head_top_bone.index = len(pmx.bones.keys())
-                        pmx.bones[head_top_bone.name] = head_top_bone
-                        pmx.bone_indexes[head_top_bone.index] = head_top_bone.name
-
-                    if "右足先EX" in pmx.bones or "右足ＩＫ" in pmx.bones:
-                        # 右足底実体ボーン
-                        right_sole_vertex = None
-                        if "右足先EX" in pmx.bones:
-                            right_sole_vertex = Vertex(-1, MVector3D(pmx.bones["右足先EX"].position.x(), 0, pmx.bones["右足先EX"].position.z()), MVector3D(), MVector2D(), [], Bdef1(-1), -1)
-                        elif "右足ＩＫ" in pmx.bones:
-                            right_sole_vertex = pmx.get_sole_vertex("右")
-                        
-                        if right_sole_vertex:
-                            pmx.right_sole_vertex = right_sole_vertex
-                            right_sole_bone = Bone("右足底実体", "right sole entity", right_sole_vertex.position.copy(), -1, 0, 0, is_sizing=True)
-                            right_sole_bone.index = len(pmx.bones.keys())
-                            
-                            if "右足先EX" in pmx.bones:
-                                right_sole_bone.parent_index = pmx.bones["右足先EX"].index
-                                right_sole_bone.layer = pmx.bones["右足先EX"].layer
-                            else:
-                                right_sole_bone.parent_index = pmx.bones["右足ＩＫ"].index
-                                right_sole_bone.layer = pmx.bones["右足ＩＫ"].layer
-                            
-                            logger.debug("右足底実体: %s, parent: %s(%s)", right_sole_bone.index, right_sole_bone.parent_index, pmx.bone_indexes[right_sole_bone.parent_index])
-
-                            pmx.bones[right_sole_bone.name] = right_sole_bone
-                            pmx.bone_indexes[right_sole_bone.index] = right_sole_bone.name
-
-                    if "左足先EX" in pmx.bones or "左足ＩＫ" in pmx.bones:
-                        # 左足底実体ボーン
-                        left_sole_vertex = None
-                        if "左足先EX" in pmx.bones:
-                            left_sole_vertex = Vertex(-1, MVector3D(pmx.bones["左足先EX"].position.x(), 0, pmx.bones["左足先EX"].position.z()), MVector3D(), MVector2D(), [], Bdef1(-1), -1)
-                        elif "左足ＩＫ" in pmx.bones:
-                            left_sole_vertex = pmx.get_sole_vertex("左")
-                        
-                        if left_sole_vertex:
-                            pmx.left_sole_vertex = left_sole_vertex
-                            left_sole_bone = Bone("左足底実体", "left sole entity", left_sole_vertex.position.copy(), -1, 0, 0, is_sizing=True)
-                            left_sole_bone.index = len(pmx.bones.keys())
-                            
-                            if "左足先EX" in pmx.bones:
-                                left_sole_bone.parent_index = pmx.bones["左足先EX"].index
-                                left_sole_bone.layer = pmx.bones["左足先EX"].layer
-                            else:
-                                left_sole_bone.parent_index = pmx.bones["左足ＩＫ"].index
-                                left_sole_bone.layer = pmx.bones["左足ＩＫ"].layer
-
-                            logger.debug("左足底実体: %s, parent: %s(%s)", left_sole_bone.index, left_sole_bone.parent_index, pmx.bone_indexes[left_sole_bone.parent_index])
-
-                            pmx.bones[left_sole_bone.name] = left_sole_bone
-                            pmx.bone_indexes[left_sole_bone.index] = left_sole_bone.name
-
-                    if "右足ＩＫ" in pmx.bones or "右つま先ＩＫ" in pmx.bones:
-                        # 右つま先ボーン
-                        right_toe_vertex = pmx.get_toe_vertex("右")
-                        if right_toe_vertex:
-                            pmx.right_toe_vertex = right_toe_vertex
-                            right_toe_pos = right_toe_vertex.position.copy()
-                            right_toe_pos.setY(0)
-                            right_toe_bone = Bone("右つま先実体", "right toe entity", right_toe_pos, -1, 0, 0, is_sizing=True)
-                            right_toe_bone.index = len(pmx.bones.keys())
-
-                            if "右足底実体" in pmx.bones:
-                                right_toe_bone.parent_index = pmx.bones["右足底実体"].index
-                                right_toe_bone.layer = pmx.bones["右足底実体"].layer
-                            else:
-                                right_toe_bone.parent_index = pmx.bones["右つま先ＩＫ"].index
-                                right_toe_bone.layer = pmx.bones["右つま先ＩＫ"].layer
-
-                            logger.debug("右つま先実体: %s, parent: %s(%s)", right_toe_bone.index, right_toe_bone.parent_index, pmx.bone_indexes[right_toe_bone.parent_index])
-
-                            pmx.bones[right_toe_bone.name] = right_toe_bone
-                            pmx.bone_indexes[right_toe_bone.index] = right_toe_bone.name
-
-                    if "左足ＩＫ" in pmx.bones or "左つま先ＩＫ" in pmx.bones:
-                        # 左つま先ボーン
-                        left_toe_vertex = pmx.get_toe_vertex("左")
-                        if left_toe_vertex:
-                            pmx.left_toe_vertex = left_toe_vertex
-                            left_toe_pos = left_toe_vertex.position.copy()
-                            left_toe_pos.setY(0)
-                            left_toe_bone = Bone("左つま先実体", "left toe entity", left_toe_pos, -1, 0, 0, is_sizing=True)
-                            left_toe_bone.index = len(pmx.bones.keys())
-
-                            if "左足底実体" in pmx.bones:
-                                left_toe_bone.parent_index = pmx.bones["左足底実体"].index
-                                left_toe_bone.layer = pmx.bones["左足底実体"].layer
-                            else:
-                                left_toe_bone.parent_index = pmx.bones["左つま先ＩＫ"].index
-                                left_toe_bone.layer = pmx.bones["左つま先ＩＫ"].layer
-
-                            logger.debug("左つま先実体: %s, parent: %s(%s)", left_toe_bone.index, left_toe_bone.parent_index, pmx.bone_indexes[left_toe_bone.parent_index])
-
-                            pmx.bones[left_toe_bone.name] = left_toe_bone
-                            pmx.bone_indexes[left_toe_bone.index] = left_toe_bone.name
+                    # 頂点から求めるボーン（頭頂・足底・つま先・指先実体）は、初めて参照された時に生成する
+                    pmx.lazy_bone_names = list(PmxModel.LAZY_SIZING_BONE_NAMES)
 
                     # 首根元ボーン
                     if "左肩" in pmx.bones and "右肩" in pmx.bones:
@@ -489,8 +428,7 @@ class PmxReader:
                             neck_base_bone.layer = pmx.bones["上半身"].layer
 
                         neck_base_bone.index = len(pmx.bones.keys())
-                        pmx.bones[neck_base_bone.name] = neck_base_bone
-                        pmx.bone_indexes[neck_base_bone.index] = neck_base_bone.name
+                        pmx.append_bone(neck_base_bone)
                         
                         if "左肩P" in pmx.bones:
                             pmx.bones["左肩P"].parent_index = neck_base_bone.index
@@ -524,8 +462,7 @@ class PmxReader:
                             neck_base2_bone.layer = pmx.bones["上半身"].layer
 
                         neck_base2_bone.index = len(pmx.bones.keys())
-                        pmx.bones[neck_base2_bone.name] = neck_base2_bone
-                        pmx.bone_indexes[neck_base2_bone.index] = neck_base2_bone.name
+                        pmx.append_bone(neck_base2_bone)
 
                     if "右肩" in pmx.bones:
                         # 右肩下延長ボーン
@@ -533,8 +470,7 @@ class PmxReader:
                         right_shoulder_under_pos.setY(right_shoulder_under_pos.y() - 1)
                         right_shoulder_under_bone = Bone("右肩下延長", "", right_shoulder_under_pos, pmx.bones["右肩"].index, pmx.bones["右肩"].layer, 0, is_sizing=True)
                         right_shoulder_under_bone.index = len(pmx.bones.keys())
-                        pmx.bones[right_shoulder_under_bone.name] = right_shoulder_under_bone
-                        pmx.bone_indexes[right_shoulder_under_bone.index] = right_shoulder_under_bone.name
+                        pmx.append_bone(right_shoulder_under_bone)
 
                     if "左肩" in pmx.bones:
                         # 左肩下延長ボーン
@@ -542,16 +478,14 @@ class PmxReader:
                         left_shoulder_under_pos.setY(left_shoulder_under_pos.y() - 1)
                         left_shoulder_under_bone = Bone("左肩下延長", "", left_shoulder_under_pos, pmx.bones["左肩"].index, pmx.bones["左肩"].layer, 0, is_sizing=True)
                         left_shoulder_under_bone.index = len(pmx.bones.keys())
-                        pmx.bones[left_shoulder_under_bone.name] = left_shoulder_under_bone
-                        pmx.bone_indexes[left_shoulder_under_bone.index] = left_shoulder_under_bone.name
+                        pmx.append_bone(left_shoulder_under_bone)
 
                     if "右ひじ" in pmx.bones and "右腕" in pmx.bones:
                         # 右腕ひじ中間ボーン
                         right_arm_middle_pos = (pmx.bones["右ひじ"].position + pmx.bones["右腕"].position) / 2
                         right_arm_middle_bone = Bone("右腕ひじ中間", "", right_arm_middle_pos, -1, 0, 0, is_sizing=True)
                         right_arm_middle_bone.index = len(pmx.bones.keys())
-                        pmx.bones[right_arm_middle_bone.name] = right_arm_middle_bone
-                        pmx.bone_indexes[right_arm_middle_bone.index] = right_arm_middle_bone.name
+                        pmx.append_bone(right_arm_middle_bone)
 
                         if "右腕捩" in pmx.bones:
                             right_arm_middle_bone.parent_index = pmx.bones["右腕捩"].index
@@ -568,8 +502,7 @@ class PmxReader:
                         left_arm_middle_pos = (pmx.bones["左ひじ"].position + pmx.bones["左腕"].position) / 2
                         left_arm_middle_bone = Bone("左腕ひじ中間", "", left_arm_middle_pos, -1, 0, 0, is_sizing=True)
                         left_arm_middle_bone.index = len(pmx.bones.keys())
-                        pmx.bones[left_arm_middle_bone.name] = left_arm_middle_bone
-                        pmx.bone_indexes[left_arm_middle_bone.index] = left_arm_middle_bone.name
+                        pmx.append_bone(left_arm_middle_bone)
 
                         if "左腕捩" in pmx.bones:
                             left_arm_middle_bone.parent_index = pmx.bones["左腕捩"].index
@@ -586,8 +519,7 @@ class PmxReader:
                         right_elbow_middle_pos = (pmx.bones["右ひじ"].position + pmx.bones["右手首"].position) / 2
                         right_elbow_middle_bone = Bone("右ひじ手首中間", "", right_elbow_middle_pos, -1, 0, 0, is_sizing=True)
                         right_elbow_middle_bone.index = len(pmx.bones.keys())
-                        pmx.bones[right_elbow_middle_bone.name] = right_elbow_middle_bone
-                        pmx.bone_indexes[right_elbow_middle_bone.index] = right_elbow_middle_bone.name
+                        pmx.append_bone(right_elbow_middle_bone)
 
                         if "右手捩" in pmx.bones:
                             right_elbow_middle_bone.parent_index = pmx.bones["右手捩"].index
@@ -603,8 +535,7 @@ class PmxReader:
                         left_elbow_middle_pos = (pmx.bones["左ひじ"].position + pmx.bones["左手首"].position) / 2
                         left_elbow_middle_bone = Bone("左ひじ手首中間", "", left_elbow_middle_pos, -1, 0, 0, is_sizing=True)
                         left_elbow_middle_bone.index = len(pmx.bones.keys())
-                        pmx.bones[left_elbow_middle_bone.name] = left_elbow_middle_bone
-                        pmx.bone_indexes[left_elbow_middle_bone.index] = left_elbow_middle_bone.name
+                        pmx.append_bone(left_elbow_middle_bone)
 
                         if "左手捩" in pmx.bones:
                             left_elbow_middle_bone.parent_index = pmx.bones["左手捩"].index
@@ -621,14 +552,12 @@ class PmxReader:
                         right_big_toe_bone = Bone("右足親指", "", pmx.bones[toe_bone_name].position + MVector3D(0.5, 0, 0), -1, 0, 0, is_sizing=True)
                         right_big_toe_bone.parent_index = pmx.bones[toe_bone_name].index
                         right_big_toe_bone.index = len(pmx.bones.keys())
-                        pmx.bones[right_big_toe_bone.name] = right_big_toe_bone
-                        pmx.bone_indexes[right_big_toe_bone.index] = right_big_toe_bone.name
+                        pmx.append_bone(right_big_toe_bone)
 
                         right_small_toe_bone = Bone("右足小指", "", pmx.bones[toe_bone_name].position + MVector3D(-0.5, 0, 0), -1, 0, 0, is_sizing=True)
                         right_small_toe_bone.parent_index = pmx.bones[toe_bone_name].index
                         right_small_toe_bone.index = len(pmx.bones.keys())
-                        pmx.bones[right_small_toe_bone.name] = right_small_toe_bone
-                        pmx.bone_indexes[right_small_toe_bone.index] = right_small_toe_bone.name
+                        pmx.append_bone(right_small_toe_bone)
 
                     if "右足首" in pmx.bones:
                         right_heel_bone = Bone("右かかと", "", MVector3D(pmx.bones["右足首"].position.x(), 0, pmx.bones["右足首"].position.z()), -1, 0, 0, is_sizing=True)
@@ -639,8 +568,7 @@ class PmxReader:
                             right_heel_bone.parent_index = pmx.bones["右足首"].index
                             right_heel_bone.layer = pmx.bones["右足首"].layer
                         right_heel_bone.index = len(pmx.bones.keys())
-                        pmx.bones[right_heel_bone.name] = right_heel_bone
-                        pmx.bone_indexes[right_heel_bone.index] = right_heel_bone.name
+                        pmx.append_bone(right_heel_bone)
 
                     if "左つま先" in pmx.bones or "左つま先ＩＫ" in pmx.bones:
                         toe_bone_name = "左つま先" if "左つま先" in pmx.bones else pmx.bone_indexes[pmx.bones["左つま先ＩＫ"].ik.target_index]
@@ -649,14 +577,12 @@ class PmxReader:
                         left_big_toe_bone.parent_index = pmx.bones[toe_bone_name].index
                         left_big_toe_bone.layer = pmx.bones[toe_bone_name].layer
                         left_big_toe_bone.index = len(pmx.bones.keys())
-                        pmx.bones[left_big_toe_bone.name] = left_big_toe_bone
-                        pmx.bone_indexes[left_big_toe_bone.index] = left_big_toe_bone.name
+                        pmx.append_bone(left_big_toe_bone)
 
                         left_small_toe_bone = Bone("左足小指", "", pmx.bones[toe_bone_name].position + MVector3D(-0.5, 0, 0), -1, 0, 0, is_sizing=True)
                         left_small_toe_bone.parent_index = pmx.bones[toe_bone_name].index
                         left_small_toe_bone.index = len(pmx.bones.keys())
-                        pmx.bones[left_small_toe_bone.name] = left_small_toe_bone
-                        pmx.bone_indexes[left_small_toe_bone.index] = left_small_toe_bone.name
+                        pmx.append_bone(left_small_toe_bone)
 
                     if "左足首" in pmx.bones:
                         left_heel_bone = Bone("左かかと", "", MVector3D(pmx.bones["左足首"].position.x(), 0, pmx.bones["左足首"].position.z()), -1, 0, 0, is_sizing=True)
@@ -667,29 +593,7 @@ class PmxReader:
                             left_heel_bone.parent_index = pmx.bones["左足首"].index
                             left_heel_bone.layer = pmx.bones["左足首"].layer
                         left_heel_bone.index = len(pmx.bones.keys())
-                        pmx.bones[left_heel_bone.name] = left_heel_bone
-                        pmx.bone_indexes[left_heel_bone.index] = left_heel_bone.name
-
-                    # 指先ボーンがない場合、代替で挿入
-                    for direction in ["左", "右"]:
-                        for (finger_name, end_joint_name) in [("親指", "２"), ("人指", "３"), ("中指", "３"), ("薬指", "３"), ("小指", "３")]:
-                            end_joint_name = "{0}{1}{2}".format(direction, finger_name, end_joint_name)
-
-                            if end_joint_name not in pmx.bones:
-                                continue
-
-                            to_joint_name = "{0}{1}{2}".format(direction, finger_name, "先実体")
-
-                            finger_tail_vertex = pmx.get_finger_tail_vertex(end_joint_name, to_joint_name)
-                            if finger_tail_vertex:
-                                pmx.finger_tail_vertex = finger_tail_vertex
-                                finger_tail_pos = finger_tail_vertex.position.copy()
-                                finger_tail_bone = Bone(to_joint_name, "", finger_tail_pos, -1, 0, 0, is_sizing=True)
-                                finger_tail_bone.index = len(pmx.bones.keys())
-                                finger_tail_bone.parent_index = pmx.bones[end_joint_name].index
-                                finger_tail_bone.layer = pmx.bones[end_joint_name].layer
-                                pmx.bones[finger_tail_bone.name] = finger_tail_bone
-                                pmx.bone_indexes[finger_tail_bone.index] = finger_tail_bone.name
+                        pmx.append_bone(left_heel_bone)
 
                     # 足中間ボーン
                     if "左足" in pmx.bones and "右足" in pmx.bones:
@@ -703,8 +607,7 @@ class PmxReader:
                             leg_center_bone.layer = pmx.bones["下半身"].layer
 
                         leg_center_bone.index = len(pmx.bones.keys())
-                        pmx.bones[leg_center_bone.name] = leg_center_bone
-                        pmx.bone_indexes[leg_center_bone.index] = leg_center_bone.name
+                        pmx.append_bone(leg_center_bone)
                     
                     # # ボーンの並び替え
                     # tmp_bones = {}
@@ -909,8 +812,8 @@ class PmxReader:
 
                 logger.info("-- PMX ジョイント読み込み完了")
 
-            # ハッシュを設定
-            pmx.digest = self.hexdigest()
+            # ハッシュを設定（読み込んだバッファから求める）
+            pmx.digest = self.hexdigest(self.buffer, self.buffer_stat)
             logger.test("pmx: %s, hash: %s", pmx.name, pmx.digest)
 
             if self.is_check:
@@ -965,19 +868,9 @@ class PmxReader:
         else:
             return index, pmx.bones[tmp_bone_indexes[parent_index]].index
 
-    def hexdigest(self):
-        sha1 = hashlib.sha1()
-
-        with open(self.file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(2048 * sha1.block_size), b''):
-                sha1.update(chunk)
-
-        sha1.update(chunk)
-
-        # ファイルパスをハッシュに含める
-        sha1.update(self.file_path.encode('utf-8'))
-
-        return sha1.hexdigest()
+    # ハッシュ値取得（読み込み済みのバッファがある場合、ファイルを読み直さずにそこから求める）
+    def hexdigest(self, buffer=None, buffer_stat=None):
+        return MFileUtils.calc_file_digest(self.file_path, buffer, buffer_stat)
 
     def calc_bone_length(self, bones, bone_indexes):
         for k, v in bones.items():
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 #
 import struct
+import numpy as np
 from mmd.PmxData import PmxModel, Bone, RigidBody, Vertex, Material, Morph, DisplaySlot, RigidBody, Joint, Ik, IkLink, Bdef1, Bdef2, Bdef4, Sdef, Qdef, VertexMorphOffset, GroupMorphData, BoneMorphData, UVMorphData, MaterialMorphData    # noqa
 from module.MMath import MVector3D # noqa
 from utils.MLogger import MLogger # noqa
@@ -18,6 +19,12 @@ TYPE_UNSIGNED_INT = '<I'
 TYPE_LONG = '<l'
 TYPE_UNSIGNED_LONG = '<L'
 
+# structの型とnumpyの型の対応
+NUMPY_TYPES = {TYPE_FLOAT: '<f4', TYPE_BYTE: 'i1', TYPE_UNSIGNED_BYTE: 'u1', TYPE_SHORT: '<i2', TYPE_UNSIGNED_SHORT: '<u2', TYPE_INT: '<i4', TYPE_UNSIGNED_INT: '<u4'}
+
+# 一度に出力する頂点数
+VERTEX_CHUNK_SIZE = 10000
+
 
 class PmxWriter:
     def __init__(self):
@@ -65,65 +72,7 @@ class PmxWriter:
             fout.write(struct.pack(TYPE_INT, len(pmx.vertex_dict.keys())))
 
             # 頂点データ
-            for vidx, vertex in enumerate(pmx.vertex_dict.values()):
-                # position
-                fout.write(struct.pack(TYPE_FLOAT, float(vertex.position.x())))
-                fout.write(struct.pack(TYPE_FLOAT, float(vertex.position.y())))
-                fout.write(struct.pack(TYPE_FLOAT, float(vertex.position.z())))
-                # normal
-                fout.write(struct.pack(TYPE_FLOAT, float(vertex.normal.x())))
-                fout.write(struct.pack(TYPE_FLOAT, float(vertex.normal.y())))
-                fout.write(struct.pack(TYPE_FLOAT, float(vertex.normal.z())))
-                # uv
-                fout.write(struct.pack(TYPE_FLOAT, float(vertex.uv.x())))
-                fout.write(struct.pack(TYPE_FLOAT, float(vertex.uv.y())))
-                # 追加uv
-                for uv in vertex.extended_uvs:
-                    fout.write(struct.pack(TYPE_FLOAT, float(uv.x())))
-                    fout.write(struct.pack(TYPE_FLOAT, float(uv.y())))
-                    fout.write(struct.pack(TYPE_FLOAT, float(uv.z())))
-                    fout.write(struct.pack(TYPE_FLOAT, float(uv.w())))
-
-                # deform
-                if type(vertex.deform) is Bdef1:
-                    fout.write(struct.pack(TYPE_BYTE, 0))
-                    fout.write(struct.pack(bone_idx_type, int(vertex.deform.index0)))
-                elif type(vertex.deform) is Bdef2:
-                    fout.write(struct.pack(TYPE_BYTE, 1))
-                    fout.write(struct.pack(bone_idx_type, int(vertex.deform.index0)))
-                    fout.write(struct.pack(bone_idx_type, int(vertex.deform.index1)))
-                    fout.write(struct.pack(TYPE_FLOAT, vertex.deform.weight0))
-                elif type(vertex.deform) is Bdef4:
-                    fout.write(struct.pack(TYPE_BYTE, 2))
-                    fout.write(struct.pack(bone_idx_type, int(vertex.deform.index0)))
-                    fout.write(struct.pack(bone_idx_type, int(vertex.deform.index1)))
-                    fout.write(struct.pack(bone_idx_type, int(vertex.deform.index2)))
-                    fout.write(struct.pack(bone_idx_type, int(vertex.deform.index3)))
-                    fout.write(struct.pack(TYPE_FLOAT, vertex.deform.weight0))
-                    fout.write(struct.pack(TYPE_FLOAT, vertex.deform.weight1))
-                    fout.write(struct.pack(TYPE_FLOAT, vertex.deform.weight2))
-                    fout.write(struct.pack(TYPE_FLOAT, vertex.deform.weight3))
-                elif type(vertex.deform) is Sdef:
-                    fout.write(struct.pack(TYPE_BYTE, 3))
-                    fout.write(struct.pack(bone_idx_type, int(vertex.deform.index0)))
-                    fout.write(struct.pack(bone_idx_type, int(vertex.deform.index1)))
-                    fout.write(struct.pack(TYPE_FLOAT, vertex.deform.weight0))
-                    fout.write(struct.pack(TYPE_FLOAT, float(vertex.deform.sdef_c.x())))
-                    fout.write(struct.pack(TYPE_FLOAT, float(vertex.deform.sdef_c.y())))
-                    fout.write(struct.pack(TYPE_FLOAT, float(vertex.deform.sdef_c.z())))
-                    fout.write(struct.pack(TYPE_FLOAT, float(vertex.deform.sdef_r0.x())))
-                    fout.write(struct.pack(TYPE_FLOAT, float(vertex.deform.sdef_r0.y())))
-                    fout.write(struct.pack(TYPE_FLOAT, float(vertex.deform.sdef_r0.z())))
-                    fout.write(struct.pack(TYPE_FLOAT, float(vertex.deform.sdef_r1.x())))
-                    fout.write(struct.pack(TYPE_FLOAT, float(vertex.deform.sdef_r1.y())))
-                    fout.write(struct.pack(TYPE_FLOAT, float(vertex.deform.sdef_r1.z())))
-                else:
-                    logger.error("頂点deformなし: %s", vertex)
-
-                fout.write(struct.pack(TYPE_FLOAT, float(vertex.edge_factor)))
-
-                if vidx > 0 and vidx % 50000 == 0:
-                    logger.debug(f"-- 頂点データ出力終了({round(vidx / len(pmx.vertex_dict.keys()) * 100, 2)}％)")
+            self.write_vertices(fout, pmx, bone_idx_type)
 
             logger.debug(f"-- 頂点データ出力終了({len(pmx.vertex_dict.keys())})")
 
@@ -131,9 +80,7 @@ class PmxWriter:
             fout.write(struct.pack(TYPE_INT, len(pmx.indices) * 3))
 
             # 面データ
-            for iidx, index_list in pmx.indices.items():
-                for index in index_list:
-                    fout.write(struct.pack(vertex_idx_type, index))
+            self.write_indices(fout, pmx, vertex_idx_type)
 
             logger.debug(f"-- 面データ出力終了({len(pmx.indices)})")
 
@@ -292,66 +239,7 @@ class PmxWriter:
                 # モーフのオフセット数 : 後続の要素数
                 fout.write(struct.pack(TYPE_INT, len(morph.offsets)))
 
-                for offset in morph.offsets:
-                    if type(offset) is VertexMorphOffset:
-                        # 頂点モーフ
-                        fout.write(struct.pack(vertex_idx_type, offset.vertex_index))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.position_offset.x())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.position_offset.y())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.position_offset.z())))
-                    elif type(offset) is UVMorphData:
-                        # UVモーフ
-                        fout.write(struct.pack(vertex_idx_type, offset.vertex_index))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.uv.x())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.uv.y())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.uv.z())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.uv.w())))
-                    elif type(offset) is BoneMorphData:
-                        # ボーンモーフ
-                        fout.write(struct.pack(bone_idx_type, offset.bone_index))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.position.x())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.position.y())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.position.z())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.rotation.x())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.rotation.y())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.rotation.z())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.rotation.scalar())))
-                    elif type(offset) is MaterialMorphData:
-                        # 材質モーフ
-                        fout.write(struct.pack(material_idx_type, offset.material_index))
-                        fout.write(struct.pack(TYPE_BYTE, int(offset.calc_mode)))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.diffuse.x())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.diffuse.y())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.diffuse.z())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.diffuse.w())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.specular.x())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.specular.y())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.specular.z())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.specular_factor)))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.ambient.x())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.ambient.y())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.ambient.z())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.edge_color.x())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.edge_color.y())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.edge_color.z())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.edge_color.w())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.edge_size)))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.texture_factor.x())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.texture_factor.y())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.texture_factor.z())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.texture_factor.w())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.sphere_texture_factor.x())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.sphere_texture_factor.y())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.sphere_texture_factor.z())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.sphere_texture_factor.w())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.toon_texture_factor.x())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.toon_texture_factor.y())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.toon_texture_factor.z())))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.toon_texture_factor.w())))
-                    elif type(offset) is GroupMorphData:
-                        # グループモーフ
-                        fout.write(struct.pack(morph_idx_type, offset.morph_index))
-                        fout.write(struct.pack(TYPE_FLOAT, float(offset.value)))
+                self.write_morph_offsets(fout, morph.offsets, vertex_idx_type, bone_idx_type, material_idx_type, morph_idx_type)
 
             logger.debug(f"-- モーフデータ出力終了({len(list(pmx.morphs.values()))})")
 
@@ -469,6 +357,185 @@ class PmxWriter:
 
             logger.debug(f"-- ジョイントデータ出力終了({len(list(pmx.joints.values()))})")
             
+    # 頂点データを、deform種類ごとの構造化配列にまとめて一括で出力する
+    def write_vertices(self, fout, pmx: PmxModel, bone_idx_type: str):
+        vertices = list(pmx.vertex_dict.values())
+        bone_dtype = NUMPY_TYPES[bone_idx_type]
+
+        for start_vidx in range(0, len(vertices), VERTEX_CHUNK_SIZE):
+            chunk_vertices = vertices[start_vidx:(start_vidx + VERTEX_CHUNK_SIZE)]
+
+            # deform種類と追加UV数が同じ頂点ごとにまとめる
+            vertex_groups = {}
+            for cidx, vertex in enumerate(chunk_vertices):
+                deform_type = type(vertex.deform) if type(vertex.deform) in [Bdef1, Bdef2, Bdef4, Sdef] else None
+                if deform_type is None:
+                    logger.error("頂点deformなし: %s", vertex)
+                vertex_groups.setdefault((deform_type, len(vertex.extended_uvs)), []).append(cidx)
+
+            group_records = {}
+            record_sizes = np.zeros(len(chunk_vertices), dtype=np.int64)
+            for (deform_type, extended_uv_cnt), cidxs in vertex_groups.items():
+                records = self.create_vertex_records([chunk_vertices[cidx] for cidx in cidxs], deform_type, extended_uv_cnt, bone_dtype)
+                group_records[(deform_type, extended_uv_cnt)] = records
+                record_sizes[cidxs] = records.dtype.itemsize
+
+            # 元の頂点順に並ぶよう、各頂点のバイト列を出力位置に配置する
+            record_offsets = np.concatenate([[0], np.cumsum(record_sizes)[:-1]])
+            chunk_buffer = np.zeros(int(np.sum(record_sizes)), dtype=np.uint8)
+            for group_key, cidxs in vertex_groups.items():
+                records = group_records[group_key]
+                chunk_buffer[record_offsets[cidxs][:, np.newaxis] + np.arange(records.dtype.itemsize)] = records.view(np.uint8).reshape(len(cidxs), -1)
+
+            fout.write(chunk_buffer.tobytes())
+
+            if start_vidx > 0:
+                logger.debug(f"-- 頂点データ出力終了({round(start_vidx / len(vertices) * 100, 2)}％)")
+
+    # 面データを一括で出力する
+    def write_indices(self, fout, pmx: PmxModel, vertex_idx_type: str):
+        fout.write(np.array([index for index_list in pmx.indices.values() for index in index_list], dtype=NUMPY_TYPES[vertex_idx_type]).tobytes())
+
+    # 同じdeform種類の頂点を、出力形式そのままの構造化配列にする
+    def create_vertex_records(self, vertices: list, deform_type, extended_uv_cnt: int, bone_dtype: str):
+        # 位置・法線・UV・追加UV
+        fields = [('values', '<f4', (8 + 4 * extended_uv_cnt,))]
+        if deform_type is Bdef1:
+            fields.extend([('deform_type', 'i1'), ('deform_indexes', bone_dtype, (1,))])
+        elif deform_type is Bdef2:
+            fields.extend([('deform_type', 'i1'), ('deform_indexes', bone_dtype, (2,)), ('deform_values', '<f4', (1,))])
+        elif deform_type is Bdef4:
+            fields.extend([('deform_type', 'i1'), ('deform_indexes', bone_dtype, (4,)), ('deform_values', '<f4', (4,))])
+        elif deform_type is Sdef:
+            fields.extend([('deform_type', 'i1'), ('deform_indexes', bone_dtype, (2,)), ('deform_values', '<f4', (10,))])
+        fields.append(('edge_factor', '<f4'))
+
+        records = np.zeros(len(vertices), dtype=np.dtype(fields))
+        records['values'] = np.array([[vertex.position.x(), vertex.position.y(), vertex.position.z(), \
+                                       vertex.normal.x(), vertex.normal.y(), vertex.normal.z(), vertex.uv.x(), vertex.uv.y()] \
+                                      + [v for uv in vertex.extended_uvs for v in (uv.x(), uv.y(), uv.z(), uv.w())] for vertex in vertices], dtype=np.float64)
+        records['edge_factor'] = [float(vertex.edge_factor) for vertex in vertices]
+
+        if deform_type is Bdef1:
+            records['deform_type'] = 0
+            records['deform_indexes'] = [[int(vertex.deform.index0)] for vertex in vertices]
+        elif deform_type is Bdef2:
+            records['deform_type'] = 1
+            records['deform_indexes'] = [[int(vertex.deform.index0), int(vertex.deform.index1)] for vertex in vertices]
+            records['deform_values'] = [[vertex.deform.weight0] for vertex in vertices]
+        elif deform_type is Bdef4:
+            records['deform_type'] = 2
+            records['deform_indexes'] = [[int(vertex.deform.index0), int(vertex.deform.index1), int(vertex.deform.index2), int(vertex.deform.index3)] for vertex in vertices]
+            records['deform_values'] = [[vertex.deform.weight0, vertex.deform.weight1, vertex.deform.weight2, vertex.deform.weight3] for vertex in vertices]
+        elif deform_type is Sdef:
+            records['deform_type'] = 3
+            records['deform_indexes'] = [[int(vertex.deform.index0), int(vertex.deform.index1)] for vertex in vertices]
+            records['deform_values'] = [[vertex.deform.weight0, vertex.deform.sdef_c.x(), vertex.deform.sdef_c.y(), vertex.deform.sdef_c.z(), \
+                                         vertex.deform.sdef_r0.x(), vertex.deform.sdef_r0.y(), vertex.deform.sdef_r0.z(), \
+                                         vertex.deform.sdef_r1.x(), vertex.deform.sdef_r1.y(), vertex.deform.sdef_r1.z()] for vertex in vertices]
+
+        return records
+
+    # モーフのオフセットデータ
+    # 頂点・UV・ボーン・グループのみで構成されている場合、構造化配列にまとめて一括で出力する
+    def write_morph_offsets(self, fout, offsets: list, vertex_idx_type: str, bone_idx_type: str, material_idx_type: str, morph_idx_type: str):
+        offset_types = set([type(offset) for offset in offsets])
+
+        if len(offsets) > 0 and len(offset_types) == 1:
+            offset_type = list(offset_types)[0]
+            records = None
+
+            if offset_type is VertexMorphOffset:
+                # 頂点モーフ
+                records = np.zeros(len(offsets), dtype=np.dtype([('index', NUMPY_TYPES[vertex_idx_type]), ('values', '<f4', (3,))]))
+                records['index'] = [offset.vertex_index for offset in offsets]
+                records['values'] = [[offset.position_offset.x(), offset.position_offset.y(), offset.position_offset.z()] for offset in offsets]
+            elif offset_type is UVMorphData:
+                # UVモーフ
+                records = np.zeros(len(offsets), dtype=np.dtype([('index', NUMPY_TYPES[vertex_idx_type]), ('values', '<f4', (4,))]))
+                records['index'] = [offset.vertex_index for offset in offsets]
+                records['values'] = [[offset.uv.x(), offset.uv.y(), offset.uv.z(), offset.uv.w()] for offset in offsets]
+            elif offset_type is BoneMorphData:
+                # ボーンモーフ
+                records = np.zeros(len(offsets), dtype=np.dtype([('index', NUMPY_TYPES[bone_idx_type]), ('values', '<f4', (7,))]))
+                records['index'] = [offset.bone_index for offset in offsets]
+                records['values'] = [[offset.position.x(), offset.position.y(), offset.position.z(), \
+                                      offset.rotation.x(), offset.rotation.y(), offset.rotation.z(), offset.rotation.scalar()] for offset in offsets]
+            elif offset_type is GroupMorphData:
+                # グループモーフ
+                records = np.zeros(len(offsets), dtype=np.dtype([('index', NUMPY_TYPES[morph_idx_type]), ('values', '<f4', (1,))]))
+                records['index'] = [offset.morph_index for offset in offsets]
+                records['values'] = [[float(offset.value)] for offset in offsets]
+
+            if records is not None:
+                fout.write(records.tobytes())
+                return
+
+        for offset in offsets:
+            self.write_morph_offset(fout, offset, vertex_idx_type, bone_idx_type, material_idx_type, morph_idx_type)
+
+    # モーフのオフセットデータ（1件ずつ）
+    def write_morph_offset(self, fout, offset, vertex_idx_type: str, bone_idx_type: str, material_idx_type: str, morph_idx_type: str):
+        if type(offset) is VertexMorphOffset:
+            # 頂点モーフ
+            fout.write(struct.pack(vertex_idx_type, offset.vertex_index))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.position_offset.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.position_offset.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.position_offset.z())))
+        elif type(offset) is UVMorphData:
+            # UVモーフ
+            fout.write(struct.pack(vertex_idx_type, offset.vertex_index))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.uv.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.uv.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.uv.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.uv.w())))
+        elif type(offset) is BoneMorphData:
+            # ボーンモーフ
+            fout.write(struct.pack(bone_idx_type, offset.bone_index))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.position.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.position.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.position.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.rotation.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.rotation.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.rotation.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.rotation.scalar())))
+        elif type(offset) is MaterialMorphData:
+            # 材質モーフ
+            fout.write(struct.pack(material_idx_type, offset.material_index))
+            fout.write(struct.pack(TYPE_BYTE, int(offset.calc_mode)))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.diffuse.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.diffuse.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.diffuse.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.diffuse.w())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.specular.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.specular.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.specular.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.specular_factor)))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.ambient.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.ambient.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.ambient.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.edge_color.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.edge_color.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.edge_color.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.edge_color.w())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.edge_size)))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.texture_factor.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.texture_factor.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.texture_factor.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.texture_factor.w())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.sphere_texture_factor.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.sphere_texture_factor.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.sphere_texture_factor.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.sphere_texture_factor.w())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.toon_texture_factor.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.toon_texture_factor.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.toon_texture_factor.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.toon_texture_factor.w())))
+        elif type(offset) is GroupMorphData:
+            # グループモーフ
+            fout.write(struct.pack(morph_idx_type, offset.morph_index))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.value)))
+
     def define_index_size(self, size: int):
         if 32768 <= size:
             idx_size = 4
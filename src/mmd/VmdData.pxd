@@ -25,26 +25,32 @@ cdef class OneEuroFilter:
     cdef double c__call__(self, double x, double timestamp)
 
 cdef class VmdBoneFrame:
-    cdef public str name
-    cdef public bytes bname
-    cdef public int fno
-    cdef public MVector3D position
-    cdef public MQuaternion rotation
+    cdef str name
+    cdef bytes bname
+    cdef int fno
+    cdef MVector3D position
+    cdef MQuaternion rotation
     cdef public MVector3D org_position
     cdef public MQuaternion org_rotation
-    cdef public list interpolation
+    cdef list interpolation
     cdef public list org_interpolation
-    cdef public bint key
+    cdef bint key
     cdef public bint read
     cdef public str avoidance
+    cdef dict unchanged
+
+    cdef c_change(self)
 
 cdef class VmdMorphFrame:
-    cdef public str name
-    cdef public bytes bname
-    cdef public int fno
-    cdef public float ratio
+    cdef str name
+    cdef bytes bname
+    cdef int fno
+    cdef float ratio
     cdef public bint key
     cdef public bint read
+    cdef dict unchanged
+
+    cdef c_change(self)
 
 cdef class VmdMotion:
     cdef public str path
@@ -64,6 +70,33 @@ cdef class VmdMotion:
     cdef public int ik_cnt
     cdef public list showiks
     cdef public str digest
+    cdef public object raw_buffer
+    cdef public dict raw_bones
+    cdef public dict raw_morphs
+    cdef public dict unchanged_bones
+    cdef public dict unchanged_morphs
+    cdef public object raw_sharers
+    cdef object __weakref__
+
+    cdef c_release_raw_buffer(self)
+
+    cdef c_check_raw_buffer(self)
+
+    cdef c_touch_bone(self, str bone_name)
+
+    cdef c_touch_morph(self, str morph_name)
+
+    cdef c_load_bone(self, str bone_name)
+
+    cdef c_load_morph(self, str morph_name)
+
+    cdef c_watch_bone(self, str bone_name)
+
+    cdef c_watch_morph(self, str morph_name)
+
+    cdef bint c_is_unchanged_bone(self, str bone_name)
+
+    cdef bint c_is_unchanged_morph(self, str morph_name)
 
     cdef c_regist_full_bf(self, int data_set_no, list bone_name_list, int offset, bint is_key)
 
@@ -85,8 +118,16 @@ cdef class VmdMotion:
 
     cdef c_regist_bf(self, VmdBoneFrame bf, str bone_name, int fno, bint copy_interpolation, bint key)
 
+    cdef c_regist_bfs(self, str bone_name, list fnos, object positions, object rotations)
+
+    cdef list c_calc_bfs(self, str bone_name, list fnos)
+
+    cdef VmdBoneFrame c_calc_bf_by_fnos(self, str bone_name, list frame_fnos, int fno, bint is_reset_interpolation)
+
     cdef VmdBoneFrame c_calc_bf(self, str bone_name, int fno, bint is_key, bint is_read, bint is_reset_interpolation)
 
+    cdef VmdBoneFrame c_interpolate_bf(self, str bone_name, VmdBoneFrame prev_bf, VmdBoneFrame next_bf, int fno, bint is_reset_interpolation)
+
     cdef MQuaternion calc_bf_rot(self, VmdBoneFrame prev_bf, VmdBoneFrame fill_bf, VmdBoneFrame next_bf)
 
     cdef MVector3D calc_bf_pos(self, VmdBoneFrame prev_bf, VmdBoneFrame fill_bf, VmdBoneFrame next_bf)
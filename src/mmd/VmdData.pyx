@@ -1,17 +1,22 @@
 # -*- coding: utf-8 -*-
 #
+import bisect
 import math
 import numpy as np
 cimport numpy as np
 cimport libc.math as cmath
 from libcpp cimport  list, str, int, float
+import mmap
 import struct
+import threading
+import weakref
 import _pickle as cPickle
 from libc.math cimport pi, fabs
 from math import ceil, radians, isnan, isinf
 
 from utils import MBezierUtils # noqa
 from utils.MLogger import MLogger
+from utils.MException import SizingException
 
 from module.MMath import MRect, MVector2D, MVector3D, MVector4D, MQuaternion, MMatrix4x4, get_effective_value # noqa
 
@@ -20,6 +25,36 @@ logger = MLogger(__name__, level=1)
 ctypedef np.int_t DTYPE_INT_t
 ctypedef np.float64_t DTYPE_FLOAT_t
 
+# VMDのキーフレ1件あたりのバイト数（ボーン名15byte込み）
+BONE_RECORD_SIZE = 111
+MORPH_RECORD_SIZE = 23
+
+# ボーン名を除いたキーフレ本体（フレーム番号, 位置XYZ, 回転XYZW, 補間曲線）
+BONE_FRAME_STRUCT = struct.Struct("<I3f4f64B")
+# モーフ名を除いたキーフレ本体（フレーム番号, 度数）
+MORPH_FRAME_STRUCT = struct.Struct("<If")
+
+# サイジング用ボーン（出力対象外）
+SIZING_BONE_NAMES = ["SIZING_ROOT_BONE", "頭頂", "右つま先実体", "左つま先実体", "右足底辺", "左足底辺", "右足底実体", "左足底実体", "右足ＩＫ底実体", "左足ＩＫ底実体", "右足IK親底実体", "左足IK親底実体",
+                     "首根元", "右腕下延長", "左腕下延長", "右腕垂直", "左腕垂直", "センター実体", "左腕ひじ中間", "右腕ひじ中間", "左ひじ手首中間", "右ひじ手首中間", "左手首実体", "右手首実体", "左親指先実体",
+                     "左人指先実体", "左中指先実体", "左薬指先実体", "左小指先実体", "右親指先実体", "右人指先実体", "右中指先実体", "右薬指先実体", "右小指先実体"]
+
+# 未展開キーフレの展開ロック
+raw_lock = threading.Lock()
+
+# 名前のバイト列キャッシュ（key:(名前, バイト数)）
+name_bytes_cache = {}
+
+
+# 名前をVMD用のバイト列に変換する（同じ名前は一度だけ変換して、同じオブジェクトを使い回す）
+def encode_name(str name, int size):
+    cdef tuple key = (name, size)
+
+    if key not in name_bytes_cache:
+        name_bytes_cache[key] = name.encode('cp932').decode('shift_jis').encode('shift_jis')[:size].ljust(size, b'\x00')
+
+    return name_bytes_cache[key]
+
 
 # OneEuroFilter
 # オリジナル：https://www.cristal.univ-lille.fr/~casiez/1euro/
@@ -124,10 +159,87 @@ cdef class VmdBoneFrame:
         self.read = False
         # 接触回避の方向
         self.avoidance = ""
+        # 読み込み時のまま出力する間の登録先（motion.unchanged_bones）
+        self.unchanged = None
     
+    # 読み込み時のキーフレから変更されたので、読み込み時のまま出力しない
+    cdef c_change(self):
+        if self.unchanged is not None:
+            self.unchanged.pop(self.name, None)
+            self.unchanged = None
+
+    # 出力に関わる値は、Pythonから変更された時点で変更済みとする
+    # 位置・回転・補間曲線は中身を直接書き換えられるので、Pythonに渡した時点で変更済みとする
+    @property
+    def name(self):
+        return self.name
+
+    @name.setter
+    def name(self, str name):
+        self.c_change()
+        self.name = name
+
+    @property
+    def bname(self):
+        return self.bname
+
+    @bname.setter
+    def bname(self, bytes bname):
+        self.c_change()
+        self.bname = bname
+
+    @property
+    def fno(self):
+        return self.fno
+
+    @fno.setter
+    def fno(self, int fno):
+        self.c_change()
+        self.fno = fno
+
+    @property
+    def position(self):
+        self.c_change()
+        return self.position
+
+    @position.setter
+    def position(self, MVector3D position):
+        self.c_change()
+        self.position = position
+
+    @property
+    def rotation(self):
+        self.c_change()
+        return self.rotation
+
+    @rotation.setter
+    def rotation(self, MQuaternion rotation):
+        self.c_change()
+        self.rotation = rotation
+
+    @property
+    def interpolation(self):
+        self.c_change()
+        return self.interpolation
+
+    @interpolation.setter
+    def interpolation(self, list interpolation):
+        self.c_change()
+        self.interpolation = interpolation
+
+    @property
+    def key(self):
+        return self.key
+
+    @key.setter
+    def key(self, bint key):
+        self.c_change()
+        self.key = key
+
     def set_name(self, name):
+        self.c_change()
         self.name = name
-        self.bname = b'' if not name else name.encode('cp932').decode('shift_jis').encode('shift_jis')[:15].ljust(15, b'\x00')
+        self.bname = b'' if not name else encode_name(name, 15)
     
     def copy(self):
         bf = VmdBoneFrame(self.fno)
@@ -142,13 +254,22 @@ cdef class VmdBoneFrame:
 
         return bf
 
+    # 別プロセスに渡す場合、読み込み時のまま出力する間の登録先は渡さない
+    def __reduce__(self):
+        return (VmdBoneFrame, (self.fno,), (self.name, self.bname, self.position, self.rotation, self.org_position, self.org_rotation, \
+                                             self.interpolation, self.org_interpolation, self.key, self.read, self.avoidance))
+
+    def __setstate__(self, state):
+        self.name, self.bname, self.position, self.rotation, self.org_position, self.org_rotation, \
+            self.interpolation, self.org_interpolation, self.key, self.read, self.avoidance = state
+
     def __str__(self):
         return "<VmdBoneFrame name:{0}, fno:{1}, position:{2}, rotation:{3}, euler:{4}, key:{5}, read:{6}, interpolation: {7}>".format( \
             self.name, self.fno, self.position, self.rotation, self.rotation.toEulerAngles4MMD(), self.key, self.read, self.interpolation)
 
     def write(self, fout):
         if not self.bname:
-            self.bname = self.name.encode('cp932').decode('shift_jis').encode('shift_jis')[:15].ljust(15, b'\x00')   # 15文字制限
+            self.bname = encode_name(self.name, 15)   # 15文字制限
         fout.write(self.bname)
         fout.write(struct.pack('<L', int(self.fno)))
         fout.write(struct.pack('<f', float(self.position.x())))
@@ -172,10 +293,55 @@ cdef class VmdMorphFrame:
         self.key = False
         # VMD読み込み処理で読み込んだキーか
         self.read = False
+        # 読み込み時のまま出力する間の登録先（motion.unchanged_morphs）
+        self.unchanged = None
     
+    # 読み込み時のキーフレから変更されたので、読み込み時のまま出力しない
+    cdef c_change(self):
+        if self.unchanged is not None:
+            self.unchanged.pop(self.name, None)
+            self.unchanged = None
+
+    # 出力に関わる値は、Pythonから変更された時点で変更済みとする
+    @property
+    def name(self):
+        return self.name
+
+    @name.setter
+    def name(self, str name):
+        self.c_change()
+        self.name = name
+
+    @property
+    def bname(self):
+        return self.bname
+
+    @bname.setter
+    def bname(self, bytes bname):
+        self.c_change()
+        self.bname = bname
+
+    @property
+    def fno(self):
+        return self.fno
+
+    @fno.setter
+    def fno(self, int fno):
+        self.c_change()
+        self.fno = fno
+
+    @property
+    def ratio(self):
+        return self.ratio
+
+    @ratio.setter
+    def ratio(self, float ratio):
+        self.c_change()
+        self.ratio = ratio
+
     def write(self, fout):
         if not self.bname:
-            self.bname = self.name.encode('cp932').decode('shift_jis').encode('shift_jis')[:15].ljust(15, b'\x00')   # 15文字制限
+            self.bname = encode_name(self.name, 15)   # 15文字制限
         fout.write(self.bname)
         fout.write(struct.pack('<L', int(self.fno)))
         fout.write(struct.pack('<f', float(self.ratio)))
@@ -190,9 +356,17 @@ cdef class VmdMorphFrame:
 
         return mf
 
+    # 別プロセスに渡す場合、読み込み時のまま出力する間の登録先は渡さない
+    def __reduce__(self):
+        return (VmdMorphFrame, (self.fno,), (self.name, self.bname, self.ratio, self.key, self.read))
+
+    def __setstate__(self, state):
+        self.name, self.bname, self.ratio, self.key, self.read = state
+
     def set_name(self, name):
+        self.c_change()
         self.name = name
-        self.bname = b'' if not name else name.encode('cp932').decode('shift_jis').encode('shift_jis')[:15].ljust(15, b'\x00')
+        self.bname = b'' if not name else encode_name(name, 15)
     
     def __str__(self):
         return "<VmdMorphFrame name:{0}, fno:{1}, ratio:{2}".format(self.name, self.fno, self.ratio)
@@ -289,13 +463,20 @@ class VmdShowIkFrame:
         fout.write(struct.pack('<L', len(self.ik)))
         for k in (self.ik):
             if not k.bname:
-                k.bname = k.name.encode('cp932').decode('shift_jis').encode('shift_jis')[:20].ljust(20, b'\x00')   # 20文字制限
+                k.bname = encode_name(k.name, 20)   # 20文字制限
             fout.write(k.bname)
             fout.write(struct.pack('b', k.onoff))
         
 
 # https://blog.goo.ne.jp/torisu_tetosuki/e/bc9f1c4d597341b394bd02b64597499d
 # https://w.atwiki.jp/kumiho_k/pages/15.html
+# 読み込み時のバイト列のまま出力するキーフレについて
+# ・raw_buffer はメモリマップの場合があるので、使い終わったら close で閉じる
+#   コピーしたモーションとはメモリマップを共有しているので、まとめて閉じる（閉じた後は未展開のキーフレは参照できない）
+# ・raw_bones/raw_morphs は未展開なので、変更されることはない（参照・登録時に展開される）
+# ・unchanged_bones/unchanged_morphs は展開済みなので、キーフレを直接書き換えることもできる
+#   キーフレは登録先を持っていて、Pythonから値を変更した時点（位置・回転・補間曲線は参照した時点）で未変更から外れる
+#   キーフレの追加・削除はキーフレ数で判定するので、辞書のキーフレを別のオブジェクトに差し替える場合は touch_bones/touch_morphs で変更済みにする
 cdef class VmdMotion:
     def __init__(self):
         self.path = ''
@@ -322,7 +503,207 @@ cdef class VmdMotion:
         self.showiks = []
         # ハッシュ値
         self.digest = None
-    
+        # 読み込み元のバイト列（メモリマップの場合もある）
+        self.raw_buffer = None
+        # 未展開のボーンキーフレ（key:ボーン名, value:レコード開始位置リスト）
+        self.raw_bones = {}
+        # 未展開のモーフキーフレ（key:モーフ名, value:レコード開始位置リスト）
+        self.raw_morphs = {}
+        # 展開済みで読み込み時から変更されていないボーンキーフレ（key:ボーン名, value:レコード開始位置リスト）
+        self.unchanged_bones = {}
+        # 展開済みで読み込み時から変更されていないモーフキーフレ（key:モーフ名, value:レコード開始位置リスト）
+        self.unchanged_morphs = {}
+        # 読み込み元のバイト列を共有しているモーション（コピー時に生成）
+        self.raw_sharers = None
+
+    # 読み込み元のメモリマップを閉じる（ファイルをロックしたままにしない）
+    # バイト列にコピーはせず、メモリマップを共有しているモーションもまとめて読み込み元を手放す
+    def close(self):
+        cdef VmdMotion motion
+
+        if not isinstance(self.raw_buffer, mmap.mmap):
+            return
+
+        with raw_lock:
+            raw_buffer = self.raw_buffer
+
+            for motion in list(self.raw_sharers or [self]):
+                motion.c_release_raw_buffer()
+
+            raw_buffer.close()
+
+    cdef c_release_raw_buffer(self):
+        self.raw_buffer = None
+        # 展開済みのキーフレは、以降は展開済みの値で出力する
+        self.unchanged_bones.clear()
+        self.unchanged_morphs.clear()
+
+    # 未展開のキーフレを読み込み元から参照できるか
+    cdef c_check_raw_buffer(self):
+        if self.raw_buffer is None:
+            raise SizingException("読み込み元VMDのメモリマップを閉じた後は、未展開のキーフレを参照できません。")
+
+    # 読み込み時のキーフレから変更されたボーンとしてマークする
+    def touch_bones(self, *bone_names):
+        for bone_name in bone_names:
+            self.c_touch_bone(bone_name)
+
+    cdef c_touch_bone(self, str bone_name):
+        # 未展開の場合、先に展開しておく
+        self.c_load_bone(bone_name)
+        self.unchanged_bones.pop(bone_name, None)
+
+    # 読み込み時のキーフレから変更されたモーフとしてマークする
+    def touch_morphs(self, *morph_names):
+        for morph_name in morph_names:
+            self.c_touch_morph(morph_name)
+
+    cdef c_touch_morph(self, str morph_name):
+        # 未展開の場合、先に展開しておく
+        self.c_load_morph(morph_name)
+        self.unchanged_morphs.pop(morph_name, None)
+
+    # 読み込み時のまま出力するキーフレに登録先を持たせて、変更されたら未変更から外れるようにする
+    def watch_unchanged_frames(self):
+        for bone_name in list(self.unchanged_bones.keys()):
+            self.c_watch_bone(bone_name)
+
+        for morph_name in list(self.unchanged_morphs.keys()):
+            self.c_watch_morph(morph_name)
+
+    cdef c_watch_bone(self, str bone_name):
+        cdef VmdBoneFrame bf
+
+        if bone_name not in self.bones:
+            return
+
+        for bf in self.bones[bone_name].values():
+            bf.unchanged = self.unchanged_bones
+
+    cdef c_watch_morph(self, str morph_name):
+        cdef VmdMorphFrame mf
+
+        if morph_name not in self.morphs:
+            return
+
+        for mf in self.morphs[morph_name].values():
+            mf.unchanged = self.unchanged_morphs
+
+    # 未展開のボーンキーフレを展開する
+    def load_bones(self, *bone_names):
+        for bone_name in bone_names:
+            self.c_load_bone(bone_name)
+
+    cdef c_load_bone(self, str bone_name):
+        cdef list offsets
+        cdef dict bone_frames
+        cdef dict bnames = {}
+        cdef bytes bname
+        cdef tuple values
+        cdef int offset
+        cdef VmdBoneFrame bf
+
+        if bone_name not in self.raw_bones:
+            return
+
+        with raw_lock:
+            if bone_name not in self.raw_bones:
+                # 他スレッドで展開済み
+                return
+
+            self.c_check_raw_buffer()
+
+            offsets = self.raw_bones[bone_name]
+            bone_frames = self.bones[bone_name] if bone_name in self.bones else {}
+
+            for offset in offsets:
+                values = BONE_FRAME_STRUCT.unpack_from(self.raw_buffer, offset + 15)
+
+                if values[0] in bone_frames:
+                    # 同じフレーム番号は最初のキーを優先
+                    continue
+
+                # 同じバイト列の名前は同じオブジェクトを使い回す
+                bname = bytes(self.raw_buffer[offset:(offset + 15)])
+                bname = bnames.setdefault(bname, bname)
+
+                bf = VmdBoneFrame(values[0])
+                bf.name = bone_name
+                bf.bname = bname
+                bf.position = MVector3D(values[1], values[2], values[3])
+                bf.rotation = MQuaternion(values[7], values[4], values[5], values[6])
+                bf.org_rotation = bf.rotation.copy()
+                bf.interpolation = list(values[8:])
+                bf.key = True
+                bf.read = True
+
+                bone_frames[bf.fno] = bf
+
+            # 全部展開してから差し替える
+            self.bones[bone_name] = bone_frames
+            del self.raw_bones[bone_name]
+
+            if len(bone_frames) == len(offsets):
+                # 展開しただけの間は読み込み時のまま出力する
+                self.unchanged_bones[bone_name] = offsets
+                self.c_watch_bone(bone_name)
+
+    # 未展開のモーフキーフレを展開する
+    def load_morphs(self, *morph_names):
+        for morph_name in morph_names:
+            self.c_load_morph(morph_name)
+
+    cdef c_load_morph(self, str morph_name):
+        cdef list offsets
+        cdef dict morph_frames
+        cdef dict bnames = {}
+        cdef bytes bname
+        cdef tuple values
+        cdef int offset
+        cdef VmdMorphFrame mf
+
+        if morph_name not in self.raw_morphs:
+            return
+
+        with raw_lock:
+            if morph_name not in self.raw_morphs:
+                # 他スレッドで展開済み
+                return
+
+            self.c_check_raw_buffer()
+
+            offsets = self.raw_morphs[morph_name]
+            morph_frames = self.morphs[morph_name] if morph_name in self.morphs else {}
+
+            for offset in offsets:
+                values = MORPH_FRAME_STRUCT.unpack_from(self.raw_buffer, offset + 15)
+
+                if values[0] in morph_frames:
+                    # 同じフレーム番号は最初のキーを優先
+                    continue
+
+                # 同じバイト列の名前は同じオブジェクトを使い回す
+                bname = bytes(self.raw_buffer[offset:(offset + 15)])
+                bname = bnames.setdefault(bname, bname)
+
+                mf = VmdMorphFrame(values[0])
+                mf.name = morph_name
+                mf.bname = bname
+                mf.ratio = values[1]
+                mf.key = True
+                mf.read = True
+
+                morph_frames[mf.fno] = mf
+
+            # 全部展開してから差し替える
+            self.morphs[morph_name] = morph_frames
+            del self.raw_morphs[morph_name]
+
+            if len(morph_frames) == len(offsets):
+                # 展開しただけの間は読み込み時のまま出力する
+                self.unchanged_morphs[morph_name] = offsets
+                self.c_watch_morph(morph_name)
+
     def regist_full_bf(self, data_set_no: int, bone_name_list: list, offset=1, is_key=True):
         self.c_regist_full_bf(data_set_no, bone_name_list, offset, is_key)
 
@@ -441,6 +822,9 @@ cdef class VmdMotion:
     cdef c_smooth_bf(self, int data_set_no, str bone_name, bint is_rot, bint is_mov, double limit_degrees, int start_fno, int end_fno, bint is_show_log):
         cdef list fnos
 
+        # 読み込み時のキーフレから変更される
+        self.c_touch_bone(bone_name)
+
         # キーフレを取得する
         if start_fno < 0 and end_fno < 0:
             # 範囲指定がない場合、全範囲
@@ -492,6 +876,9 @@ cdef class VmdMotion:
 
     # フィルターをかける
     cdef c_smooth_filter_bf(self, int data_set_no, str bone_name, bint is_rot, bint is_mov, int loop, dict mconfig, int start_fno, int end_fno, bint is_show_log):
+        # 読み込み時のキーフレから変更される
+        self.c_touch_bone(bone_name)
+
         cdef int n, fno
         cdef list active_fnos
         cdef prev_sep_fno = 0
@@ -563,6 +950,9 @@ cdef class VmdMotion:
             
     # 無効なキーを物理削除する
     def remove_unkey_bf(self, data_set_no: int, bone_name: str):
+        # 読み込み時のキーフレから変更される
+        self.c_touch_bone(bone_name)
+
         for fno in self.get_bone_fnos(bone_name):
             bf = self.c_calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False)
 
@@ -583,6 +973,9 @@ cdef class VmdMotion:
     cdef list c_remove_unnecessary_bf(self, int data_set_no, str bone_name, bint is_rot, bint is_mov, \
                                       double offset, double rot_diff_limit, double mov_diff_limit, int r_start_fno, int r_end_fno, bint is_show_log, bint is_force, bint is_sub_remove, 
                                       dict r_dict, dict mx_dict, dict my_dict, dict mz_dict, list infections):
+        # 読み込み時のキーフレから変更される
+        self.c_touch_bone(bone_name)
+
         cdef int prev_sep_fno = 0
         cdef list active_fnos
         cdef np.ndarray[DTYPE_INT_t, ndim=1] fnos
@@ -901,12 +1294,125 @@ cdef class VmdMotion:
     #     return smooth_dict
     #     # return values
 
+    # 複数キーフレを一括登録
+    # fnos: フレーム番号リスト
+    # positions: 位置リスト（MVector3D or N×3配列）、rotations: 回転リスト（MQuaternion or N×4配列, [w, x, y, z]）
+    # Noneの場合は現在の値のまま登録する
+    # fnosの順に regist_bf を1件ずつ呼んだ場合と同じ結果になる
+    def regist_bfs(self, bone_name: str, fnos: list, positions=None, rotations=None):
+        self.c_regist_bfs(bone_name, list(fnos), positions, rotations)
+
+    # 複数キーフレを一括登録
+    # c_regist_bf と同じ手順で登録するが、前後キーの検索は昇順のフレーム番号リストを二分探索して行う
+    cdef c_regist_bfs(self, str bone_name, list fnos, object positions, object rotations):
+        # 読み込み時のキーフレから変更される
+        self.c_touch_bone(bone_name)
+
+        if bone_name not in self.bones:
+            self.bones[bone_name] = {}
+
+        cdef dict bone_frames = self.bones[bone_name]
+        cdef list frame_fnos = sorted(bone_frames.keys())
+        cdef int fidx, fno, prev_fno, next_fno, kidx
+        cdef VmdBoneFrame regist_bf, prev_bf, next_bf
+
+        for fidx, fno in enumerate(fnos):
+            # 登録対象の場合のみ、補間曲線リセットで登録する
+            regist_bf = self.c_calc_bf_by_fnos(bone_name, frame_fnos, fno, True)
+            if positions is not None:
+                regist_bf.position = positions[fidx].copy() if isinstance(positions[fidx], MVector3D) else MVector3D(positions[fidx])
+            if rotations is not None:
+                regist_bf.rotation = rotations[fidx].copy() if isinstance(rotations[fidx], MQuaternion) else MQuaternion(rotations[fidx])
+
+            # キーを登録
+            regist_bf.key = True
+            if fno not in bone_frames:
+                bisect.insort(frame_fnos, fno)
+            bone_frames[fno] = regist_bf
+
+            # 前後の有効なキー（get_bone_prev_next_fno と同じく、なければ -1 と最終フレーム＋1）
+            prev_fno = -1
+            kidx = bisect.bisect_left(frame_fnos, fno) - 1
+            while kidx >= 0:
+                if bone_frames[frame_fnos[kidx]].key:
+                    prev_fno = frame_fnos[kidx]
+                    break
+                kidx -= 1
+
+            next_fno = self.last_motion_frame + 1
+            kidx = bisect.bisect_right(frame_fnos, fno)
+            while kidx < len(frame_fnos):
+                if bone_frames[frame_fnos[kidx]].key:
+                    next_fno = frame_fnos[kidx]
+                    break
+                kidx += 1
+
+            if not (prev_fno < fno < next_fno):
+                # 間の分割が出来ない場合、次へ
+                continue
+
+            prev_bf = self.c_calc_bf_by_fnos(bone_name, frame_fnos, prev_fno, False)
+            next_bf = self.c_calc_bf_by_fnos(bone_name, frame_fnos, next_fno, False)
+            self.split_bf_by_fno(bone_name, prev_bf, next_bf, fno)
+
+            if len(frame_fnos) != len(bone_frames):
+                # 分割でキーが追加された場合、フレーム番号リストを作り直す
+                frame_fnos = sorted(bone_frames.keys())
+
+    # 複数フレームの値を一括で求める（calc_bf を1件ずつ呼んだ場合と同じ値）
+    def calc_bfs(self, bone_name: str, fnos: list):
+        return self.c_calc_bfs(bone_name, list(fnos))
+
+    cdef list c_calc_bfs(self, str bone_name, list fnos):
+        # 未展開の場合、ここで展開
+        self.c_load_bone(bone_name)
+
+        if len(fnos) == 0:
+            return []
+
+        if bone_name not in self.bones:
+            # ボーンがない場合、最初のフレームで登録される
+            self.c_calc_bf(bone_name, fnos[0], is_key=False, is_read=False, is_reset_interpolation=False)
+
+        cdef list frame_fnos = sorted(self.bones[bone_name].keys())
+        cdef int fno
+
+        return [self.c_calc_bf_by_fnos(bone_name, frame_fnos, fno, False) for fno in fnos]
+
+    # c_calc_bf（キー・読み込みキー指定なし）と同じ値を、昇順のフレーム番号リストから求める
+    cdef VmdBoneFrame c_calc_bf_by_fnos(self, str bone_name, list frame_fnos, int fno, bint is_reset_interpolation):
+        cdef dict bone_frames = self.bones[bone_name]
+        cdef VmdBoneFrame fill_bf
+
+        if fno in bone_frames:
+            return bone_frames[fno]
+
+        if len(frame_fnos) == 0:
+            fill_bf = VmdBoneFrame(fno)
+            fill_bf.set_name(bone_name)
+            return fill_bf
+
+        cdef int fidx = bisect.bisect_left(frame_fnos, fno)
+
+        if fidx == 0 or fidx == len(frame_fnos):
+            # 前か後の片方しかない場合、その値をコピーして返す
+            fill_bf = bone_frames[frame_fnos[0] if fidx == 0 else frame_fnos[-1]].copy()
+            fill_bf.fno = fno
+            fill_bf.key = False
+            fill_bf.read = False
+            return fill_bf
+
+        return self.c_interpolate_bf(bone_name, bone_frames[frame_fnos[fidx - 1]], bone_frames[frame_fnos[fidx]], fno, is_reset_interpolation)
+
     # 補間曲線分割ありで登録
     def regist_bf(self, bf: VmdBoneFrame, bone_name: str, fno: int, copy_interpolation=False, key=True):
         self.c_regist_bf(bf, bone_name, fno, copy_interpolation, key)
 
     # 補間曲線分割ありで登録
     cdef c_regist_bf(self, VmdBoneFrame bf, str bone_name, int fno, bint copy_interpolation, bint key):
+        # 読み込み時のキーフレから変更される
+        self.c_touch_bone(bone_name)
+
         # 登録対象の場合のみ、補間曲線リセットで登録する
         cdef VmdBoneFrame regist_bf = self.c_calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=True)
         regist_bf.position = bf.position.copy()
@@ -939,7 +1445,11 @@ cdef class VmdMotion:
     cdef VmdBoneFrame c_calc_bf(self, str bone_name, int fno, bint is_key, bint is_read, bint is_reset_interpolation):
         cdef VmdBoneFrame fill_bf = VmdBoneFrame(fno)
 
+        # 未展開の場合、ここで展開
+        self.c_load_bone(bone_name)
+
         if bone_name not in self.bones:
+            self.c_touch_bone(bone_name)
             self.bones[bone_name] = {fno: fill_bf}
             fill_bf.set_name(bone_name)
             return fill_bf
@@ -981,8 +1491,11 @@ cdef class VmdMotion:
             fill_bf.read = False
             return fill_bf
 
-        cdef VmdBoneFrame prev_bf = self.bones[bone_name][before_fnos[-1]]
-        cdef VmdBoneFrame next_bf = self.bones[bone_name][after_fnos[0]]
+        return self.c_interpolate_bf(bone_name, self.bones[bone_name][before_fnos[-1]], self.bones[bone_name][after_fnos[0]], fno, is_reset_interpolation)
+
+    # 前後キーの間を補間曲線を元に埋める
+    cdef VmdBoneFrame c_interpolate_bf(self, str bone_name, VmdBoneFrame prev_bf, VmdBoneFrame next_bf, int fno, bint is_reset_interpolation):
+        cdef VmdBoneFrame fill_bf = VmdBoneFrame(fno)
 
         # 名前をコピー
         fill_bf.name = prev_bf.name
@@ -1081,6 +1594,9 @@ cdef class VmdMotion:
             # 間の分割が出来ない場合、終了
             return False
 
+        # 読み込み時のキーフレから変更される
+        self.c_touch_bone(target_bone_name)
+
         # 補間曲線もともに分割する
         cdef VmdBoneFrame fill_bf = self.c_calc_bf(target_bone_name, fill_fno, is_key=False, is_read=False, is_reset_interpolation=True)
         fill_bf.key = True
@@ -1168,6 +1684,9 @@ cdef class VmdMotion:
 
         bz_x1_idxs, bz_y1_idxs, bz_x2_idxs, bz_y2_idxs = MBezierUtils.from_bz_type(bz_type)
 
+        # 補間曲線を直接書き換えるので、読み込み時のキーフレから変更される
+        rep_bf.c_change()
+
         rep_bf.interpolation[bz_x1_idxs[0]] = rep_bf.interpolation[bz_x1_idxs[1]] = rep_bf.interpolation[bz_x1_idxs[2]] = rep_bf.interpolation[bz_x1_idxs[3]] \
             = org_interpolation[bz_x1_idxs[3]]
         rep_bf.interpolation[bz_y1_idxs[0]] = rep_bf.interpolation[bz_y1_idxs[1]] = rep_bf.interpolation[bz_y1_idxs[2]] = rep_bf.interpolation[bz_y1_idxs[3]] \
@@ -1234,6 +1753,9 @@ cdef class VmdMotion:
 
     # モーフモーション：フレーム番号リスト
     def get_morph_fnos(self, *morph_names, **kwargs):
+        # 未展開の場合、ここで展開
+        self.load_morphs(*morph_names)
+
         if not self.morphs:
             return []
         
@@ -1264,6 +1786,12 @@ cdef class VmdMotion:
     # モーフ登録
     cdef c_regist_mf(self, VmdMorphFrame mf, str morph_name, int fno):
         cdef VmdMorphFrame regist_mf = VmdMorphFrame(mf.fno)
+
+        # 未展開の場合、ここで展開
+        self.c_load_morph(morph_name)
+        # 読み込み時のキーフレから変更される
+        self.c_touch_morph(morph_name)
+
         regist_mf.set_name(mf.name)
         regist_mf.ratio = get_effective_value(mf.ratio)
 
@@ -1286,7 +1814,11 @@ cdef class VmdMotion:
     cdef VmdMorphFrame c_calc_mf(self, str morph_name, int fno, bint is_key, bint is_read):
         cdef VmdMorphFrame fill_mf = VmdMorphFrame(fno)
 
+        # 未展開の場合、ここで展開
+        self.c_load_morph(morph_name)
+
         if morph_name not in self.morphs:
+            self.c_touch_morph(morph_name)
             fill_mf.set_name(morph_name)
             self.morphs[morph_name] = {fno: fill_mf}
             return fill_mf
@@ -1360,6 +1892,9 @@ cdef class VmdMotion:
 
     # フィルターをかける
     cdef c_smooth_filter_mf(self, int data_set_no, str morph_name, int loop, dict config, int start_fno, int end_fno, bint is_show_log):
+        # 読み込み時のキーフレから変更される
+        self.c_touch_morph(morph_name)
+
         cdef OneEuroFilter rxfilter
         cdef int n
         cdef list fnos
@@ -1391,6 +1926,9 @@ cdef class VmdMotion:
 
     # 無効なキーを物理削除する
     def remove_unkey_mf(self, data_set_no: int, morph_name: str):
+        # 読み込み時のキーフレから変更される
+        self.c_touch_morph(morph_name)
+
         for fno in self.get_morph_fnos(morph_name):
             mf = self.c_calc_mf(morph_name, fno, is_key=False, is_read=False)
 
@@ -1407,6 +1945,9 @@ cdef class VmdMotion:
     # 変曲点を求める
     # https://teratail.com/questions/162391
     cdef c_remove_unnecessary_mf(self, int data_set_no, str morph_name, double offset, double diff_limit, int r_start_fno, int r_end_fno, bint is_show_log, bint is_force):
+        # 読み込み時のキーフレから変更される
+        self.c_touch_morph(morph_name)
+
         cdef int prev_sep_fno = 0
         cdef list fnos
 
@@ -1501,6 +2042,10 @@ cdef class VmdMotion:
     # 有効なキーフレが入っているか
     cpdef bint is_active_bones(self, str bone_name):
         cdef VmdBoneFrame bf
+
+        # 未展開の場合、ここで展開
+        self.c_load_bone(bone_name)
+
         if bone_name not in self.bones:
             return False
             
@@ -1514,6 +2059,9 @@ cdef class VmdMotion:
 
     # ボーンモーション：フレーム番号リスト
     def get_bone_fnos(self, *bone_names, **kwargs):
+        # 未展開の場合、ここで展開
+        self.load_bones(*bone_names)
+
         if not self.bones:
             return []
         
@@ -1567,10 +2115,8 @@ cdef class VmdMotion:
         target_fnos = {}
 
         for bone_name, bone_frames in self.bones.items():
-            if bone_name not in ["SIZING_ROOT_BONE", "頭頂", "右つま先実体", "左つま先実体", "右足底辺", "左足底辺", "右足底実体", "左足底実体", "右足ＩＫ底実体", "左足ＩＫ底実体", "右足IK親底実体", "左足IK親底実体", \
-                                 "首根元", "右腕下延長", "左腕下延長", "右腕垂直", "左腕垂直", "センター実体", "左腕ひじ中間", "右腕ひじ中間", "左ひじ手首中間", "右ひじ手首中間", "左手首実体", "右手首実体", \
-                                 "左親指先実体", "左人指先実体", "左中指先実体", "左薬指先実体", "左小指先実体", "右親指先実体", "右人指先実体", "右中指先実体", "右薬指先実体", "右小指先実体"]:
-                # サイジング用ボーンは出力しない
+            if bone_name not in SIZING_BONE_NAMES and not self.c_is_unchanged_bone(bone_name):
+                # サイジング用ボーンと読み込み時のまま出力するボーンは出力しない
                 target_fnos[bone_name] = self.get_bone_fnos(bone_name, is_key=True)
 
         for bone_name, fnos in target_fnos.items():
@@ -1594,6 +2140,10 @@ cdef class VmdMotion:
         total_morph_frames = []
 
         for morph_name, morph_frames in self.morphs.items():
+            if self.c_is_unchanged_morph(morph_name):
+                # 読み込み時のまま出力するモーフは出力しない
+                continue
+
             fnos = self.get_morph_fnos(morph_name)
             
             if len(fnos) > 0:
@@ -1601,6 +2151,9 @@ cdef class VmdMotion:
                 total_morph_frames.append(morph_frames[fnos[-1]])
         
         for morph_name, morph_frames in self.morphs.items():
+            if self.c_is_unchanged_morph(morph_name):
+                continue
+
             fnos = self.get_morph_fnos(morph_name)
 
             if len(fnos) > 1:
@@ -1620,8 +2173,65 @@ cdef class VmdMotion:
 
         return total_camera_frames
 
+    # 展開済みのキーフレを読み込み時のまま出力するか（キーフレの値の変更は、変更した時点で未変更から外れている）
+    cdef bint c_is_unchanged_bone(self, str bone_name):
+        # キーフレが追加・削除されていないか
+        return bone_name in self.unchanged_bones and bone_name in self.bones and len(self.bones[bone_name]) == len(self.unchanged_bones[bone_name])
+
+    cdef bint c_is_unchanged_morph(self, str morph_name):
+        # キーフレが追加・削除されていないか
+        return morph_name in self.unchanged_morphs and morph_name in self.morphs and len(self.morphs[morph_name]) == len(self.unchanged_morphs[morph_name])
+
+    # 読み込み時のまま出力するボーンキーフレ（未展開・未変更）のレコード開始位置リスト
+    def get_raw_bone_offsets(self):
+        raw_offsets = []
+
+        for bone_name, offsets in self.raw_bones.items():
+            if bone_name not in SIZING_BONE_NAMES:
+                raw_offsets.extend(offsets)
+
+        for bone_name, offsets in self.unchanged_bones.items():
+            if bone_name not in SIZING_BONE_NAMES and self.c_is_unchanged_bone(bone_name):
+                raw_offsets.extend(offsets)
+
+        if raw_offsets:
+            self.c_check_raw_buffer()
+
+        return raw_offsets
+
+    # ボーンキーフレを読み込み時のバイト列のまま出力
+    def write_raw_bone_frames(self, fout, raw_offsets: list):
+        for offset in raw_offsets:
+            fout.write(self.raw_buffer[offset:(offset + BONE_RECORD_SIZE)])
+
+    # 読み込み時のまま出力するモーフキーフレ（未展開・未変更）のレコード開始位置リスト
+    def get_raw_morph_offsets(self):
+        raw_offsets = []
+
+        for offsets in self.raw_morphs.values():
+            raw_offsets.extend(offsets)
+
+        for morph_name, offsets in self.unchanged_morphs.items():
+            if self.c_is_unchanged_morph(morph_name):
+                raw_offsets.extend(offsets)
+
+        if raw_offsets:
+            self.c_check_raw_buffer()
+
+        return raw_offsets
+
+    # モーフキーフレを読み込み時のバイト列のまま出力
+    def write_raw_morph_frames(self, fout, raw_offsets: list):
+        for offset in raw_offsets:
+            fout.write(self.raw_buffer[offset:(offset + MORPH_RECORD_SIZE)])
+
     # ボーンキーフレを追加
     def append_bone_frame(self, frame: VmdBoneFrame):
+        # 未展開の場合、ここで展開
+        self.c_load_bone(frame.name)
+        # 読み込み時のキーフレから変更される
+        self.c_touch_bone(frame.name)
+
         if frame.name not in self.bones:
             # まだ該当ボーン名がない場合、追加
             self.bones[frame.name] = {}
@@ -1630,6 +2240,11 @@ cdef class VmdMotion:
 
     # モーフキーフレを追加
     def append_morph_frame(self, frame: VmdMorphFrame):
+        # 未展開の場合、ここで展開
+        self.c_load_morph(frame.name)
+        # 読み込み時のキーフレから変更される
+        self.c_touch_morph(frame.name)
+
         if frame.name not in self.morphs:
             # まだ該当モーフ名がない場合、追加
             self.morphs[frame.name] = {}
@@ -1660,7 +2275,12 @@ cdef class VmdMotion:
                 motion.bones[bone_name][bf.fno] = bf.copy()
 
         motion.morph_cnt = cPickle.loads(cPickle.dumps(self.morph_cnt, -1))
-        motion.morphs = cPickle.loads(cPickle.dumps(self.morphs, -1))
+
+        for morph_name, mf_dict in self.morphs.items():
+            motion.morphs[morph_name] = {}
+            for mf in mf_dict.values():
+                motion.morphs[morph_name][mf.fno] = mf.copy()
+
         motion.camera_cnt = cPickle.loads(cPickle.dumps(self.camera_cnt, -1))
         motion.cameras = cPickle.loads(cPickle.dumps(self.cameras, -1))
 
@@ -1673,4 +2293,19 @@ cdef class VmdMotion:
         
         motion.digest = cPickle.loads(cPickle.dumps(self.digest, -1))
 
+        # 読み込み元のバイト列は読み取り専用なので共有する
+        motion.raw_buffer = self.raw_buffer
+        if self.raw_buffer is not None:
+            # メモリマップを閉じる時に、コピー先もまとめて手放せるようにしておく
+            if self.raw_sharers is None:
+                self.raw_sharers = weakref.WeakSet([self])
+            self.raw_sharers.add(motion)
+            motion.raw_sharers = self.raw_sharers
+        motion.raw_bones = dict(self.raw_bones)
+        motion.raw_morphs = dict(self.raw_morphs)
+        motion.unchanged_bones = dict(self.unchanged_bones)
+        motion.unchanged_morphs = dict(self.unchanged_morphs)
+        # コピーしたキーフレの変更はコピー先のモーションで判定する
+        motion.watch_unchanged_frames()
+
         return motion
@@ -1,40 +1,94 @@
 # -*- coding: utf-8 -*-
 #
+import os
 import struct
-import hashlib
+import mmap
 import re
 
-from mmd.VmdData import VmdMotion, VmdBoneFrame, VmdCameraFrame, VmdInfoIk, VmdLightFrame, VmdMorphFrame, VmdShadowFrame, VmdShowIkFrame
+from mmd.VmdData import VmdMotion, VmdBoneFrame, VmdCameraFrame, VmdInfoIk, VmdLightFrame, VmdMorphFrame, VmdShadowFrame, VmdShowIkFrame, \
+    BONE_RECORD_SIZE, MORPH_RECORD_SIZE
 from module.MMath import MRect, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
+from utils import MFileUtils
 from utils.MLogger import MLogger # noqa
 from utils.MException import SizingException, MKilledException, MParseException
 
 logger = MLogger(__name__)
 
+# VMDのカメラ・照明・セルフ影キーフレ1件あたりのバイト数
+CAMERA_RECORD_SIZE = 61
+LIGHT_RECORD_SIZE = 28
+SHADOW_RECORD_SIZE = 9
+
 
 class VmdReader:
-    def __init__(self, file_path):
+    def __init__(self, file_path, is_mmap=False, bone_names=None, morph_names=None, exclude_bone_names=None, exclude_morph_names=None):
         self.offset = 0
         self.buffer = None
+        # バッファを読む前のファイル情報（ハッシュ値キャッシュ用）
+        self.buffer_stat = None
         self.encoding = None
+        # デコード済みの名前（key:バイト列, value:(バイト列, 名前)）
+        self.text_cache = {}
         self.file_path = file_path
+        # メモリマップで読み込むか（キーフレはボーン・モーフ毎に参照された時に展開する）
+        self.is_mmap = is_mmap
+        # 読み込み時に展開するボーン・モーフ名（Noneの場合は全部）
+        self.bone_names = bone_names
+        self.morph_names = morph_names
+        # 読み込み時に展開しないボーン・モーフ名
+        self.exclude_bone_names = exclude_bone_names
+        self.exclude_morph_names = exclude_morph_names
+
+    # 読み込み結果に影響するオプション（同じファイルでもオプションが違えば読み込み結果は使い回せない）
+    def get_load_options(self):
+        return (self.is_mmap, to_names_key(self.bone_names), to_names_key(self.morph_names), \
+                to_names_key(self.exclude_bone_names), to_names_key(self.exclude_morph_names))
 
     # モデル名だけ取得
     def read_model_name(self):
-        model_name = ""
+        return self.read_metadata()["model_name"]
+
+    # ヘッダ・モデル名・各キーフレ件数だけ取得（キーフレ本体は読まず、件数の位置まで読み飛ばす）
+    def read_metadata(self):
+        metadata = {"file_size": os.path.getsize(self.file_path)}
+
         with open(self.file_path, "rb") as f:
-            # VMDファイルをバイナリ読み込み
-            self.buffer = f.read()
+            # ヘッダ（バージョン・モデル名・ボーンキーフレ数）
+            self.buffer = f.read(54)
+            self.offset = 0
 
             # vmdバージョン
-            signature = self.unpack(30, "30s")
-            logger.test("signature %s", signature)
+            metadata["signature"] = self.unpack(30, "30s")
+
+            if not metadata["signature"].startswith(b"Vocaloid Motion Data"):
+                # 整合性チェック
+                raise MParseException("VMD形式外のデータです。signature: {0}".format(metadata["signature"]))
 
             # モデル名
-            model_bname, model_name = self.read_text(20)
-            logger.test("model_bname %s, model_name: %s", model_bname, model_name)
+            _, metadata["model_name"] = self.read_text(20)
+
+            # モーション数
+            metadata["motion_cnt"] = self.read_uint(4)
+
+            section_offset = 54 + metadata["motion_cnt"] * BONE_RECORD_SIZE
+            for (cnt_key, record_size) in [("morph_cnt", MORPH_RECORD_SIZE), ("camera_cnt", CAMERA_RECORD_SIZE), \
+                                           ("light_cnt", LIGHT_RECORD_SIZE), ("shadow_cnt", SHADOW_RECORD_SIZE)]:
+                # 各キーフレ数の位置だけ読む（昔のVMDは途中までしかないので、その場合は0件）
+                metadata[cnt_key] = 0
 
-        return model_name
+                if section_offset + 4 > metadata["file_size"]:
+                    continue
+
+                f.seek(section_offset)
+                self.buffer = f.read(4)
+                self.offset = 0
+                metadata[cnt_key] = self.read_uint(4)
+
+                section_offset += 4 + metadata[cnt_key] * record_size
+
+        logger.test("metadata: %s", metadata)
+
+        return metadata
 
     def read_data(self):
         # モーションパス
@@ -43,8 +97,16 @@ class VmdReader:
 
         try:
             with open(self.file_path, "rb") as f:
-                # VMDファイルをバイナリ読み込み
-                self.buffer = f.read()
+                self.buffer_stat = os.fstat(f.fileno())
+
+                if self.is_mmap:
+                    # VMDファイルをメモリマップで読み込み
+                    self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    # VMDファイルをバイナリ読み込み
+                    self.buffer = f.read()
+
+                motion.raw_buffer = self.buffer
 
                 # vmdバージョン
                 signature = self.unpack(30, "30s")
@@ -61,16 +123,30 @@ class VmdReader:
 
                 # 1F分のモーション情報
 
+                # 未展開のキーフレで保持済みの（ボーン名, フレーム番号）
+                raw_bone_keys = set()
+
                 prev_n = 0
                 for n in range(motion.motion_cnt):
-                    frame = VmdBoneFrame(0)
-                    frame.key = True
-                    frame.read = True
+                    record_offset = self.offset
 
                     # ボーン ----------------------
                     # ボーン名
                     bone_bname, bone_name = self.read_text(15)
 
+                    if not self.is_decode_target(bone_name, self.bone_names, self.exclude_bone_names):
+                        # 展開対象外の場合、レコード位置だけ保持して、中身は展開しない
+                        fno = self.skip_record(motion.raw_bones, raw_bone_keys, bone_name, record_offset, BONE_RECORD_SIZE)
+
+                        if fno > motion.last_motion_frame:
+                            # 最終フレームを記録
+                            motion.last_motion_frame = fno
+                        continue
+
+                    frame = VmdBoneFrame(0)
+                    frame.key = True
+                    frame.read = True
+
                     frame.name = bone_name
                     frame.bname = bone_bname
                     logger.test("name: %s, bname %s", bone_name, bone_bname)
@@ -97,6 +173,10 @@ class VmdReader:
                     if bone_name not in motion.bones:
                         # まだ辞書にない場合、配列追加
                         motion.bones[bone_name] = {}
+                        motion.unchanged_bones[bone_name] = []
+
+                    # 変更されない間は読み込み時のまま出力できるよう、レコード位置を保持
+                    motion.unchanged_bones[bone_name].append(record_offset)
 
                     # 辞書の該当部分にボーンフレームを追加
                     if frame.fno not in motion.bones[bone_name]:
@@ -110,21 +190,36 @@ class VmdReader:
                         prev_n = n // 10000
                         logger.info("-- VMDモーション読み込み キー: %s" % n)
 
+                # 同じフレーム番号のキーが重複しているボーンは読み込み時のまま出力しない
+                for bone_name in list(motion.unchanged_bones.keys()):
+                    if len(motion.unchanged_bones[bone_name]) != len(motion.bones[bone_name]):
+                        del motion.unchanged_bones[bone_name]
+
                 # モーフ数
                 motion.morph_cnt = self.read_uint(4)
                 logger.test("motion.morph_cnt %s", motion.morph_cnt)
 
+                # 未展開のキーフレで保持済みの（モーフ名, フレーム番号）
+                raw_morph_keys = set()
+
                 # 1F分のモーフ情報
                 prev_n = 0
                 for n in range(motion.morph_cnt):
-                    morph = VmdMorphFrame()
-                    morph.key = True
-                    morph.read = True
+                    record_offset = self.offset
 
                     # モーフ ----------------------
                     # モーフ名
                     morph_bname, morph_name = self.read_text(15)
 
+                    if not self.is_decode_target(morph_name, self.morph_names, self.exclude_morph_names):
+                        # 展開対象外の場合、レコード位置だけ保持して、中身は展開しない
+                        self.skip_record(motion.raw_morphs, raw_morph_keys, morph_name, record_offset, MORPH_RECORD_SIZE)
+                        continue
+
+                    morph = VmdMorphFrame()
+                    morph.key = True
+                    morph.read = True
+
                     morph.name = morph_name
                     morph.bname = morph_bname
                     logger.test("name: %s, bname %s", morph_name, morph_bname)
@@ -140,6 +235,10 @@ class VmdReader:
                     if morph_name not in motion.morphs:
                         # まだ辞書にない場合、配列追加
                         motion.morphs[morph_name] = {}
+                        motion.unchanged_morphs[morph_name] = []
+
+                    # 変更されない間は読み込み時のまま出力できるよう、レコード位置を保持
+                    motion.unchanged_morphs[morph_name].append(record_offset)
 
                     if morph.fno not in motion.morphs[morph_name]:
                         # まだなければ辞書の該当部分にモーフフレームを追加
@@ -149,6 +248,14 @@ class VmdReader:
                         prev_n = n // 1000
                         logger.info("-- VMDモーション読み込み モーフ: %s" % n)
 
+                # 同じフレーム番号のキーが重複しているモーフは読み込み時のまま出力しない
+                for morph_name in list(motion.unchanged_morphs.keys()):
+                    if len(motion.unchanged_morphs[morph_name]) != len(motion.morphs[morph_name]):
+                        del motion.unchanged_morphs[morph_name]
+
+                # 読み込み時のまま出力するキーフレが変更されたら、読み込み時のまま出力しない
+                motion.watch_unchanged_frames()
+
                 try:
                     # カメラ数
                     motion.camera_cnt = self.read_uint(4)
@@ -305,8 +412,8 @@ class VmdReader:
                     # 昔のMMD（MMDv7.39.x64以前）はIK情報がないため、catchして握りつぶす
                     motion.ik_cnt = 0
 
-            # ハッシュを設定
-            motion.digest = self.hexdigest()
+            # ハッシュを設定（読み込んだバッファから求める）
+            motion.digest = self.hexdigest(self.buffer, self.buffer_stat)
             logger.test("motion: %s, hash: %s", motion.path, motion.digest)
 
             return motion
@@ -321,30 +428,54 @@ class VmdReader:
             logger.critical("VMD読み込み処理が意図せぬエラーで終了しました。\n\n%s", traceback.format_exc(), decoration=MLogger.DECORATION_BOX)
             raise e
 
-    def hexdigest(self):
-        sha1 = hashlib.sha1()
+    # 読み込み時に展開するキーフレか
+    def is_decode_target(self, name: str, include_names: list, exclude_names: list):
+        if exclude_names is not None and name in exclude_names:
+            return False
+
+        if include_names is not None:
+            return name in include_names
+
+        # 指定がない場合、メモリマップの時は参照されるまで展開しない
+        return not self.is_mmap
+
+    # キーフレのレコード位置を名前別に保持して、次のレコードまで進める
+    def skip_record(self, raw_frames: dict, raw_keys: set, name: str, record_offset: int, record_size: int):
+        # フレームIDX
+        fno = self.read_uint(4)
+
+        if name not in raw_frames:
+            # まだ辞書にない場合、配列追加
+            raw_frames[name] = []
 
-        with open(self.file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(2048 * sha1.block_size), b''):
-                sha1.update(chunk)
+        if (name, fno) not in raw_keys:
+            # 同じフレーム番号は最初のキーだけ保持（展開時・出力時も最初のキーを優先）
+            raw_keys.add((name, fno))
+            raw_frames[name].append(record_offset)
 
-        sha1.update(chunk)
+        self.offset = record_offset + record_size
 
-        # ファイルパスをハッシュに含める
-        sha1.update(self.file_path.encode('utf-8'))
+        return fno
 
-        return sha1.hexdigest()
+    # ハッシュ値取得（読み込み済みのバッファがある場合、ファイルを読み直さずにそこから求める）
+    def hexdigest(self, buffer=None, buffer_stat=None):
+        return MFileUtils.calc_file_digest(self.file_path, buffer, buffer_stat)
 
     def read_text(self, format_size):
         bresult = self.unpack(format_size, "{0}s".format(format_size))
 
+        if bresult in self.text_cache:
+            # 同じバイト列は一度だけデコードして、同じオブジェクトを使い回す
+            return self.text_cache[bresult]
+
         if not self.encoding:
             # まだエンコードが確定していない場合、エンコード取得
             self.encoding = self.get_encoding(bresult, False)
 
         if self.encoding:
             # エンコードが取れた場合、復元
-            return bresult, self.decode_text(bresult, self.encoding, False)
+            self.text_cache[bresult] = (bresult, self.decode_text(bresult, self.encoding, False))
+            return self.text_cache[bresult]
 
         return None, None
 
@@ -462,3 +593,11 @@ class VmdReader:
             result = None
 
         return result
+
+
+# 名前リストを比較用のキーに変換（指定なしの場合はNoneのまま）
+def to_names_key(names: list):
+    if names is None:
+        return None
+
+    return frozenset(names)
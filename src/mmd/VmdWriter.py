@@ -22,7 +22,13 @@ class VmdWriter():
         morph_frames = self.data_set.motion.get_morph_frames()
         camera_frames = self.data_set.motion.get_camera_frames()
 
-        if len(bone_frames) > 0 or len(morph_frames) > 0:
+        # 読み込み時のまま出力するキーフレ（未展開・未変更）
+        raw_bone_offsets = self.data_set.motion.get_raw_bone_offsets()
+        raw_morph_offsets = self.data_set.motion.get_raw_morph_offsets()
+        raw_bone_cnt = len(raw_bone_offsets)
+        raw_morph_cnt = len(raw_morph_offsets)
+
+        if len(bone_frames) + raw_bone_cnt > 0 or len(morph_frames) + raw_morph_cnt > 0:
             try:
                 # モデル名を20byteで切る
                 model_bname = self.data_set.rep_model.name.encode('cp932').decode('shift_jis').encode('shift_jis')[:20]
@@ -39,12 +45,16 @@ class VmdWriter():
             fout.write(b'\x83J\x83\x81\x83\x89\x81E\x8f\xc6\x96\xbe\x00on Data')
         
         # bone frames
-        fout.write(struct.pack('<L', len(bone_frames)))  # ボーンフレーム数
+        fout.write(struct.pack('<L', len(bone_frames) + raw_bone_cnt))  # ボーンフレーム数
         for bf in bone_frames:
             bf.write(fout)
-        fout.write(struct.pack('<L', len(morph_frames)))  # 表情キーフレーム数
+        # 未展開・未変更のボーンフレームは読み込み時のまま出力
+        self.data_set.motion.write_raw_bone_frames(fout, raw_bone_offsets)
+        fout.write(struct.pack('<L', len(morph_frames) + raw_morph_cnt))  # 表情キーフレーム数
         for mf in morph_frames:
             mf.write(fout)
+        # 未展開・未変更の表情フレームは読み込み時のまま出力
+        self.data_set.motion.write_raw_morph_frames(fout, raw_morph_offsets)
         fout.write(struct.pack('<L', len(camera_frames)))  # カメラキーフレーム数
         for cf in camera_frames:
             cf.write(fout)
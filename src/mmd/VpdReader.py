@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 #
+import glob
 import hashlib
+import os
 import re
 
 from mmd.VmdData import VmdMotion, VmdBoneFrame, VmdCameraFrame, VmdInfoIk, VmdLightFrame, VmdMorphFrame, VmdShadowFrame, VmdShowIkFrame # noqa
 from module.MMath import MRect, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
 from utils.MException import MParseException # noqa
+from utils import MFileUtils
 from utils.MLogger import MLogger # noqa
 from utils.MException import SizingException, MKilledException
 
@@ -13,105 +16,87 @@ logger = MLogger(__name__)
 
 
 class VpdReader():
+    # 数値（小数点必須）
+    NUMBER_PATTERN = r'([+-]?\d+(?:\.\d+))'
+
+    # 各パターン（括弧はひとつのみ実体として取得する）をひとつにまとめ、本文を一度だけ走査する
+    # 同じ行に複数合致する場合は、モデル名 > 括弧開始 > 位置 > 角度 > 括弧終了 の優先
+    TOKEN_PATTERN = re.compile(
+        r'^(?P<model>.*)(?:\.osm;)(?:.*// 親ファイル名.*)$'
+        + r'|^(?:.*)(?:{)(?P<bone>.*)$'
+        + r'|(?P<pos>{0}(?:,){0}(?:,){0})(?:;)(?:.*trans.*)$'.format(NUMBER_PATTERN)
+        + r'|(?P<rot>{0}(?:,){0}(?:,){0}(?:,){0})(?:;)(?:.*Quaternion.*)$'.format(NUMBER_PATTERN)
+        + r'|(?P<end>})',
+        flags=re.IGNORECASE | re.MULTILINE,
+    )
+
+    # ヘッダ取得時に読み込むバイト数
+    METADATA_READ_SIZE = 4096
+    # モデル名行
+    MODEL_NAME_PATTERN = re.compile(r'(.*)(\.osm;.*)', flags=re.IGNORECASE)
+    # ボーン数行
+    BONE_CNT_PATTERN = re.compile(r'^\s*(\d+)\s*;')
+
     def __init__(self, file_path):
         self.encoding = None
         self.file_path = file_path
+        # 読み込んだファイルの中身（ハッシュ計算と解析で共有する）
+        self.buffer = None
+        # 中身を読む前のファイル情報（ハッシュ値キャッシュ用）
+        self.buffer_stat = None
+
+    # 読み込み結果に影響するオプション（VPDは指定なし）
+    def get_load_options(self):
+        return ()
 
     # モデル名だけ取得
     def read_model_name(self):
-        # VPDファイルを通常読み込み
-        lines = []
+        return self.read_metadata()["model_name"]
+
+    # ヘッダ・モデル名・ボーン数だけ取得（先頭の決まったサイズだけ読む）
+    def read_metadata(self):
+        metadata = {"file_size": os.path.getsize(self.file_path), "signature": "", "model_name": "VPDデータ解析失敗", "bone_cnt": 0}
 
-        with open(self.file_path, "r", encoding=self.get_file_encoding(self.file_path)) as f:
-            lines = f.readlines()
+        with open(self.file_path, "rb") as f:
+            fbytes = f.read(self.METADATA_READ_SIZE)
+
+        lines = self.decode_head(fbytes).replace("\r\n", "\n").replace("\r", "\n").split("\n")
 
         if len(lines) > 0:
             # vpdバージョン
-            signature = lines[0]
-            logger.test("signature %s", signature)
-
-        model_name_pattern = re.compile(r'(.*)(\.osm;.*)', flags=re.IGNORECASE)
+            metadata["signature"] = lines[0]
+            logger.test("signature %s", metadata["signature"])
 
-        for n in range(len(lines)):
-            # モデル名
-            if "// 親ファイル名" in lines[n]:
-                m = re.search(model_name_pattern, lines[n])
-                if len(m.groups()) > 0:
-                    return m.groups()[0]
+        for line in lines:
+            if "// 親ファイル名" in line:
+                # モデル名
+                m = self.MODEL_NAME_PATTERN.search(line)
+                if m:
+                    metadata["model_name"] = m.groups()[0]
+            elif "// 総ポーズボーン数" in line:
+                # ボーン数
+                m = self.BONE_CNT_PATTERN.search(line)
+                if m:
+                    metadata["bone_cnt"] = int(m.groups()[0])
+                break
+
+        return metadata
+
+    # ファイル先頭のバイト列を文字列にする（途中で切れた末尾の文字は捨てる）
+    def decode_head(self, fbytes):
+        for encoding in ('shift-jis', 'utf_8'):
+            try:
+                return fbytes.decode(encoding)
+            except UnicodeDecodeError as e:
+                if e.start >= len(fbytes) - 3:
+                    # 読み込みサイズの境界で文字が切れている場合、そこまでを採用
+                    return fbytes[:e.start].decode(encoding)
 
-        return "VPDデータ解析失敗"
+        raise MParseException("unknown encoding!")
 
     def read_data(self):
-        # VPDファイルを通常読み込み
-        lines = []
-
         try:
-            with open(self.file_path, "r", encoding=self.get_file_encoding(self.file_path)) as f:
-                lines = f.readlines()
-
-            if len(lines) > 0:
-                # vpdバージョン
-                signature = lines[0]
-                logger.test("signature %s", signature)
-
-            motion = VmdMotion()
-            # モーション数(常に1)
-            motion.motion_cnt = 1
-            motion.last_motion_frame = 0
-
-            # 各パターン（括弧はひとつのみ実体として取得する）
-            model_name_pattern = re.compile(r'(.*)(?:\.osm;)(?:.*// 親ファイル名.*)', flags=re.IGNORECASE)
-            bone_start_pattern = re.compile(r'(?:.*)(?:{)(.*)', flags=re.IGNORECASE)
-            bone_pos_pattern = re.compile(r'([+-]?\d+(?:\.\d+))(?:,)([+-]?\d+(?:\.\d+))(?:,)([+-]?\d+(?:\.\d+))(?:;)(?:.*trans.*)', flags=re.IGNORECASE)
-            bone_rot_pattern = re.compile(r'([+-]?\d+(?:\.\d+))(?:,)([+-]?\d+(?:\.\d+))(?:,)([+-]?\d+(?:\.\d+))(?:,)([+-]?\d+(?:\.\d+))(?:;)(?:.*Quaternion.*)', flags=re.IGNORECASE)
-            bone_end_pattern = re.compile(r'(?:.*)(})(?:.*)', flags=re.IGNORECASE)
-
-            frame = None
-
-            for n in range(len(lines)):
-                # モデル名
-                result_values = self.read_line(lines[n], model_name_pattern, n)
-                if result_values:
-                    motion.model_name = result_values[0]
-
-                    continue
-                
-                # 括弧開始
-                result_values = self.read_line(lines[n], bone_start_pattern, n)
-                if result_values:
-                    bone_name = result_values[0]
-                    
-                    # キーフレ生成
-                    frame = VmdBoneFrame(0)
-                    frame.set_name(bone_name)
-                    frame.key = True
-                    frame.read = True
-
-                    continue
-                
-                if frame:
-                    # 括弧内のチェック
-                    
-                    # 位置
-                    result_values = self.read_line(lines[n], bone_pos_pattern, n)
-                    if result_values:
-                        # 位置X,Y,Z
-                        frame.position = MVector3D(float(result_values[0]), float(result_values[1]), float(result_values[2]))
-                        continue
-                    
-                    # 角度
-                    result_values = self.read_line(lines[n], bone_rot_pattern, n)
-                    if result_values:
-                        # 回転scalar,X,Y,Z
-                        frame.rotation = MQuaternion(float(result_values[3]), float(result_values[0]), float(result_values[1]), float(result_values[2]))
-                        continue
-
-                    # 括弧終了
-                    result_values = self.read_line(lines[n], bone_end_pattern, n)
-                    if result_values:
-                        motion.bones[bone_name] = {0: frame}
-                        frame = None
-                        continue
+            motion = self.parse_text(self.read_text())
 
             # ハッシュを設定
             motion.digest = self.hexdigest()
@@ -129,38 +114,121 @@ class VpdReader():
             logger.critical("VPD読み込み処理が意図せぬエラーで終了しました。\n\n%s", traceback.format_exc(), decoration=MLogger.DECORATION_BOX)
             raise e
 
-    # 一行を読み込む
-    def read_line(self, line, test_pattern, n):
-        m = re.search(test_pattern, line)
-        if m and len(m.groups()) > 0:
-            logger.test("line[%s]: %s, m: %s", n, line, m.groups())
-            return m.groups()
+    # VPD本文を解析してモーションを生成する
+    def parse_text(self, text: str):
+        # vpdバージョン
+        signature = text.split("\n", 1)[0]
+        logger.test("signature %s", signature)
+
+        motion = VmdMotion()
+        # モーション数(常に1)
+        motion.motion_cnt = 1
+        motion.last_motion_frame = 0
+
+        frame = None
+        bone_name = None
+
+        for m in self.TOKEN_PATTERN.finditer(text):
+            if m.group("model") is not None:
+                # モデル名
+                motion.model_name = m.group("model")
+            elif m.group("bone") is not None:
+                # 括弧開始
+                bone_name = m.group("bone")
+
+                # キーフレ生成
+                frame = VmdBoneFrame(0)
+                frame.set_name(bone_name)
+                frame.key = True
+                frame.read = True
+            elif frame:
+                # 括弧内のチェック
+                if m.group("pos") is not None:
+                    # 位置X,Y,Z
+                    frame.position = MVector3D(float(m.group(4)), float(m.group(5)), float(m.group(6)))
+                elif m.group("rot") is not None:
+                    # 回転scalar,X,Y,Z
+                    frame.rotation = MQuaternion(float(m.group(11)), float(m.group(8)), float(m.group(9)), float(m.group(10)))
+                elif m.group("end") is not None:
+                    # 括弧終了
+                    motion.bones[bone_name] = {0: frame}
+                    frame = None
+
+        return motion
+
+    # ディレクトリ内のVPDを、ファイル名順に1ポーズ1フレームとしてひとつのモーションに読み込む
+    @classmethod
+    def read_dir_data(cls, dir_path: str):
+        motion = VmdMotion()
+        motion.motion_cnt = 0
+        motion.last_motion_frame = 0
 
-        # 正規表現に合致するのが取れなかった場合、None
-        return None
- 
-    def hexdigest(self):
         sha1 = hashlib.sha1()
 
-        with open(self.file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(2048 * sha1.block_size), b''):
-                sha1.update(chunk)
+        file_paths = sorted([p for p in glob.glob(os.path.join(dir_path, "*.vpd")) if os.path.isfile(p)])
+        for fno, file_path in enumerate(file_paths):
+            reader = cls(file_path)
+            pose_motion = reader.parse_text(reader.read_text())
+
+            if fno == 0:
+                motion.model_name = pose_motion.model_name
+
+            for bone_name, bone_frames in pose_motion.bones.items():
+                frame = bone_frames[0]
+                frame.fno = fno
 
-        sha1.update(chunk)
+                if bone_name not in motion.bones:
+                    motion.bones[bone_name] = {}
+                motion.bones[bone_name][fno] = frame
+                motion.motion_cnt += 1
 
-        # ファイルパスをハッシュに含める
-        sha1.update(self.file_path.encode('utf-8'))
+            motion.last_motion_frame = fno
+            sha1.update(reader.hexdigest().encode('utf-8'))
 
-        return sha1.hexdigest()
+        # ハッシュを設定（各ファイルのハッシュから生成）
+        motion.digest = sha1.hexdigest()
+        logger.test("motion: %s, hash: %s", dir_path, motion.digest)
+
+        return motion
+
+    # ファイルの中身を読み込む（一度読み込んだら使い回す）
+    def read_buffer(self):
+        if self.buffer is None:
+            try:
+                with open(self.file_path, "rb") as f:
+                    self.buffer_stat = os.fstat(f.fileno())
+                    self.buffer = f.read()
+            except Exception:
+                raise MParseException("unknown encoding!")
+
+        return self.buffer
+
+    # ファイルの中身を、判定したエンコードで文字列にする
+    def read_text(self):
+        fbytes = self.read_buffer()
+
+        if not self.encoding:
+            self.encoding = self.get_file_encoding(self.file_path)
+
+        # 改行コードはテキストモードでの読み込みと同じく揃える
+        return fbytes.decode(self.encoding).replace("\r\n", "\n").replace("\r", "\n")
+
+    def hexdigest(self):
+        buffer = self.read_buffer()
+        return MFileUtils.calc_file_digest(self.file_path, buffer, self.buffer_stat)
         
     # ファイルのエンコードを取得する
     def get_file_encoding(self, file_path):
-        try:
-            f = open(file_path, "rb")
-            fbytes = f.read()
-            f.close()
-        except Exception:
-            raise MParseException("unknown encoding!")
+        if file_path == self.file_path:
+            # 自身のファイルの場合、読み込み済みの中身を使う
+            fbytes = self.read_buffer()
+        else:
+            try:
+                f = open(file_path, "rb")
+                fbytes = f.read()
+                f.close()
+            except Exception:
+                raise MParseException("unknown encoding!")
             
         codelst = ('shift-jis', 'utf_8')
         
@@ -175,4 +243,3 @@ class VpdReader():
                 pass
                 
         raise MParseException("unknown encoding!")
-        
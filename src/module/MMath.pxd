@@ -377,3 +377,30 @@ cpdef double get_effective_value(v)
 
 cpdef double get_almost_zero_value(v)
 
+
+
+cpdef np.ndarray qq_list_to_array(list qqs)
+
+cpdef list qq_array_to_list(np.ndarray qq_ary)
+
+cpdef np.ndarray qq_array_multiply(np.ndarray a, np.ndarray b)
+
+cpdef np.ndarray qq_array_inverted(np.ndarray a)
+
+cpdef np.ndarray qq_array_normalized(np.ndarray a)
+
+cpdef np.ndarray qq_array_dot(np.ndarray a, np.ndarray b)
+
+cpdef np.ndarray qq_array_to_matrix(np.ndarray a)
+
+cpdef np.ndarray qq_array_from_matrix(np.ndarray m)
+
+cpdef np.ndarray qq_array_rotate(np.ndarray a, np.ndarray v)
+
+cpdef np.ndarray qq_array_rotation_to(np.ndarray fromv, np.ndarray tov)
+
+cpdef np.ndarray qq_array_to_euler(np.ndarray a)
+
+cpdef np.ndarray qq_array_from_euler(np.ndarray euler)
+
+cpdef np.ndarray vector_array_normalized(np.ndarray v)
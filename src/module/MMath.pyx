@@ -1735,3 +1735,184 @@ cpdef double get_almost_zero_value(v):
     return v
 
 
+
+
+# ----------------------------------------
+# クォータニオン配列（N×4, [w, x, y, z]）の一括計算
+# ----------------------------------------
+
+# MQuaternionのリストから配列を生成
+cpdef np.ndarray qq_list_to_array(list qqs):
+    cdef np.ndarray qq_ary = np.zeros((len(qqs), 4), dtype=np.float64)
+    cdef int n
+    cdef MQuaternion qq
+
+    for n, qq in enumerate(qqs):
+        qq_ary[n] = qq.data().components
+    
+    return qq_ary
+
+# 配列からMQuaternionのリストを生成
+cpdef list qq_array_to_list(np.ndarray qq_ary):
+    return [MQuaternion(qq[0], qq[1], qq[2], qq[3]) for qq in qq_ary.tolist()]
+
+# 積（a * b）
+cpdef np.ndarray qq_array_multiply(np.ndarray a, np.ndarray b):
+    a, b = np.broadcast_arrays(a, b)
+    cdef np.ndarray qq_ary = np.empty(np.shape(a), dtype=np.float64)
+
+    qq_ary[..., 0] = a[..., 0] * b[..., 0] - a[..., 1] * b[..., 1] - a[..., 2] * b[..., 2] - a[..., 3] * b[..., 3]
+    qq_ary[..., 1] = a[..., 0] * b[..., 1] + a[..., 1] * b[..., 0] + a[..., 2] * b[..., 3] - a[..., 3] * b[..., 2]
+    qq_ary[..., 2] = a[..., 0] * b[..., 2] - a[..., 1] * b[..., 3] + a[..., 2] * b[..., 0] + a[..., 3] * b[..., 1]
+    qq_ary[..., 3] = a[..., 0] * b[..., 3] + a[..., 1] * b[..., 2] - a[..., 2] * b[..., 1] + a[..., 3] * b[..., 0]
+
+    return qq_ary
+
+# 逆回転
+cpdef np.ndarray qq_array_inverted(np.ndarray a):
+    cdef np.ndarray qq_ary = a * np.array([1, -1, -1, -1], dtype=np.float64)
+    cdef np.ndarray length_sq = np.sum(a ** 2, axis=-1, keepdims=True)
+
+    return np.divide(qq_ary, length_sq, out=np.zeros_like(qq_ary), where=length_sq > 0)
+
+# 正規化（ゼロ長はscalarだけ1にする）
+cpdef np.ndarray qq_array_normalized(np.ndarray a):
+    cdef np.ndarray qq_ary = np.nan_to_num(a, nan=0, posinf=0, neginf=0)
+    cdef np.ndarray length = np.linalg.norm(qq_ary, axis=-1, keepdims=True)
+    cdef np.ndarray is_zero = np.isclose(length[..., 0], 0)
+
+    qq_ary = np.divide(qq_ary, length, out=np.zeros_like(qq_ary), where=length > 0)
+    qq_ary[is_zero] = np.array([1, 0, 0, 0], dtype=np.float64)
+
+    return qq_ary
+
+# 内積
+cpdef np.ndarray qq_array_dot(np.ndarray a, np.ndarray b):
+    return np.sum(a * b, axis=-1)
+
+# 回転行列（N×3×3）
+cpdef np.ndarray qq_array_to_matrix(np.ndarray a):
+    cdef np.ndarray w = a[..., 0]
+    cdef np.ndarray x = a[..., 1]
+    cdef np.ndarray y = a[..., 2]
+    cdef np.ndarray z = a[..., 3]
+    cdef np.ndarray length_sq = w * w + x * x + y * y + z * z
+    cdef np.ndarray mat_ary = np.empty(np.shape(a)[:-1] + (3, 3), dtype=np.float64)
+
+    mat_ary[..., 0, 0] = w * w + x * x - y * y - z * z
+    mat_ary[..., 0, 1] = 2.0 * x * y - 2.0 * w * z
+    mat_ary[..., 0, 2] = 2.0 * x * z + 2.0 * w * y
+    mat_ary[..., 1, 0] = 2.0 * x * y + 2.0 * w * z
+    mat_ary[..., 1, 1] = w * w - x * x + y * y - z * z
+    mat_ary[..., 1, 2] = 2.0 * y * z - 2.0 * w * x
+    mat_ary[..., 2, 0] = 2.0 * x * z - 2.0 * w * y
+    mat_ary[..., 2, 1] = 2.0 * y * z + 2.0 * w * x
+    mat_ary[..., 2, 2] = w * w - x * x - y * y + z * z
+
+    return mat_ary / length_sq[..., np.newaxis, np.newaxis]
+
+# 回転行列からクォータニオン（MMatrix4x4.toQuaternionと同じ符号になる）
+cpdef np.ndarray qq_array_from_matrix(np.ndarray m):
+    cdef np.ndarray qq_ary = np.zeros(np.shape(m)[:-2] + (4,), dtype=np.float64)
+    cdef np.ndarray trace = m[..., 0, 0] + m[..., 1, 1] + m[..., 2, 2]
+    cdef np.ndarray is_trace = trace > 0
+    cdef np.ndarray is_x = np.logical_and(~is_trace, np.logical_and(m[..., 0, 0] > m[..., 1, 1], m[..., 0, 0] > m[..., 2, 2]))
+    cdef np.ndarray is_y = np.logical_and(~is_trace, np.logical_and(~is_x, m[..., 1, 1] > m[..., 2, 2]))
+    cdef np.ndarray is_z = np.logical_and(~is_trace, np.logical_and(~is_x, ~is_y))
+    cdef np.ndarray s, mt
+
+    if is_trace.any():
+        mt = m[is_trace]
+        s = 0.5 / np.sqrt(trace[is_trace] + 1)
+        qq_ary[is_trace] = np.stack([0.25 / s, (mt[:, 2, 1] - mt[:, 1, 2]) * s, (mt[:, 0, 2] - mt[:, 2, 0]) * s, (mt[:, 1, 0] - mt[:, 0, 1]) * s], axis=-1)
+
+    if is_x.any():
+        mt = m[is_x]
+        s = 2 * np.sqrt(1 + mt[:, 0, 0] - mt[:, 1, 1] - mt[:, 2, 2])
+        qq_ary[is_x] = np.stack([(mt[:, 2, 1] - mt[:, 1, 2]) / s, 0.25 * s, (mt[:, 0, 1] + mt[:, 1, 0]) / s, (mt[:, 0, 2] + mt[:, 2, 0]) / s], axis=-1)
+
+    if is_y.any():
+        mt = m[is_y]
+        s = 2 * np.sqrt(1 + mt[:, 1, 1] - mt[:, 0, 0] - mt[:, 2, 2])
+        qq_ary[is_y] = np.stack([(mt[:, 0, 2] - mt[:, 2, 0]) / s, (mt[:, 0, 1] + mt[:, 1, 0]) / s, 0.25 * s, (mt[:, 1, 2] + mt[:, 2, 1]) / s], axis=-1)
+
+    if is_z.any():
+        mt = m[is_z]
+        s = 2 * np.sqrt(1 + mt[:, 2, 2] - mt[:, 0, 0] - mt[:, 1, 1])
+        qq_ary[is_z] = np.stack([(mt[:, 1, 0] - mt[:, 0, 1]) / s, (mt[:, 0, 2] + mt[:, 2, 0]) / s, (mt[:, 1, 2] + mt[:, 2, 1]) / s, 0.25 * s], axis=-1)
+
+    return qq_ary
+
+# ベクトル（N×3 or 3）を回転
+cpdef np.ndarray qq_array_rotate(np.ndarray a, np.ndarray v):
+    return np.einsum('...ij,...j->...i', qq_array_to_matrix(a), v)
+
+# fromv から tov への回転量（MQuaternion.rotationToの一括版）
+cpdef np.ndarray qq_array_rotation_to(np.ndarray fromv, np.ndarray tov):
+    fromv, tov = np.broadcast_arrays(fromv, tov)
+    cdef np.ndarray v0 = vector_array_normalized(fromv)
+    cdef np.ndarray v1 = vector_array_normalized(tov)
+    cdef np.ndarray d = np.sum(v0 * v1, axis=-1) + 1.0
+    cdef np.ndarray is_inverse = np.abs(d) < 0.0000001
+    cdef np.ndarray qq_ary = np.zeros(np.shape(v0)[:-1] + (4,), dtype=np.float64)
+    cdef np.ndarray axis, sd, is_null_axis
+
+    sd = np.sqrt(2.0 * np.where(is_inverse, 1, d))
+    qq_ary[..., 0] = sd * 0.5
+    qq_ary[..., 1:] = np.cross(v0, v1) / sd[..., np.newaxis]
+
+    if is_inverse.any():
+        # 逆向きの場合、どの軸でもよいので直交軸で180度回す
+        axis = np.cross(np.array([1.0, 0.0, 0.0]), v0[is_inverse])
+        is_null_axis = np.sum(axis ** 2, axis=-1) < 0.0000001
+        axis[is_null_axis] = np.cross(np.array([0.0, 1.0, 0.0]), v0[is_inverse][is_null_axis])
+        qq_ary[is_inverse, 0] = 0
+        qq_ary[is_inverse, 1:] = vector_array_normalized(axis)
+
+    return qq_array_normalized(qq_ary)
+
+# オイラー角（度, N×3）に変換（MQuaternion.toEulerAnglesの一括版）
+cpdef np.ndarray qq_array_to_euler(np.ndarray a):
+    cdef np.ndarray w = a[..., 0]
+    cdef np.ndarray x = a[..., 1]
+    cdef np.ndarray y = a[..., 2]
+    cdef np.ndarray z = a[..., 3]
+    cdef np.ndarray length_sq = x * x + y * y + z * z + w * w
+    cdef np.ndarray scale = np.where(np.logical_or(np.abs(length_sq - 1.0) < 0.0000001, np.abs(length_sq) < 0.0000001), 1.0, length_sq)
+
+    cdef np.ndarray xx = x * x / scale
+    cdef np.ndarray xy = x * y / scale
+    cdef np.ndarray xz = x * z / scale
+    cdef np.ndarray xw = x * w / scale
+    cdef np.ndarray yy = y * y / scale
+    cdef np.ndarray yz = y * z / scale
+    cdef np.ndarray yw = y * w / scale
+    cdef np.ndarray zz = z * z / scale
+    cdef np.ndarray zw = z * w / scale
+
+    cdef np.ndarray pitch = np.arcsin(np.clip(-2.0 * (yz - xw), -1, 1))
+    cdef np.ndarray is_normal = np.logical_and(pitch < (pi / 2), pitch > -(pi / 2))
+    cdef np.ndarray singular_yaw = np.arctan2(-2.0 * (xy - zw), 1.0 - 2.0 * (yy + zz))
+    cdef np.ndarray yaw = np.where(is_normal, np.arctan2(2.0 * (xz + yw), 1.0 - 2.0 * (xx + yy)), np.where(pitch < (pi / 2), -singular_yaw, singular_yaw))
+    cdef np.ndarray roll = np.where(is_normal, np.arctan2(2.0 * (xy + zw), 1.0 - 2.0 * (xx + zz)), 0.0)
+
+    return np.degrees(np.stack([pitch, yaw, roll], axis=-1))
+
+# オイラー角（度, N×3）から生成（MQuaternion.fromEulerAnglesの一括版）
+cpdef np.ndarray qq_array_from_euler(np.ndarray euler):
+    cdef np.ndarray half = np.radians(euler) * 0.5
+    cdef np.ndarray c1 = np.cos(half[..., 1])
+    cdef np.ndarray s1 = np.sin(half[..., 1])
+    cdef np.ndarray c2 = np.cos(half[..., 2])
+    cdef np.ndarray s2 = np.sin(half[..., 2])
+    cdef np.ndarray c3 = np.cos(half[..., 0])
+    cdef np.ndarray s3 = np.sin(half[..., 0])
+    cdef np.ndarray c1c2 = c1 * c2
+    cdef np.ndarray s1s2 = s1 * s2
+
+    return np.stack([c1c2 * c3 + s1s2 * s3, c1c2 * s3 + s1s2 * c3, s1 * c2 * c3 - c1 * s2 * s3, c1 * s2 * c3 - s1 * c2 * s3], axis=-1)
+
+# ベクトル配列の正規化
+cpdef np.ndarray vector_array_normalized(np.ndarray v):
+    cdef np.ndarray length = np.linalg.norm(v, axis=-1, keepdims=True)
+    return np.divide(v, length, out=np.zeros(np.shape(v), dtype=np.float64), where=length > 0)
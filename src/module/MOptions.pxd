@@ -34,7 +34,7 @@ cdef class MOptionsDataSet():
     cdef public float camera_offset_y
     cdef public list selected_stance_details
 
-    cdef public VmdMotion org_motion
+    cdef VmdMotion _org_motion
     cdef public dict test_params
     cdef public bint full_arms
 
@@ -38,7 +38,8 @@ cdef class MOptionsDataSet:
         self.camera_offset_y = camera_offset_y
         self.selected_stance_details = selected_stance_details
 
-        self.org_motion = self.motion.copy()
+        # 元モーションは参照された時に初めてコピーする
+        self._org_motion = None
         self.test_params = None
         self.full_arms = False
 
@@ -50,6 +51,17 @@ cdef class MOptionsDataSet:
         self.xz_ratio = 1
         self.y_ratio = 1
 
+    # 元モーション（初回参照時にその時点のモーションをコピーして保持）
+    @property
+    def org_motion(self):
+        if self._org_motion is None:
+            self._org_motion = self.motion.copy()
+        return self._org_motion
+
+    @org_motion.setter
+    def org_motion(self, VmdMotion org_motion):
+        self._org_motion = org_motion
+
 
 cdef class MParentOptions:
 
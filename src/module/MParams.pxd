@@ -3,4 +3,8 @@
 
 cdef class BoneLinks:
     cdef dict __links
+    cdef list __names
+    cdef list __bones
+    cdef dict __indexes
+    cdef list __relative_positions
 
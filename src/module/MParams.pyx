@@ -5,31 +5,55 @@
 cdef class BoneLinks:
 
     def __init__(self):
+        # リンク（キー：ボーン名、値：ボーン）
         self.__links = {}
+        # リンク順のボーン名リスト
+        self.__names = []
+        # リンク順のボーンリスト
+        self.__bones = []
+        # リンク内INDEX（キー：ボーン名、値：リンク内INDEX）
+        self.__indexes = {}
+        # 親からの相対位置リスト（追加時にクリア）
+        self.__relative_positions = None
     
     def get(self, bone_name: str, offset=0):
-        if bone_name not in self.__links:
+        if bone_name not in self.__indexes:
             return None
         if offset == 0:
             # オフセットなしの場合、そのまま返す
             return self.__links[bone_name]
         else:
             # オフセットありの場合、その分ずらす
-            target_bone_index = self.index(bone_name)
-            
-            # オフセット加味して、該当INDEXを探す
-            for lidx, lkey in enumerate(self.__links.keys()):
-                if lidx == target_bone_index + offset:
-                    return self.__links[lkey]
-        
-        return None
+            return self.get_by_index(self.__indexes[bone_name] + offset)
+    
+    # リンク内INDEXのボーンを取得
+    def get_by_index(self, link_idx: int):
+        if link_idx < 0 or link_idx >= len(self.__bones):
+            return None
+
+        return self.__bones[link_idx]
     
     def all(self):
         return self.__links
 
+    # リンク順のボーン名リスト
+    def names(self):
+        return self.__names
+
     # リンクに追加
-    def append(self, bone):
-        self.__links[bone.name] = bone.copy()
+    def append(self, bone, is_copy=True):
+        cdef object link_bone = bone.copy() if is_copy else bone
+
+        if link_bone.name in self.__indexes:
+            # 既に同じボーン名がある場合、位置はそのままで差し替え
+            self.__bones[self.__indexes[link_bone.name]] = link_bone
+        else:
+            self.__indexes[link_bone.name] = len(self.__names)
+            self.__names.append(link_bone.name)
+            self.__bones.append(link_bone)
+
+        self.__links[link_bone.name] = link_bone
+        self.__relative_positions = None
     
     # リンクの反転
     def reversed(self):
@@ -37,14 +61,22 @@ cdef class BoneLinks:
     
     # リンクの大きさ
     def size(self):
-        return len(self.__links.keys())
+        return len(self.__names)
     
     # 指定されたボーン名までのインデックス
     def index(self, bone_name: str):
-        for lidx, lkey in enumerate(self.__links.keys()):
-            if lkey == bone_name:
-                return lidx
-        return -1
+        if bone_name not in self.__indexes:
+            return -1
+
+        return self.__indexes[bone_name]
+
+    # 親からの相対位置リスト（一番親はボーン位置そのもの）
+    def relative_positions(self):
+        if self.__relative_positions is None:
+            self.__relative_positions = [bone.position if lidx == 0 else bone.position - self.__bones[lidx - 1].position \
+                                         for lidx, bone in enumerate(self.__bones)]
+
+        return self.__relative_positions
 
     # 指定されたボーン名までのリンクを取得
     def from_links(self, bone_name: str):
@@ -78,31 +110,31 @@ cdef class BoneLinks:
                 
     # 最後のリンク名を取得する
     def last_name(self):
-        if not self.__links:
+        if not self.__names:
             return ""
 
-        return list(self.__links.keys())[-1]
+        return self.__names[-1]
     
     # 最後のリンク名を取得する
     def last_display_name(self):
-        if not self.__links:
+        if not self.__names:
             return ""
 
-        return list(self.__links.keys())[-1].replace("実体", "")
+        return self.__names[-1].replace("実体", "")
 
     # 最初のリンク名を取得する
     def first_name(self):
-        if not self.__links:
+        if not self.__names:
             return ""
 
-        return list(self.__links.keys())[0]
+        return self.__names[0]
 
     # 最初のリンク名を取得する
     def first_display_name(self):
-        if not self.__links:
+        if not self.__names:
             return ""
 
-        return list(self.__links.keys())[0].replace("実体", "")
+        return self.__names[0].replace("実体", "")
 
     # 指定されたボーン名のみを入れたリンクを取得
     def pickup_links(self, bone_names: list):
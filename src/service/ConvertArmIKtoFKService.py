@@ -4,9 +4,10 @@ import math
 import numpy as np
 import logging
 import os
+import threading
 import traceback
 import concurrent.futures
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from module.MOptions import MArmIKtoFKOptions, MOptionsDataSet
 from mmd.PmxData import PmxModel, Bone # noqa
@@ -22,8 +23,15 @@ logger = MLogger(__name__, level=1)
 
 
 class ConvertArmIKtoFKService():
+    # プロセス並列でIKを解く場合の1チャンクあたりのフレーム数
+    IK_CHUNK_SIZE = 300
+    # プロセス並列でIKを解く場合に、停止命令を確認する間隔（秒）
+    IK_KILL_CHECK_INTERVAL = 0.5
+
     def __init__(self, options: MArmIKtoFKOptions):
         self.options = options
+        # 腕ごとのIK計算プロセス数
+        self.ik_process_cnt = 1
 
     def execute(self):
         logging.basicConfig(level=self.options.logging_level, format="%(message)s [%(module_name)s]")
@@ -62,11 +70,16 @@ class ConvertArmIKtoFKService():
     def convert_ik2fk(self):
         futures = []
 
+        # 腕IK系のボーン
+        ik_bones = [bone for bone in self.options.ik_model.bones.values() if bone.name in ["右腕ＩＫ", "右腕IK", "左腕ＩＫ", "左腕IK"]]
+
+        # 腕ごとに並行してIK計算プロセスを立ち上げるので、両腕合わせて max_workers 以内に収める
+        self.ik_process_cnt = max(1, self.options.max_workers // max(1, len(ik_bones)))
+
         with ThreadPoolExecutor(thread_name_prefix="ik2fk", max_workers=self.options.max_workers) as executor:
-            for bone in self.options.ik_model.bones.values():
-                if "右腕ＩＫ" == bone.name or "右腕IK" == bone.name or "左腕ＩＫ" == bone.name or "左腕IK" == bone.name:
-                    # 腕IK系の場合、処理開始
-                    futures.append(executor.submit(self.convert_target_ik2fk, bone))
+            for bone in ik_bones:
+                # 腕IK系の場合、処理開始
+                futures.append(executor.submit(self.convert_target_ik2fk, bone))
 
         concurrent.futures.wait(futures, timeout=None, return_when=concurrent.futures.FIRST_EXCEPTION)
 
@@ -221,39 +234,116 @@ class ConvertArmIKtoFKService():
         if wrist_twist_bone_name in motion.bones:
             del motion.bones[wrist_twist_bone_name]
 
-        prev_sep_fno = 0
-        for fidx, fno in enumerate(fnos):
-            # グローバル位置計算(元モーションの位置)
-            target_ik_global_3ds = MServiceUtils.calc_global_pos(ik_model, target_links, org_motion, fno)
-            target_effector_pos = target_ik_global_3ds[bone_name]
-
-            # IK計算実行
-            MServiceUtils.calc_IK(ik_model, effector_links, fk_motion, fno, target_effector_pos, ik_links, max_count=10)
+        # 手首FK再計算の準備（IK計算時に手首の補正回転も合わせて求める）
+        wrist_tail_ik_links, wrist_tail_fk_links, wrist_tail_ik_bone_name, wrist_tail_fk_bone_name = self.prepare_wrist_fk(ik_bone, transferee_bone)
 
-            # 現在のエフェクタ位置
-            now_global_3ds = MServiceUtils.calc_global_pos(ik_model, transferee_links, fk_motion, fno)
-            now_effector_pos = now_global_3ds[transferee_bone.name]
-            logger.debug("(%s) target_effector_pos: %s [%s] ------------------", fno, bone_name, target_effector_pos.to_log())
-            logger.debug("(%s) now_effector_pos: %s [%s]", fno, bone_name, now_effector_pos.to_log())
+        if self.options.max_workers > 1 and len(fnos) > self.IK_CHUNK_SIZE:
+            # フレーム範囲をチャンクに分けて、別プロセスでIKを解く
+            ik_rotations, transferee_qqs = self.solve_ik_parallel(bone_name, target_links, effector_links, ik_links, transferee_links, transferee_bone.name, \
+                                                                  wrist_tail_ik_links, wrist_tail_fk_links, wrist_tail_ik_bone_name, wrist_tail_fk_bone_name, org_motion, fk_motion, fnos)
+        else:
+            ik_rotations, transferee_qqs = solve_ik(ik_model, fk_model, bone_name, target_links, effector_links, ik_links, transferee_links, transferee_bone.name, \
+                                                    wrist_tail_ik_links, wrist_tail_fk_links, wrist_tail_ik_bone_name, wrist_tail_fk_bone_name, org_motion, fk_motion, fnos)
 
+        prev_sep_fno = 0
+        for fidx, fno in enumerate(fnos):
             for link_name in list(ik_links.all().keys())[1:]:
-                fk_bf = fk_motion.calc_bf(link_name, fno)
-                logger.debug("確定bf(%s): %s [%s]", fno, link_name, fk_bf.rotation.toEulerAngles4MMD().to_log())
-
                 # 確定した角度をそのまま登録
                 bf = motion.calc_bf(link_name, fno)
-                bf.rotation = fk_bf.rotation.copy()
+                bf.rotation = ik_rotations[link_name][fno].copy()
                 motion.regist_bf(bf, link_name, fno)
 
+            # 移管先ボーンの回転に置き換え(変換後モーション)
+            transferee_bf = motion.calc_bf(transferee_bone.name, fno)
+            transferee_bf.rotation *= transferee_qqs[fno]
+            motion.regist_bf(transferee_bf, transferee_bf.name, fno)
+
             if fno // 500 > prev_sep_fno:
                 logger.count("【腕ＩＫ変換 - {0}】".format(bone_name), fno, fnos)
                 prev_sep_fno = fno // 500
 
-        # 終わったら手首FK再計算
-        self.recalc_wrist_fk(ik_bone, target_links, effector_links, fnos, org_motion, effector_bone)
-
         return True
 
+    # フレーム範囲をチャンクに分けて、別プロセスでIKを解く
+    def solve_ik_parallel(self, bone_name: str, target_links: BoneLinks, effector_links: BoneLinks, ik_links: BoneLinks, transferee_links: BoneLinks, \
+                          transferee_bone_name: str, wrist_tail_ik_links: BoneLinks, wrist_tail_fk_links: BoneLinks, wrist_tail_ik_bone_name: str, \
+                          wrist_tail_fk_bone_name: str, org_motion: VmdMotion, fk_motion: VmdMotion, fnos: list):
+        ik_model = self.options.ik_model
+        fk_model = self.options.fk_model
+
+        # 子プロセスに渡すのは、計算に使うボーンだけのモーション（読み込み元バイト列は渡さない）
+        org_snapshot = self.create_motion_snapshot(org_motion, (ik_model, target_links), (ik_model, wrist_tail_ik_links))
+        fk_snapshot = self.create_motion_snapshot(fk_motion, (ik_model, effector_links), (ik_model, transferee_links), (fk_model, wrist_tail_fk_links))
+
+        ik_rotations = {link_name: {} for link_name in list(ik_links.all().keys())[1:]}
+        transferee_qqs = {}
+        futures = set()
+
+        # モデル・モーション等はプロセス生成時に一度だけ渡し、チャンクごとにはフレーム番号だけ渡す
+        ik_process_args = (ik_model, fk_model, bone_name, target_links, effector_links, ik_links, transferee_links, transferee_bone_name, \
+                           wrist_tail_ik_links, wrist_tail_fk_links, wrist_tail_ik_bone_name, wrist_tail_fk_bone_name, org_snapshot, fk_snapshot)
+        chunks = [fnos[chunk_idx:(chunk_idx + self.IK_CHUNK_SIZE)] for chunk_idx in range(0, len(fnos), self.IK_CHUNK_SIZE)]
+        process_cnt = min(self.ik_process_cnt, len(chunks))
+
+        executor = ProcessPoolExecutor(max_workers=process_cnt, initializer=init_ik_process, initargs=ik_process_args)
+        try:
+            while chunks or futures:
+                # 停止命令は子プロセスには届かないので、ここで確認する
+                if is_killed():
+                    raise MKilledException()
+
+                # 停止時に待たずに済むよう、投入するチャンクはプロセス数の倍までにする
+                while chunks and len(futures) < process_cnt * 2:
+                    futures.add(executor.submit(solve_ik_chunk, chunks.pop(0)))
+
+                done_futures, futures = concurrent.futures.wait(futures, timeout=self.IK_KILL_CHECK_INTERVAL, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for f in done_futures:
+                    # チャンクごとの確定回転をまとめる
+                    chunk_ik_rotations, chunk_transferee_qqs = f.result()
+                    for link_name, chunk_rotations in chunk_ik_rotations.items():
+                        ik_rotations[link_name].update(chunk_rotations)
+                    transferee_qqs.update(chunk_transferee_qqs)
+
+                    logger.count("【腕ＩＫ計算 - {0}】".format(bone_name), max(list(chunk_transferee_qqs.keys())), fnos)
+        except BaseException:
+            # 停止・エラー時は、未実行のチャンクを取り消して、実行中のチャンクの終了も待たない
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+        executor.shutdown(wait=True)
+
+        return ik_rotations, transferee_qqs
+
+    # リンクに含まれるボーン（付与親を含む）のキーフレだけを持つモーションを生成する
+    # model_links_list: (モデル, リンク)のリスト
+    def create_motion_snapshot(self, motion: VmdMotion, *model_links_list):
+        bone_names = []
+        for model, links in model_links_list:
+            for link_name in links.all().keys():
+                bone_names.append(link_name)
+
+                # 付与親も回転計算に使うので含める
+                bone = model.bones[link_name] if link_name in model.bones else None
+                cnt = 0
+                while bone and bone.getExternalRotationFlag() and bone.effect_index in model.bone_indexes and cnt < 100:
+                    bone = model.bones[model.bone_indexes[bone.effect_index]]
+                    bone_names.append(bone.name)
+                    cnt += 1
+
+        snapshot = VmdMotion()
+        snapshot.path = motion.path
+        snapshot.last_motion_frame = motion.last_motion_frame
+
+        # 未展開の場合、ここで展開
+        motion.load_bones(*bone_names)
+
+        for bname in set(bone_names):
+            if bname in motion.bones:
+                snapshot.bones[bname] = motion.bones[bname]
+
+        return snapshot
+
     # IKターゲットの回転量移管先を取得
     # 現在のターゲットが表示されてない場合、子で同じ位置にあるのを採用
     def get_transferee_bone(self, ik_bone: Bone, effector_bone: Bone):
@@ -273,17 +363,13 @@ class ConvertArmIKtoFKService():
         # 最後まで取れなければ、とりあえずエフェクタ
         return effector_bone
 
-    # 手首FK再計算
-    def recalc_wrist_fk(self, ik_bone: Bone, target_links: BoneLinks, effector_links: BoneLinks, fnos: int, org_motion: VmdMotion, effector_bone: Bone):
-        motion = self.options.motion
+    # 手首FK再計算の準備
+    # 手首先ボーンを両モデルに生成し、手首先までのリンクを返す
+    def prepare_wrist_fk(self, ik_bone: Bone, transferee_bone: Bone):
         ik_model = self.options.ik_model
         fk_model = self.options.fk_model
         bone_name = ik_bone.name
 
-        logger.info("-- 手首再調整:開始【%s】", bone_name)
-
-        # 回転移管先ボーン(手首)
-        transferee_bone = self.get_transferee_bone(ik_bone, effector_bone)
         # 移管先までのリンク
         transferee_links = fk_model.create_link_2_top_one(transferee_bone.name, is_defined=False)
         # 回転移管先のローカルX軸
@@ -297,8 +383,7 @@ class ConvertArmIKtoFKService():
         # 移管先に親を付ける
         wrist_fk_tail_bone.index = len(fk_model.bones.keys())
         wrist_fk_tail_bone.parent_index = fk_model.bones[transferee_bone.name].index
-        fk_model.bones[wrist_fk_tail_bone.name] = wrist_fk_tail_bone
-        fk_model.bone_indexes[wrist_fk_tail_bone.index] = wrist_fk_tail_bone.name
+        fk_model.append_bone(wrist_fk_tail_bone)
         # 移管先までのリンクを撮り直す
         wrist_tail_fk_links = fk_model.create_link_2_top_one(wrist_fk_tail_bone.name, is_defined=False)
 
@@ -307,57 +392,11 @@ class ConvertArmIKtoFKService():
         # 移管先に親を付ける
         wrist_ik_tail_bone.index = len(ik_model.bones.keys())
         wrist_ik_tail_bone.parent_index = ik_model.bones[transferee_bone.name].index
-        ik_model.bones[wrist_ik_tail_bone.name] = wrist_ik_tail_bone
-        ik_model.bone_indexes[wrist_ik_tail_bone.index] = wrist_ik_tail_bone.name
+        ik_model.append_bone(wrist_ik_tail_bone)
         # IKの先にも延ばす
         wrist_tail_ik_links = ik_model.create_link_2_top_one(wrist_ik_tail_bone.name, is_defined=False)
-        
-        prev_sep_fno = 0
-        for fno_idx, fno in enumerate(fnos):
-            logger.debug(f"f: {fno}, {bone_name} ---------------------")
-
-            # 元モデルデータ --------
-
-            # 元モーションの手首先のグローバル座標と行列
-            org_target_global_3ds = MServiceUtils.calc_global_pos(ik_model, wrist_tail_ik_links, org_motion, fno)
-            # 手首先のグローバル位置
-            org_target_global_wrist_tail_pos = org_target_global_3ds[wrist_ik_tail_bone.name]
-
-            # 手首先までのグローバル座標と行列(腕IKは無視)
-            org_initial_global_3ds, org_initial_matrixs = MServiceUtils.calc_global_pos(fk_model, wrist_tail_fk_links, motion, fno, return_matrix=True)
-            # 手首先の初期グローバル位置を求める
-            org_initial_global_wrist_tail_pos = org_initial_global_3ds[wrist_fk_tail_bone.name]
-            # 手首までの行列
-            org_initial_wrist_matrix = org_initial_matrixs[transferee_bone.name].copy()
-            # 手首の回転
-
-            # 腕IKからみた初期手首先ローカル位置
-            initial_local_arm_ik_pos = org_initial_wrist_matrix.inverted() * org_initial_global_wrist_tail_pos
-            # 腕IKからみた目標手首先ローカル位置
-            target_local_arm_ik_pos = org_initial_wrist_matrix.inverted() * org_target_global_wrist_tail_pos
-
-            transferee_qq = MQuaternion.rotationTo(initial_local_arm_ik_pos.normalized(), target_local_arm_ik_pos.normalized())
-            transferee_qq.normalize()
-
-            logger.debug(f"org_initial_global_wrist_tail_pos: {org_initial_global_wrist_tail_pos.to_log()}")
-            logger.debug(f"org_target_global_wrist_tail_pos: {org_target_global_wrist_tail_pos.to_log()}")
-            logger.debug(f"initial_local_arm_ik_pos: {initial_local_arm_ik_pos.to_log()}")
-            logger.debug(f"target_local_arm_ik_pos: {target_local_arm_ik_pos.to_log()}")
-            logger.debug(f"transferee_qq.rotation: {transferee_qq.toEulerAngles4MMD().to_log()}")
-
-            # 移管先ボーンの回転に置き換え(変換後モーション)
-            transferee_bf = motion.calc_bf(transferee_bone.name, fno)
-            transferee_bf.rotation *= transferee_qq
-
-            # 登録
-            motion.regist_bf(transferee_bf, transferee_bf.name, fno)
-            
-            if fno // 500 > prev_sep_fno:
-                logger.count("【手首再調整 - {0}】".format(bone_name), fno, fnos)
-                prev_sep_fno = fno // 500
-
-        return True
 
+        return wrist_tail_ik_links, wrist_tail_fk_links, wrist_ik_tail_bone.name, wrist_fk_tail_bone.name
 
     # 不要キー削除
     def remove_unnecessary_bf(self, bone_name: str):
@@ -376,3 +415,78 @@ class ConvertArmIKtoFKService():
             logger.critical("腕ＩＫ変換処理が意図せぬエラーで終了しました。\n\n%s", traceback.print_exc(), decoration=MLogger.DECORATION_BOX)
             raise e
 
+
+# 呼び出し元から停止命令が出ているか（MLoggerと同じく、スレッドの停止フラグを見る）
+def is_killed():
+    return "is_killed" in threading.current_thread()._kwargs and threading.current_thread()._kwargs["is_killed"]
+
+
+# IK計算プロセスで使う、チャンク間で共通の引数
+ik_process_args = ()
+
+
+# IK計算プロセスの初期化（チャンク間で共通の引数をプロセスごとに一度だけ受け取る）
+def init_ik_process(*args):
+    global ik_process_args
+    ik_process_args = args
+
+
+# プロセス生成時に受け取った引数で、指定フレームのIKを解く
+def solve_ik_chunk(fnos: list):
+    return solve_ik(*ik_process_args, fnos)
+
+
+# 指定フレームのIKを解き、リンクボーンごとの確定回転と、手首（回転移管先）の補正回転を返す
+# フレーム同士は独立しているので、チャンク単位で別プロセスから呼び出してもよい
+def solve_ik(ik_model: PmxModel, fk_model: PmxModel, bone_name: str, target_links: BoneLinks, effector_links: BoneLinks, ik_links: BoneLinks, transferee_links: BoneLinks, \
+             transferee_bone_name: str, wrist_tail_ik_links: BoneLinks, wrist_tail_fk_links: BoneLinks, wrist_tail_ik_bone_name: str, wrist_tail_fk_bone_name: str, \
+             org_motion: VmdMotion, fk_motion: VmdMotion, fnos: list):
+    ik_rotations = {link_name: {} for link_name in list(ik_links.all().keys())[1:]}
+    transferee_qqs = {}
+
+    for fno in fnos:
+        # グローバル位置計算(元モーションの位置)
+        target_ik_global_3ds = MServiceUtils.calc_global_pos(ik_model, target_links, org_motion, fno)
+        target_effector_pos = target_ik_global_3ds[bone_name]
+
+        # IK計算実行
+        MServiceUtils.calc_IK(ik_model, effector_links, fk_motion, fno, target_effector_pos, ik_links, max_count=10)
+
+        # 現在のエフェクタ位置
+        now_global_3ds = MServiceUtils.calc_global_pos(ik_model, transferee_links, fk_motion, fno)
+        now_effector_pos = now_global_3ds[transferee_bone_name]
+        logger.debug("(%s) target_effector_pos: %s [%s] ------------------", fno, bone_name, target_effector_pos.to_log())
+        logger.debug("(%s) now_effector_pos: %s [%s]", fno, bone_name, now_effector_pos.to_log())
+
+        for link_name in ik_rotations.keys():
+            fk_bf = fk_motion.calc_bf(link_name, fno)
+            logger.debug("確定bf(%s): %s [%s]", fno, link_name, fk_bf.rotation.toEulerAngles4MMD().to_log())
+
+            ik_rotations[link_name][fno] = fk_bf.rotation.copy()
+
+        # 手首再調整 --------
+        # IK確定後のfk_motionは、登録後の変換後モーションと同じ回転を持つので、そのまま手首先の行列を求める
+
+        # 元モーションの手首先のグローバル位置
+        org_target_global_3ds = MServiceUtils.calc_global_pos(ik_model, wrist_tail_ik_links, org_motion, fno)
+        org_target_global_wrist_tail_pos = org_target_global_3ds[wrist_tail_ik_bone_name]
+
+        # 手首先までのグローバル座標と行列(腕IKは無視)
+        org_initial_global_3ds, org_initial_matrixs = MServiceUtils.calc_global_pos(fk_model, wrist_tail_fk_links, fk_motion, fno, return_matrix=True)
+        # 手首先の初期グローバル位置を求める
+        org_initial_global_wrist_tail_pos = org_initial_global_3ds[wrist_tail_fk_bone_name]
+        # 手首までの行列
+        org_initial_wrist_matrix = org_initial_matrixs[transferee_bone_name].copy()
+
+        # 腕IKからみた初期手首先ローカル位置
+        initial_local_arm_ik_pos = org_initial_wrist_matrix.inverted() * org_initial_global_wrist_tail_pos
+        # 腕IKからみた目標手首先ローカル位置
+        target_local_arm_ik_pos = org_initial_wrist_matrix.inverted() * org_target_global_wrist_tail_pos
+
+        transferee_qq = MQuaternion.rotationTo(initial_local_arm_ik_pos.normalized(), target_local_arm_ik_pos.normalized())
+        transferee_qq.normalize()
+        logger.debug(f"f: {fno}, transferee_qq.rotation: {transferee_qq.toEulerAngles4MMD().to_log()}")
+
+        transferee_qqs[fno] = transferee_qq
+
+    return ik_rotations, transferee_qqs
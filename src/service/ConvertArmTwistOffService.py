@@ -14,6 +14,7 @@ from mmd.VmdData import VmdMotion, VmdBoneFrame, VmdCameraFrame, VmdInfoIk, VmdL
 from mmd.VmdWriter import VmdWriter
 from module.MParams import BoneLinks # noqa
 from module.MMath import MRect, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
+from module.MMath import qq_list_to_array, qq_array_multiply # noqa
 from utils import MServiceUtils, MBezierUtils # noqa
 from utils.MLogger import MLogger # noqa
 from utils.MException import SizingException, MKilledException
@@ -109,64 +110,45 @@ class ConvertArmTwistOffService():
         elbow_bone_name = f"{direction}ひじ"
         wrist_twist_bone_name = f"{direction}手捩"
         wrist_bone_name = f"{direction}手首"
-        finger_bone_name = f"{direction}人指先実体"
-        finger2_bone_name = f"{direction}小指先実体"
+        # 指先実体は人指３の子なので、頂点から指先を探さずに人指３までのリンクを使う
+        finger_bone_name = f"{direction}人指３"
 
         logger.info(f"-- 捩りOFF変換準備:開始【{bone_name}】")
 
         # モデルの手首までのボーンのリンク
         finger_links = model.create_link_2_top_one(finger_bone_name, is_defined=False)
-        finger2_links = model.create_link_2_top_one(finger2_bone_name, is_defined=False)
         arm2wrist_links = finger_links.to_links(arm_bone_name)
         
         # 差異の大きい箇所にFKキーフレ追加
         fnos = motion.get_differ_fnos(0, list(arm2wrist_links.all().keys()), limit_degrees=20, limit_length=0.5)
 
         # 先に空のキーを登録しておく
-        prev_sep_fno = 0
-        for fno in fnos:
-            for link_name in list(arm2wrist_links.all().keys()):
-                if link_name in motion.bones:
-                    bf = motion.calc_bf(link_name, fno)
-                    motion.regist_bf(bf, link_name, fno)
-
-            if fno // 500 > prev_sep_fno:
-                logger.count(f"【キーフレ追加 - {bone_name}】", fno, fnos)
-                prev_sep_fno = fno // 500
+        for link_name in list(arm2wrist_links.all().keys()):
+            if link_name in motion.bones:
+                motion.regist_bfs(link_name, fnos)
 
         logger.info("-- 捩りOFF変換準備:終了【%s】", bone_name)
 
         # 捩りありの状態で一旦保持
         org_motion = motion.copy()
 
-        prev_sep_fno = 0
-        for fno in fnos:
-            # 腕に腕捩りの結果を加算
-            arm_bf = motion.calc_bf(arm_bone_name, fno)
-            arm_twist_bf = motion.calc_bf(arm_twist_bone_name, fno)
-
-            arm_bf.rotation = arm_bf.rotation * arm_twist_bf.rotation
-            arm_twist_bf.rotation = MQuaternion()
-
-            motion.regist_bf(arm_bf, arm_bone_name, fno)
-            motion.regist_bf(arm_twist_bf, arm_twist_bone_name, fno)
+        # 全フレームの回転を配列でまとめて合成する
+        arm_qqs = qq_list_to_array([motion.calc_bf(arm_bone_name, fno).rotation for fno in fnos])
+        arm_twist_qqs = qq_list_to_array([motion.calc_bf(arm_twist_bone_name, fno).rotation for fno in fnos])
+        wrist_qqs = qq_list_to_array([motion.calc_bf(wrist_bone_name, fno).rotation for fno in fnos])
+        wrist_twist_qqs = qq_list_to_array([motion.calc_bf(wrist_twist_bone_name, fno).rotation for fno in fnos])
+        identity_qqs = np.tile(np.array([1, 0, 0, 0], dtype=np.float64), (len(fnos), 1))
 
-            # 手首に手首捩りの結果を加算
-            wrist_bf = motion.calc_bf(wrist_bone_name, fno)
-            wrist_twist_bf = motion.calc_bf(wrist_twist_bone_name, fno)
+        # 腕に腕捩りの結果を加算
+        motion.regist_bfs(arm_bone_name, fnos, rotations=qq_array_multiply(arm_qqs, arm_twist_qqs))
+        motion.regist_bfs(arm_twist_bone_name, fnos, rotations=identity_qqs)
 
-            # 手捩りの方が根元に近いので、先にかけ算
-            wrist_bf.rotation = wrist_twist_bf.rotation * wrist_bf.rotation
-            wrist_twist_bf.rotation = MQuaternion()
+        # 手首に手首捩りの結果を加算（手捩りの方が根元に近いので、先にかけ算）
+        motion.regist_bfs(wrist_bone_name, fnos, rotations=qq_array_multiply(wrist_twist_qqs, wrist_qqs))
+        motion.regist_bfs(wrist_twist_bone_name, fnos, rotations=identity_qqs)
 
-            motion.regist_bf(wrist_bf, wrist_bone_name, fno)
-            motion.regist_bf(wrist_twist_bf, wrist_twist_bone_name, fno)
+        logger.info("-- 捩りOFF変換:終了【%s】", bone_name)
 
-
-            if fno // 500 > prev_sep_fno:
-                logger.count("【捩りOFF変換 - {0}】".format(bone_name), fno, fnos)
-                prev_sep_fno = fno // 500
-        
         # 腕捩ボーンを削除
         if arm_twist_bone_name in motion.bones:
             del motion.bones[arm_twist_bone_name]
@@ -20,6 +20,9 @@ logger = MLogger(__name__, level=MLogger.INFO)
 
 
 class ConvertLegFKtoIKService():
+    # 接地準備で一度にFKを計算するフレーム数
+    GROUND_CHUNK_SIZE = 1000
+
     def __init__(self, options: MLegFKtoIKOptions):
         self.options = options
 
@@ -109,25 +112,20 @@ class ConvertLegFKtoIKService():
         fnos = motion.get_bone_fnos("左足", "左ひざ", "左足首", "右足", "右ひざ", "右足首", "下半身", center_x_bone_name, center_y_bone_name, center_z_bone_name)
 
         # センター調整
-        prev_sep_fno = 0
-        min_ys = []
-        for fidx, fno in enumerate(fnos):
-            right_fk_3ds = MServiceUtils.calc_global_pos(model, right_fk_links, motion, fno)
-            right_toe_pos = right_fk_3ds["右つま先実体"]
-            right_sole_pos = right_fk_3ds["右足底実体"]
+        # 足底・つま先のY位置を全フレーム分まとめて求める（チャンク単位で一括FK）
+        min_ys = np.zeros(len(fnos) * 4, dtype=np.float64)
+        for chunk_idx in range(0, len(fnos), self.GROUND_CHUNK_SIZE):
+            chunk_fnos = fnos[chunk_idx:(chunk_idx + self.GROUND_CHUNK_SIZE)]
+            # 左右で共通する親ボーンのキーフレは一度だけ求める
+            bone_cache = {}
 
-            left_fk_3ds = MServiceUtils.calc_global_pos(model, left_fk_links, motion, fno)
-            left_toe_pos = left_fk_3ds["左つま先実体"]
-            left_sole_pos = left_fk_3ds["左足底実体"]
+            right_fk_3ds = MServiceUtils.calc_global_pos_array(model, right_fk_links, motion, chunk_fnos, bone_cache)
+            left_fk_3ds = MServiceUtils.calc_global_pos_array(model, left_fk_links, motion, chunk_fnos, bone_cache)
 
-            min_ys.append(right_sole_pos.y())
-            min_ys.append(left_sole_pos.y())
-            min_ys.append(right_toe_pos.y())
-            min_ys.append(left_toe_pos.y())
+            min_ys[(chunk_idx * 4):((chunk_idx + len(chunk_fnos)) * 4)] = np.stack([right_fk_3ds["右足底実体"][:, 1], left_fk_3ds["左足底実体"][:, 1], \
+                                                                                     right_fk_3ds["右つま先実体"][:, 1], left_fk_3ds["左つま先実体"][:, 1]], axis=1).flatten()
 
-            if fno // 500 > prev_sep_fno:
-                logger.count("【足ＩＫ接地準備】", fno, fnos)
-                prev_sep_fno = fno // 500
+            logger.count("【足ＩＫ接地準備】", chunk_fnos[-1], fnos)
 
         # 中央の値は大体接地していると見なす
         median_leg_y = np.median(min_ys)
@@ -247,32 +245,34 @@ class ConvertLegFKtoIKService():
         if self.options.leg_error_tolerance > 0:
             logger.info("足ＩＫブレ固定　【%s足ＩＫ】", direction, decoration=MLogger.DECORATION_LINE)
 
+            # フレームごとのつま先IK・足IKのグローバル位置（ウィンドウ間で使い回し、足IKを変更した範囲のみ破棄する）
+            leg_ik_pos_cache = {}
+
             prev_sep_fno = 0
             for prev_fno, next_fno in zip(fnos[:-3], fnos[3:]):
+                # ウィンドウ内のつま先IK末端・足IKの位置（未計算のフレームだけ一括計算）
+                window_toe_poses, window_sole_poses = \
+                    self.calc_leg_ik_global_poses(toe_ik_links, ik_links, leg_ik_bone_name, toe_ik_bone_name, list(range(prev_fno, next_fno + 1)), leg_ik_pos_cache)
+
                 # つま先IK末端の位置
-                toe_ik_3ds = MServiceUtils.calc_global_pos(model, toe_ik_links, motion, prev_fno)
-                prev_toe_pos = toe_ik_3ds[toe_ik_bone_name]
+                prev_toe_pos = MVector3D(window_toe_poses[0])
 
                 # 足IKの位置
-                sole_ik_3ds = MServiceUtils.calc_global_pos(model, ik_links, motion, prev_fno)
-                prev_sole_pos = sole_ik_3ds[leg_ik_bone_name]
-
-                toe_poses = []
-                sole_poses = []
-                for fno in range(prev_fno + 1, next_fno + 1):
-                    # つま先IK末端の位置(Yはボーンの高さまで無視)
-                    toe_ik_3ds = MServiceUtils.calc_global_pos(model, toe_ik_links, motion, fno)
-                    toe_poses.append(np.array([toe_ik_3ds[toe_ik_bone_name].x(), max(model.bones[toe_ik_bone_name].position.y(), toe_ik_3ds[toe_ik_bone_name].y()), toe_ik_3ds[toe_ik_bone_name].z()]))
-
-                    # 足IKの位置(Yはボーンの高さまで無視)
-                    sole_ik_3ds = MServiceUtils.calc_global_pos(model, ik_links, motion, fno)
-                    sole_poses.append(np.array([sole_ik_3ds[leg_ik_bone_name].x(), max(model.bones[leg_ik_bone_name].position.y(), sole_ik_3ds[leg_ik_bone_name].y()), sole_ik_3ds[leg_ik_bone_name].z()]))
+                prev_sole_pos = MVector3D(window_sole_poses[0])
+
+                # つま先IK末端の位置(Yはボーンの高さまで無視)
+                toe_poses = window_toe_poses[1:].copy()
+                toe_poses[:, 1] = np.maximum(model.bones[toe_ik_bone_name].position.y(), toe_poses[:, 1])
+
+                # 足IKの位置(Yはボーンの高さまで無視)
+                sole_poses = window_sole_poses[1:].copy()
+                sole_poses[:, 1] = np.maximum(model.bones[leg_ik_bone_name].position.y(), sole_poses[:, 1])
                 
                 # つま先IKの二点間距離
-                toe_distances = np.linalg.norm(np.array(toe_poses) - prev_toe_pos.data(), ord=2, axis=1)
+                toe_distances = np.linalg.norm(toe_poses - prev_toe_pos.data(), ord=2, axis=1)
                 
                 # 足IKの二点間距離
-                sole_distances = np.linalg.norm(np.array(sole_poses) - prev_sole_pos.data(), ord=2, axis=1)
+                sole_distances = np.linalg.norm(sole_poses - prev_sole_pos.data(), ord=2, axis=1)
 
                 if np.max(sole_distances) <= self.options.leg_error_tolerance and prev_sole_pos.y() < 0.5 + model.bones[leg_ik_bone_name].position.y():
                     logger.debug("%s足固定(%s-%s): sole: %s", direction, prev_fno, next_fno, sole_distances)
@@ -320,6 +320,9 @@ class ConvertLegFKtoIKService():
                                 
                             motion.regist_bf(bf, leg_ik_bone_name, fno)
 
+                    # 足IKを変更した範囲のグローバル位置は計算し直す
+                    self.clear_leg_ik_global_poses(leg_ik_bone_name, prev_fno, next_fno, leg_ik_pos_cache)
+
                 elif np.max(toe_distances) <= self.options.leg_error_tolerance and prev_sole_pos.y() < 0.5 + model.bones[leg_ik_bone_name].position.y():
                     logger.debug("%sつま先固定(%s-%s): sole: %s", direction, prev_fno, next_fno, toe_distances)
 
@@ -333,6 +336,9 @@ class ConvertLegFKtoIKService():
                         bf = motion.calc_bf(leg_ik_bone_name, fno)
                         bf.position = prev_bf.position.copy() - (toe_pos - prev_toe_pos)
                         motion.regist_bf(bf, leg_ik_bone_name, fno)
+
+                    # 足IKを変更した範囲のグローバル位置は計算し直す
+                    self.clear_leg_ik_global_poses(leg_ik_bone_name, prev_fno, next_fno, leg_ik_pos_cache)
                 else:
                     logger.debug("×%s固定なし(%s-%s): prev: %s, sole: %s, toe: %s", direction, prev_fno, next_fno, prev_sole_pos.to_log(), sole_distances, toe_distances)
 
@@ -352,3 +358,28 @@ class ConvertLegFKtoIKService():
                                                       self.options.model.bones[leg_ik_bone_name].getTranslatable())
         
         return True
+
+    # 指定フレームのつま先IK・足IKのグローバル位置配列（キャッシュにないフレームだけ一括計算する）
+    def calc_leg_ik_global_poses(self, toe_ik_links, ik_links, leg_ik_bone_name: str, toe_ik_bone_name: str, fnos: list, leg_ik_pos_cache: dict):
+        calc_fnos = [fno for fno in fnos if fno not in leg_ik_pos_cache]
+
+        if len(calc_fnos) > 0:
+            bone_cache = {}
+            toe_ik_3ds = MServiceUtils.calc_global_pos_array(self.options.model, toe_ik_links, self.options.motion, calc_fnos, bone_cache)
+            if leg_ik_bone_name in toe_ik_3ds:
+                # つま先IKのリンクが足IKを含む場合、一回のFKで両方求める
+                leg_ik_3ds = toe_ik_3ds
+            else:
+                leg_ik_3ds = MServiceUtils.calc_global_pos_array(self.options.model, ik_links, self.options.motion, calc_fnos, bone_cache)
+
+            for fidx, fno in enumerate(calc_fnos):
+                leg_ik_pos_cache[fno] = (toe_ik_3ds[toe_ik_bone_name][fidx], leg_ik_3ds[leg_ik_bone_name][fidx])
+
+        return np.array([leg_ik_pos_cache[fno][0] for fno in fnos]), np.array([leg_ik_pos_cache[fno][1] for fno in fnos])
+
+    # 足IKを変更した範囲（後続キーまでの補間区間を含む）のグローバル位置を破棄する
+    def clear_leg_ik_global_poses(self, leg_ik_bone_name: str, prev_fno: int, next_fno: int, leg_ik_pos_cache: dict):
+        _, next_key_fno = self.options.motion.get_bone_prev_next_fno(leg_ik_bone_name, fno=next_fno, is_key=True)
+
+        for fno in [fno for fno in leg_ik_pos_cache.keys() if prev_fno <= fno <= next_key_fno]:
+            del leg_ik_pos_cache[fno]
@@ -31,6 +31,16 @@ logger = MLogger(__name__, level=1)
 
 
 class ConvertMorphConditionService:
+    # 条件名と比較処理の対応
+    # 等しいは、厳密にイコールだと誤差が出る可能性があるので、クローズで比較する
+    CONDITION_FUNCS = {
+        "より大きい(＞)": np.greater,
+        "以上(≧)": np.greater_equal,
+        "等しい(＝)": np.isclose,
+        "以下(≦)": np.less_equal,
+        "より小さい(＜)": np.less,
+    }
+
     def __init__(self, options: MMorphConditionOptions):
         self.options = options
 
@@ -96,6 +106,9 @@ class ConvertMorphConditionService:
     def convert_morph_condition(self):
         futures = []
 
+        # 読み込み時に展開されていない場合、ここで展開
+        self.options.motion.load_morphs(*[target_morph[0] for target_morph in self.options.target_morphs])
+
         with ThreadPoolExecutor(
             thread_name_prefix="morph_condition", max_workers=self.options.max_workers
         ) as executor:
@@ -121,36 +134,34 @@ class ConvertMorphConditionService:
 
         motion = self.options.motion
 
-        prev_sep_fno = 0
-        fnos = list(motion.morphs[org_morph_name].keys())
-        for fno, morph in motion.morphs[org_morph_name].items():
-            condition_result = False
-            if condition_name == "より大きい(＞)":
-                condition_result = bool(np.all(np.greater(morph.ratio, condition_value)))
-            elif condition_name == "以上(≧)":
-                condition_result = bool(np.all(np.greater_equal(morph.ratio, condition_value)))
-            elif condition_name == "等しい(＝)":
-                # 厳密にイコールだと誤差が出る可能性があるので、クローズで比較する
-                condition_result = bool(np.all(np.isclose(morph.ratio, condition_value)))
-            elif condition_name == "以下(≦)":
-                condition_result = bool(np.all(np.less_equal(morph.ratio, condition_value)))
-            elif condition_name == "より小さい(＜)":
-                condition_result = bool(np.all(np.less(morph.ratio, condition_value)))
-
-            if condition_result:
-                logger.info(
-                    "-- モーフ条件調整:【%s: %sF】【%s x %s → %s】",
-                    org_morph_name,
-                    fno,
-                    round(morph.ratio, 3),
-                    ratio,
-                    round(morph.ratio * ratio, 3),
-                )
-                morph.ratio *= ratio
+        # キーフレを直接書き換えるので、変更対象としてマーク
+        motion.touch_morphs(org_morph_name)
+
+        morph_frames = motion.morphs[org_morph_name]
+        fnos = list(morph_frames.keys())
 
-            if fno // 500 > prev_sep_fno and fno > 0:
-                logger.count(f"【モーフ条件調整 - {org_morph_name}】", fno, fnos)
-                prev_sep_fno = fno // 500
+        # 全キーフレの値を配列にまとめて、一括で条件判定する
+        ratios = np.array([morph_frames[fno].ratio for fno in fnos], dtype=np.float64)
+        if condition_name in self.CONDITION_FUNCS:
+            condition_results = self.CONDITION_FUNCS[condition_name](ratios, condition_value)
+        else:
+            condition_results = np.zeros(len(fnos), dtype=bool)
+        result_ratios = np.where(condition_results, ratios * ratio, ratios)
+
+        # 条件に合致したキーフレだけ書き換える
+        for fidx in np.flatnonzero(condition_results):
+            fno = fnos[fidx]
+            morph = morph_frames[fno]
+
+            logger.info(
+                "-- モーフ条件調整:【%s: %sF】【%s x %s → %s】",
+                org_morph_name,
+                fno,
+                round(morph.ratio, 3),
+                ratio,
+                round(float(result_ratios[fidx]), 3),
+            )
+            morph.ratio = float(result_ratios[fidx])
 
         logger.info("-- モーフ条件調整:終了【%s】", org_morph_name)
 
@@ -1,16 +1,18 @@
 # -*- coding: utf-8 -*-
 #
+import bisect
 import logging
 import os
 import traceback
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
 from module.MOptions import MMultiJoinOptions, MOptionsDataSet
 from mmd.PmxData import PmxModel # noqa
 from mmd.VmdData import VmdMotion, VmdBoneFrame, VmdCameraFrame, VmdInfoIk, VmdLightFrame, VmdMorphFrame, VmdShadowFrame, VmdShowIkFrame # noqa
 from mmd.VmdWriter import VmdWriter
-from module.MMath import MRect, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
+from module.MMath import MRect, MVector3D, MVector4D, MQuaternion, MMatrix4x4, qq_list_to_array, qq_array_multiply, qq_array_normalized, qq_array_dot # noqa
 from utils import MServiceUtils, MBezierUtils # noqa
 from utils.MLogger import MLogger # noqa
 from utils.MException import SizingException, MKilledException
@@ -19,6 +21,10 @@ logger = MLogger(__name__, level=1)
 
 
 class ConvertMultiJoinService():
+    # 細分化判定の閾値（回転の内積・移動量）
+    ROT_DOT_LIMIT = 0.99995
+    MOV_DIFF_LIMIT = 0.05
+
     def __init__(self, options: MMultiJoinOptions):
         self.options = options
 
@@ -74,49 +80,57 @@ class ConvertMultiJoinService():
         logger.info("多段統合【%s】", bone_name, decoration=MLogger.DECORATION_LINE)
 
         motion = self.options.motion
-        model = self.options.model
 
         fnos = motion.get_bone_fnos(rrxbn, rrybn, rrzbn, rmxbn, rmybn, rmzbn)
 
         if len(fnos) == 0:
             return False
 
-        # まずは全打ち
-        prev_sep_fno = 0
-        fno = 0
-        for fno in range(fnos[-1] + 1):
-            bf = motion.calc_bf(bone_name, fno)
-            motion.regist_bf(bf, bone_name, fno)
-
-            if fno // 500 > prev_sep_fno and fnos[-1] > 0:
-                logger.count(f"【キーフレ追加 - {bone_name}】", fno, fnos)
-                prev_sep_fno = fno // 500
-
-        logger.info("-- 準備完了【%s】", bone_name)
-
-        prev_sep_fno = 0
-        fno = 0
-        for fno in range(fnos[-1] + 1):
-            bf = motion.calc_bf(bone_name, fno)
-
-            if model.bones[bone_name].getRotatable():
-                rx_bf = motion.calc_bf(rrxbn, fno) if len(rrxbn) > 0 else VmdBoneFrame(fno)
-                ry_bf = motion.calc_bf(rrybn, fno) if len(rrybn) > 0 else VmdBoneFrame(fno)
-                rz_bf = motion.calc_bf(rrzbn, fno) if len(rrzbn) > 0 else VmdBoneFrame(fno)
-                bf.rotation = ry_bf.rotation * rx_bf.rotation * rz_bf.rotation
-                logger.debug(f"{fno}, {bone_name}, rx: {rx_bf.rotation.toEulerAngles4MMD().to_log()}, ry: {ry_bf.rotation.toEulerAngles4MMD().to_log()}, rz: {rz_bf.rotation.toEulerAngles4MMD().to_log()}")
-
-            if model.bones[bone_name].getTranslatable():
-                mx_bf = motion.calc_bf(rmxbn, fno) if len(rmxbn) > 0 else VmdBoneFrame(fno)
-                my_bf = motion.calc_bf(rmybn, fno) if len(rmybn) > 0 else VmdBoneFrame(fno)
-                mz_bf = motion.calc_bf(rmzbn, fno) if len(rmzbn) > 0 else VmdBoneFrame(fno)
-                bf.position = my_bf.position + mx_bf.position + mz_bf.position
-
-            motion.regist_bf(bf, bone_name, fno)
-
-            if fno // 500 > prev_sep_fno and fnos[-1] > 0:
-                logger.count(f"【多段統合 - {bone_name}】", fno, fnos)
-                prev_sep_fno = fno // 500
+        # 統合元ボーンのキーフレを退避（統合先が統合元を兼ねる場合もあるため）
+        source_motion = VmdMotion()
+        for sbn in set([bone_name, rrxbn, rrybn, rrzbn, rmxbn, rmybn, rmzbn]):
+            if len(sbn) > 0 and sbn in motion.bones:
+                source_motion.bones[sbn] = {fno: bf.copy() for fno, bf in motion.bones[sbn].items()}
+
+        # 最終キーまでの全フレームの統合結果
+        all_fnos = list(range(fnos[-1] + 1))
+        join_positions, join_rotations = self.calc_join_values(source_motion, all_fnos, bone_name, rrxbn, rrybn, rrzbn, rmxbn, rmybn, rmzbn)
+
+        if not self.options.remove_unnecessary_flg:
+            # 不要キー削除をしない場合、全フレームに統合結果のキーを打つ
+            motion.regist_bfs(bone_name, all_fnos, positions=join_positions, rotations=join_rotations)
+        else:
+            # 統合元のキーフレと統合先の既存キーフレだけを対象とする
+            join_fnos = sorted(set([0] + fnos + [fno for fno in motion.get_bone_fnos(bone_name) if fno <= fnos[-1]]))
+            motion.regist_bfs(bone_name, join_fnos, positions=join_positions[join_fnos], rotations=join_rotations[join_fnos])
+
+            logger.info("-- 準備完了【%s】", bone_name)
+
+            # 補間結果が統合結果から乖離しているフレームがある場合、そのキー間の中間にキーを追加して細分化する
+            # 全フレームを毎回判定し、乖離しているフレームがなくなるまで繰り返す
+            while True:
+                bfs = motion.calc_bfs(bone_name, all_fnos)
+                positions = np.array([bf.position.data() for bf in bfs], dtype=np.float64).reshape(len(all_fnos), 3)
+                rotations = qq_list_to_array([bf.rotation for bf in bfs])
+
+                diverged_fnos = np.where(self.is_diverged(positions, rotations, join_positions, join_rotations))[0].tolist()
+                if len(diverged_fnos) == 0:
+                    break
+
+                frame_fnos = motion.get_bone_fnos(bone_name)
+                subdiv_fnos = set()
+                for fno in diverged_fnos:
+                    fidx = bisect.bisect_left(frame_fnos, fno)
+                    if frame_fnos[fidx] == fno:
+                        # キー自体が乖離している場合（補間曲線の分割で追加されたキー）、統合結果で登録し直す
+                        subdiv_fnos.add(fno)
+                    else:
+                        subdiv_fnos.add(frame_fnos[fidx - 1] + (frame_fnos[fidx] - frame_fnos[fidx - 1]) // 2)
+
+                subdiv_fnos = sorted(subdiv_fnos)
+                motion.regist_bfs(bone_name, subdiv_fnos, positions=join_positions[subdiv_fnos], rotations=join_rotations[subdiv_fnos])
+
+                logger.debug("-- 細分化【%s】乖離: %s, 追加: %s", bone_name, len(diverged_fnos), len(subdiv_fnos))
 
         logger.info("統合完了【%s】", bone_name, decoration=MLogger.DECORATION_LINE)
 
@@ -145,3 +159,38 @@ class ConvertMultiJoinService():
         
         return True
 
+    # 指定フレームの統合結果（位置: N×3, 回転: N×4）
+    def calc_join_values(self, source_motion: VmdMotion, fnos: list, bone_name: str, rrxbn: str, rrybn: str, rrzbn: str, rmxbn: str, rmybn: str, rmzbn: str):
+        model = self.options.model
+
+        positions, rotations = self.calc_values(source_motion, bone_name, fnos)
+
+        if model.bones[bone_name].getRotatable():
+            rx_rotations = self.calc_values(source_motion, rrxbn, fnos)[1]
+            ry_rotations = self.calc_values(source_motion, rrybn, fnos)[1]
+            rz_rotations = self.calc_values(source_motion, rrzbn, fnos)[1]
+            rotations = qq_array_multiply(qq_array_multiply(ry_rotations, rx_rotations), rz_rotations)
+
+        if model.bones[bone_name].getTranslatable():
+            mx_positions = self.calc_values(source_motion, rmxbn, fnos)[0]
+            my_positions = self.calc_values(source_motion, rmybn, fnos)[0]
+            mz_positions = self.calc_values(source_motion, rmzbn, fnos)[0]
+            positions = my_positions + mx_positions + mz_positions
+
+        return positions, rotations
+
+    # 指定ボーンの各フレームの位置と回転（ボーン指定なしの場合は初期値）
+    def calc_values(self, source_motion: VmdMotion, bone_name: str, fnos: list):
+        if len(bone_name) == 0:
+            return np.zeros((len(fnos), 3), dtype=np.float64), np.tile(np.array([1, 0, 0, 0], dtype=np.float64), (len(fnos), 1))
+
+        bfs = source_motion.calc_bfs(bone_name, fnos)
+
+        return np.array([bf.position.data() for bf in bfs], dtype=np.float64).reshape(len(fnos), 3), qq_list_to_array([bf.rotation for bf in bfs])
+
+    # 補間結果が統合結果から乖離しているか（フレームごと）
+    def is_diverged(self, positions: np.ndarray, rotations: np.ndarray, join_positions: np.ndarray, join_rotations: np.ndarray):
+        rot_dots = np.abs(qq_array_dot(qq_array_normalized(rotations), qq_array_normalized(join_rotations)))
+        mov_diffs = np.linalg.norm(positions - join_positions, axis=1)
+
+        return (rot_dots < self.ROT_DOT_LIMIT) | (mov_diffs > self.MOV_DIFF_LIMIT)
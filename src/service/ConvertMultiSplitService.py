@@ -12,6 +12,7 @@ from mmd.PmxData import PmxModel # noqa
 from mmd.VmdData import VmdMotion, VmdBoneFrame, VmdCameraFrame, VmdInfoIk, VmdLightFrame, VmdMorphFrame, VmdShadowFrame, VmdShowIkFrame # noqa
 from mmd.VmdWriter import VmdWriter
 from module.MMath import MRect, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
+from module.MMath import qq_list_to_array, qq_array_to_list, qq_array_normalized, qq_array_dot, qq_array_to_euler, qq_array_from_euler # noqa
 from utils import MServiceUtils, MBezierUtils # noqa
 from utils.MLogger import MLogger # noqa
 from utils.MException import SizingException, MKilledException
@@ -181,12 +182,17 @@ class ConvertMultiSplitService():
                 local_x_axis = None
         logger.debug(f"{bone_name}, local_x_axis: {local_x_axis}")
 
+        split_qqs = None
+        if model.bones[bone_name].getRotatable():
+            # 全キーの回転をまとめて軸ごとに分離しておく
+            split_qqs = self.separate_qq_list([motion.calc_bf(bone_name, fno).rotation for fno in fnos], local_x_axis)
+
         prev_sep_fno = 0
-        for fno in fnos:
+        for fno_idx, fno in enumerate(fnos):
             bf = motion.calc_bf(bone_name, fno)
 
             # 多段分割
-            self.split_bf(fno, bf, local_x_axis, bone_name, rrxbn, rrybn, rrzbn, rmxbn, rmybn, rmzbn)
+            self.split_bf(fno, bf, local_x_axis, bone_name, rrxbn, rrybn, rrzbn, rmxbn, rmybn, rmzbn, split_qqs[fno_idx] if split_qqs else None)
             
             if fno // 500 > prev_sep_fno and fnos[-1] > 0:
                 logger.info("-- %sフレーム目:終了(%s％)【多段分割 - %s】", fno, round((fno / fnos[-1]) * 100, 3), bone_name)
@@ -205,67 +211,12 @@ class ConvertMultiSplitService():
         check_fnos = list(sorted(list(set(check_fnos))))
         logger.debug("bone_name: %s, check_fnos: %s", bone_name, check_fnos)
 
-        prev_sep_fno = 0
-        for fno in check_fnos:
-            is_subdiv = False
-            prev_motion_bf = self.prev_motion.calc_bf(bone_name, fno).copy()
-
-            if model.bones[bone_name].getRotatable():
-                # 回転を分ける
-                if local_x_axis:
-                    # ローカルX軸がある場合
-                    x_qq, y_qq, z_qq, _ = MServiceUtils.separate_local_qq(fno, bone_name, prev_motion_bf.rotation, local_x_axis)
-                else:
-                    # ローカルX軸の指定が無い場合、グローバルで分ける
-                    euler = prev_motion_bf.rotation.toEulerAngles()
-                    x_qq = MQuaternion.fromEulerAngles(euler.x(), 0, 0)
-                    y_qq = MQuaternion.fromEulerAngles(0, euler.y(), 0)
-                    z_qq = MQuaternion.fromEulerAngles(0, 0, euler.z())
-
-                if len(rrxbn) > 0:
-                    rx_bf = motion.calc_bf(rrxbn, fno)
-                    dot = MQuaternion.dotProduct(x_qq.normalized(), rx_bf.rotation.normalized())
-                    if dot < 0.98:
-                        is_subdiv = True
-
-                if len(rrybn) > 0:
-                    ry_bf = motion.calc_bf(rrybn, fno)
-                    dot = MQuaternion.dotProduct(y_qq.normalized(), ry_bf.rotation.normalized())
-                    if dot < 0.98:
-                        is_subdiv = True
-
-                if len(rrzbn) > 0:
-                    rz_bf = motion.calc_bf(rrzbn, fno)
-                    dot = MQuaternion.dotProduct(z_qq.normalized(), rz_bf.rotation.normalized())
-                    if dot < 0.98:
-                        is_subdiv = True
+        # 乖離チェックは全チェックフレームを配列でまとめて判定する
+        is_subdivs, check_split_qqs = self.check_split_divergence(check_fnos, local_x_axis, bone_name, rrxbn, rrybn, rrzbn, rmxbn, rmybn, rmzbn, center_mx, center_my, center_mz)
 
-            if model.bones[bone_name].getTranslatable():
-                if len(center_mx) > 0 or len(center_my) > 0 or len(center_mz) > 0:
-                    # センターとグルーブを両方分割してる場合
-                    prev_center_motion_bf = self.prev_motion.calc_bf("センター", fno).copy()
-                    if len(center_mx) > 0 and rmxbn == center_mx:
-                        prev_motion_bf.position.setX(prev_motion_bf.position.x() + prev_center_motion_bf.position.x())
-                    if len(center_my) > 0 and rmybn == center_my:
-                        prev_motion_bf.position.setY(prev_motion_bf.position.y() + prev_center_motion_bf.position.y())
-                    if len(center_mz) > 0 and rmzbn == center_mz:
-                        prev_motion_bf.position.setZ(prev_motion_bf.position.z() + prev_center_motion_bf.position.z())
-
-                # 移動を分ける
-                if len(rmxbn) > 0:
-                    mx_bf = motion.calc_bf(rmxbn, fno)
-                    if np.diff([mx_bf.position.x(), prev_motion_bf.position.x()]) > 0.1:
-                        is_subdiv = True
-
-                if len(rmybn) > 0:
-                    my_bf = motion.calc_bf(rmybn, fno)
-                    if np.diff([my_bf.position.y(), prev_motion_bf.position.y()]) > 0.1:
-                        is_subdiv = True
-
-                if len(rmzbn) > 0:
-                    mz_bf = motion.calc_bf(rmzbn, fno)
-                    if np.diff([mz_bf.position.z(), prev_motion_bf.position.z()]) > 0.1:
-                        is_subdiv = True
+        prev_sep_fno = 0
+        for check_idx, fno in enumerate(check_fnos):
+            is_subdiv = is_subdivs[check_idx]
             
             if is_subdiv:
                 # 細分化ONの場合、更に分割する
@@ -298,8 +249,8 @@ class ConvertMultiSplitService():
                     if len(center_mz) > 0 and rmzbn == center_mz:
                         subdiv_bf.position.setZ(subdiv_bf.position.z() + prev_center_motion_bf.position.z())
 
-                # 多段分割
-                self.split_bf(fno, subdiv_bf, local_x_axis, bone_name, rrxbn, rrybn, rrzbn, rmxbn, rmybn, rmzbn)
+                # 多段分割（分割前の値の回転は乖離チェック時に分離済み）
+                self.split_bf(fno, subdiv_bf, local_x_axis, bone_name, rrxbn, rrybn, rrzbn, rmxbn, rmybn, rmzbn, check_split_qqs[check_idx] if check_split_qqs else None)
 
                 # prev_fno = check_prev_next_fnos[fno]["prev"]
                 # next_fno = check_prev_next_fnos[fno]["next"]
@@ -424,13 +375,81 @@ class ConvertMultiSplitService():
 
         return True
     
-    def split_bf(self, fno: int, bf: VmdBoneFrame, local_x_axis: MVector3D, bone_name: str, rrxbn: str, rrybn: str, rrzbn: str, rmxbn: str, rmybn: str, rmzbn: str):
+    # 分割前の値と分割後の値の乖離チェック
+    def check_split_divergence(self, check_fnos: list, local_x_axis: MVector3D, bone_name: str, rrxbn: str, rrybn: str, rrzbn: str, rmxbn: str, rmybn: str, rmzbn: str, \
+                               center_mx: str, center_my: str, center_mz: str):
+        motion = self.options.motion
+        model = self.options.model
+
+        is_subdivs = np.zeros(len(check_fnos), dtype=np.bool_)
+        check_split_qqs = None
+
+        if len(check_fnos) == 0:
+            return is_subdivs, check_split_qqs
+
+        prev_motion_bfs = [self.prev_motion.calc_bf(bone_name, fno) for fno in check_fnos]
+
+        if model.bones[bone_name].getRotatable():
+            # 回転を分ける
+            x_qqs, y_qqs, z_qqs = self.separate_qq_array(qq_list_to_array([bf.rotation for bf in prev_motion_bfs]), local_x_axis)
+            check_split_qqs = list(zip(qq_array_to_list(x_qqs), qq_array_to_list(y_qqs), qq_array_to_list(z_qqs)))
+
+            for rbn, split_qqs in [(rrxbn, x_qqs), (rrybn, y_qqs), (rrzbn, z_qqs)]:
+                if len(rbn) > 0:
+                    r_qqs = qq_list_to_array([motion.calc_bf(rbn, fno).rotation for fno in check_fnos])
+                    dots = qq_array_dot(qq_array_normalized(split_qqs), qq_array_normalized(r_qqs))
+                    is_subdivs |= dots < 0.98
+
+        if model.bones[bone_name].getTranslatable():
+            prev_poses = np.array([bf.position.data() for bf in prev_motion_bfs], dtype=np.float64)
+
+            if len(center_mx) > 0 or len(center_my) > 0 or len(center_mz) > 0:
+                # センターとグルーブを両方分割してる場合
+                prev_center_poses = np.array([self.prev_motion.calc_bf("センター", fno).position.data() for fno in check_fnos], dtype=np.float64)
+                for axis_idx, (center_mbn, mbn) in enumerate([(center_mx, rmxbn), (center_my, rmybn), (center_mz, rmzbn)]):
+                    if len(center_mbn) > 0 and mbn == center_mbn:
+                        prev_poses[:, axis_idx] += prev_center_poses[:, axis_idx]
+
+            # 移動を分ける
+            for axis_idx, mbn in enumerate([rmxbn, rmybn, rmzbn]):
+                if len(mbn) > 0:
+                    m_poses = np.array([motion.calc_bf(mbn, fno).position.data()[axis_idx] for fno in check_fnos], dtype=np.float64)
+                    is_subdivs |= (prev_poses[:, axis_idx] - m_poses) > 0.1
+
+        return is_subdivs, check_split_qqs
+
+    # 回転配列を軸ごとに分離する
+    def separate_qq_array(self, qq_ary: np.ndarray, local_x_axis: MVector3D):
+        if local_x_axis:
+            # ローカルX軸がある場合
+            x_qqs, y_qqs, z_qqs, _ = MServiceUtils.separate_local_qq_array(qq_ary, local_x_axis)
+        else:
+            # ローカルX軸の指定が無い場合、グローバルで分ける
+            eulers = qq_array_to_euler(qq_ary)
+            x_qqs = qq_array_from_euler(eulers * np.array([1, 0, 0]))
+            y_qqs = qq_array_from_euler(eulers * np.array([0, 1, 0]))
+            z_qqs = qq_array_from_euler(eulers * np.array([0, 0, 1]))
+        
+        return x_qqs, y_qqs, z_qqs
+
+    # 回転リストを軸ごとに分離し、フレームごとの(x_qq, y_qq, z_qq)のリストにする
+    def separate_qq_list(self, qqs: list, local_x_axis: MVector3D):
+        if len(qqs) == 0:
+            return []
+
+        x_qqs, y_qqs, z_qqs = self.separate_qq_array(qq_list_to_array(qqs), local_x_axis)
+        return list(zip(qq_array_to_list(x_qqs), qq_array_to_list(y_qqs), qq_array_to_list(z_qqs)))
+
+    def split_bf(self, fno: int, bf: VmdBoneFrame, local_x_axis: MVector3D, bone_name: str, rrxbn: str, rrybn: str, rrzbn: str, rmxbn: str, rmybn: str, rmzbn: str, split_qqs=None):
         motion = self.options.motion
         model = self.options.model
 
         if model.bones[bone_name].getRotatable():
             # 回転を分ける
-            if local_x_axis:
+            if split_qqs:
+                # 一括分離済みの場合
+                x_qq, y_qq, z_qq = split_qqs
+            elif local_x_axis:
                 # ローカルX軸がある場合
                 x_qq, y_qq, z_qq, _ = MServiceUtils.separate_local_qq(fno, bone_name, bf.rotation, local_x_axis)
             else:
@@ -13,6 +13,7 @@ from mmd.PmxData import PmxModel # noqa
 from mmd.VmdData import VmdMotion, VmdBoneFrame, VmdCameraFrame, VmdInfoIk, VmdLightFrame, VmdMorphFrame, VmdShadowFrame, VmdShowIkFrame # noqa
 from mmd.VmdWriter import VmdWriter
 from module.MMath import MRect, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
+from module.MMath import qq_list_to_array, qq_array_to_euler, qq_array_from_euler # noqa
 from utils import MServiceUtils, MBezierUtils # noqa
 from utils.MLogger import MLogger # noqa
 from utils.MException import SizingException, MKilledException
@@ -47,7 +48,9 @@ class ConvertNoiseService():
                 for copy_no in range(self.options.copy_cnt):
                     # やる気係数を適用する場合、シード生成
                     seed = np.random.randint(85, 115) / 100 if self.options.motivation_flg else 1
-                    futures.append(executor.submit(self.convert_noise, copy_no, seed))
+                    # 複製ごとの乱数シード（スレッドの実行順に関わらず、同じシードなら同じゆらぎになる）
+                    random_seed = np.random.randint(0, 2 ** 31 - 1)
+                    futures.append(executor.submit(self.convert_noise, copy_no, seed, random_seed))
 
             concurrent.futures.wait(futures, timeout=None, return_when=concurrent.futures.FIRST_EXCEPTION)
 
@@ -66,9 +69,12 @@ class ConvertNoiseService():
             logging.shutdown()
 
     # ゆらぎ複製処理実行
-    def convert_noise(self, copy_no: int, seed: float):
+    def convert_noise(self, copy_no: int, seed: float, random_seed: int):
         logger.info("ゆらぎ複製　【No.%s】", (copy_no + 1), decoration=MLogger.DECORATION_LINE)
 
+        # 複製ごとに独立した乱数
+        rng = np.random.RandomState(random_seed)
+
         # データをコピーしてそっちを弄る
         motion = self.options.motion.copy()
 
@@ -78,79 +84,20 @@ class ConvertNoiseService():
                 continue
 
             fnos = motion.get_bone_fnos(bone_name)
-            prev_fno = 0
-            prev_sep_fno = 0
+
+            # キーフレを直接書き換えるので、変更対象としてマーク
+            motion.touch_bones(bone_name)
 
             # 事前に細分化
             self.prepare_split_stance(motion, bone_name)
             logger.info("-- 準備完了【No.%s - %s】", copy_no + 1, bone_name)
 
-            for fno in fnos:
-                bf = motion.bones[bone_name][fno]
-                org_bf = self.options.motion.calc_bf(bone_name, fno)
-
-                # 移動
-                if bf.position != MVector3D():
-                    prev_org_bf = self.options.motion.calc_bf(bone_name, prev_fno)
-
-                    if org_bf.position == prev_org_bf.position and fno > 0:
-                        bf.position = motion.calc_bf(bone_name, prev_fno).position
-                    else:
-                        # 0だったら動かさない
-                        if round(org_bf.position.x(), 1) != 0:
-                            if self.options.motivation_flg:
-                                bf.position.setX(bf.position.x() * seed + (0.5 - np.random.rand()) * (self.options.noise_size / 10))
-                            else:
-                                bf.position.setX(bf.position.x() + (0.5 - np.random.rand()) * (self.options.noise_size / 10))
-                        if round(org_bf.position.y(), 1) != 0 and "足ＩＫ" not in bone_name:
-                            # 足ＩＫのＹは動かさない
-                            if self.options.motivation_flg:
-                                if org_bf.position.y() < 0:
-                                    # Yはオリジナルがマイナスの場合は、マイナスのみに動かす
-                                    bf.position.setY(bf.position.y() * seed + (0 - np.random.rand()) * (self.options.noise_size / 10))
-                                elif org_bf.position.y() > 0:
-                                    bf.position.setY(bf.position.y() * seed + (0.5 - np.random.rand()) * (self.options.noise_size / 10))
-                            else:
-                                bf.position.setY(bf.position.y() + (0.5 - np.random.rand()) * (self.options.noise_size / 10))
-                        if round(org_bf.position.z(), 1) != 0:
-                            if self.options.motivation_flg:
-                                bf.position.setZ(bf.position.z() * seed + (0.5 - np.random.rand()) * (self.options.noise_size / 10))
-                            else:
-                                bf.position.setZ(bf.position.z() + (0.5 - np.random.rand()) * (self.options.noise_size / 10))
-
-                        # 移動補間曲線
-                        for (bz_idx1, bz_idx2, bz_idx3, bz_idx4) in [MBezierUtils.MX_x1_idxs, MBezierUtils.MX_y1_idxs, MBezierUtils.MX_x2_idxs, MBezierUtils.MX_y2_idxs, \
-                                                                     MBezierUtils.MY_x1_idxs, MBezierUtils.MY_y1_idxs, MBezierUtils.MY_x2_idxs, MBezierUtils.MY_y2_idxs, \
-                                                                     MBezierUtils.MZ_x1_idxs, MBezierUtils.MZ_y1_idxs, MBezierUtils.MZ_x2_idxs, MBezierUtils.MZ_y2_idxs]:
-                            noise_interpolation = bf.interpolation[bz_idx1] + math.ceil((0.5 - np.random.rand()) * self.options.noise_size)
-                            bf.interpolation[bz_idx1] = bf.interpolation[bz_idx2] = bf.interpolation[bz_idx3] = bf.interpolation[bz_idx4] = int(noise_interpolation)
-                
-                # 回転
-                euler = bf.rotation.toEulerAngles()
-                # 回転は元が0であっても動かす(足は除く)
-                if "足" not in bone_name and "ひざ" not in bone_name and "足首" not in bone_name:
-                    if self.options.motivation_flg:
-                        euler.setX(euler.x() * seed + (0.5 - np.random.rand()) * self.options.noise_size)
-                        euler.setY(euler.y() * seed + (0.5 - np.random.rand()) * self.options.noise_size)
-                        euler.setZ(euler.z() * seed + (0.5 - np.random.rand()) * self.options.noise_size)
-                    else:
-                        euler.setX(euler.x() + (0.5 - np.random.rand()) * self.options.noise_size)
-                        euler.setY(euler.y() + (0.5 - np.random.rand()) * self.options.noise_size)
-                        euler.setZ(euler.z() + (0.5 - np.random.rand()) * self.options.noise_size)
-                bf.rotation = MQuaternion.fromEulerAngles(euler.x(), euler.y(), euler.z())
-
-                # 回転補間曲線
-                for (bz_idx1, bz_idx2, bz_idx3, bz_idx4) in [MBezierUtils.R_x1_idxs, MBezierUtils.R_y1_idxs, MBezierUtils.R_x2_idxs, MBezierUtils.R_y2_idxs]:
-                    noise_interpolation = bf.interpolation[bz_idx1] + math.ceil((0.5 - np.random.rand()) * self.options.noise_size)
-
-                    bf.interpolation[bz_idx1] = bf.interpolation[bz_idx2] = bf.interpolation[bz_idx3] = bf.interpolation[bz_idx4] = int(noise_interpolation)
-                
-                # 前回fno保持
-                prev_fno = fno
-
-                if fno // 2000 > prev_sep_fno and fnos[-1] > 0:
-                    logger.count(f"【No.{copy_no + 1} - {bone_name}】", fno, fnos)
-                    prev_sep_fno = fno // 2000
+            if len(fnos) == 0:
+                continue
+
+            self.apply_noise(motion, bone_name, fnos, seed, rng)
+
+            logger.count(f"【No.{copy_no + 1} - {bone_name}】", fnos[-1], fnos)
 
         output_path = self.options.output_path.replace("nxxx", "n{0:03d}".format(copy_no + 1))
         output_path = output_path.replace("axxx", "a{0:+03d}".format(int(seed * 100) - 100))
@@ -162,9 +109,82 @@ class ConvertNoiseService():
 
         return True
 
+    # 1ボーンの全キーフレにまとめてゆらぎを加える
+    def apply_noise(self, motion: VmdMotion, bone_name: str, fnos: list, seed: float, rng: np.random.RandomState):
+        noise_size = self.options.noise_size
+        bfs = [motion.bones[bone_name][fno] for fno in fnos]
+
+        # 全キーフレ分の乱数を一度に生成する
+        # 0-2: 移動, 3-14: 移動補間曲線, 15-17: 回転, 18-21: 回転補間曲線
+        rands = rng.rand(len(fnos), 22)
+
+        # 移動 ------------------
+        poses = np.array([bf.position.data() for bf in bfs], dtype=np.float64)
+        # 判定はオリジナルの値で行う
+        org_poses = np.array([self.options.motion.calc_bf(bone_name, fno).position.data() for fno in fnos], dtype=np.float64)
+        prev_org_poses = np.vstack([self.options.motion.calc_bf(bone_name, 0).position.data(), org_poses[:-1]])
+
+        pos_offsets = (0.5 - rands[:, :3]) * (noise_size / 10)
+        if self.options.motivation_flg:
+            # Yはオリジナルがマイナスの場合は、マイナスのみに動かす
+            pos_offsets[:, 1] = np.where(org_poses[:, 1] < 0, (0 - rands[:, 1]) * (noise_size / 10), pos_offsets[:, 1])
+
+        # 0だったら動かさない
+        is_pos_noises = np.round(org_poses, 1) != 0
+        if "足ＩＫ" in bone_name:
+            # 足ＩＫのＹは動かさない
+            is_pos_noises[:, 1] = False
+
+        # 移動がない場合は何もしない
+        is_moves = np.any(poses != 0, axis=1)
+        # オリジナルで前キーから動いていない場合、前キーの位置を引き継ぐ
+        is_keeps = np.all(org_poses == prev_org_poses, axis=1) & (np.array(fnos) > 0)
+
+        noise_poses = np.where(is_pos_noises, poses * seed + pos_offsets, poses)
+        if is_keeps[0]:
+            noise_poses[0] = poses[0]
+        # 引き継ぎ元のキー（直近の引き継がないキー）
+        keep_idxs = np.maximum.accumulate(np.where(is_keeps, 0, np.arange(len(fnos))))
+        noise_poses = np.where(is_moves[:, np.newaxis], noise_poses[keep_idxs], poses)
+
+        move_interpolations = np.ceil((0.5 - rands[:, 3:15]) * noise_size).astype(np.int64)
+
+        # 回転 ------------------
+        qqs = qq_list_to_array([bf.rotation for bf in bfs])
+        # 回転は元が0であっても動かす(足は除く)
+        if "足" not in bone_name and "ひざ" not in bone_name and "足首" not in bone_name:
+            eulers = qq_array_to_euler(qqs)
+            qqs = qq_array_from_euler(eulers * seed + (0.5 - rands[:, 15:18]) * noise_size)
+
+        rot_interpolations = np.ceil((0.5 - rands[:, 18:22]) * noise_size).astype(np.int64)
+
+        # キーフレに反映 ------------------
+        move_bz_idxs = [MBezierUtils.MX_x1_idxs, MBezierUtils.MX_y1_idxs, MBezierUtils.MX_x2_idxs, MBezierUtils.MX_y2_idxs, \
+                        MBezierUtils.MY_x1_idxs, MBezierUtils.MY_y1_idxs, MBezierUtils.MY_x2_idxs, MBezierUtils.MY_y2_idxs, \
+                        MBezierUtils.MZ_x1_idxs, MBezierUtils.MZ_y1_idxs, MBezierUtils.MZ_x2_idxs, MBezierUtils.MZ_y2_idxs]
+        rot_bz_idxs = [MBezierUtils.R_x1_idxs, MBezierUtils.R_y1_idxs, MBezierUtils.R_x2_idxs, MBezierUtils.R_y2_idxs]
+
+        for fidx, bf in enumerate(bfs):
+            if is_moves[fidx]:
+                bf.position = MVector3D(noise_poses[fidx])
+
+                if not is_keeps[fidx]:
+                    # 移動補間曲線
+                    for (bz_idx1, bz_idx2, bz_idx3, bz_idx4), noise_value in zip(move_bz_idxs, move_interpolations[fidx]):
+                        noise_interpolation = bf.interpolation[bz_idx1] + int(noise_value)
+                        bf.interpolation[bz_idx1] = bf.interpolation[bz_idx2] = bf.interpolation[bz_idx3] = bf.interpolation[bz_idx4] = int(noise_interpolation)
+
+            bf.rotation = MQuaternion(qqs[fidx])
+
+            # 回転補間曲線
+            for (bz_idx1, bz_idx2, bz_idx3, bz_idx4), noise_value in zip(rot_bz_idxs, rot_interpolations[fidx]):
+                noise_interpolation = bf.interpolation[bz_idx1] + int(noise_value)
+                bf.interpolation[bz_idx1] = bf.interpolation[bz_idx2] = bf.interpolation[bz_idx3] = bf.interpolation[bz_idx4] = int(noise_interpolation)
+
     # スタンス用細分化
     def prepare_split_stance(self, motion: VmdMotion, target_bone_name: str):
         fnos = motion.get_bone_fnos(target_bone_name)
+        half_fnos = []
 
         for fidx, fno in enumerate(fnos):
             if fidx == 0:
@@ -180,7 +200,10 @@ class ConvertNoiseService():
 
                 if prev_bf.fno < half_fno < bf.fno:
                     # キーが追加できる状態であれば、追加
-                    half_bf = motion.calc_bf(target_bone_name, half_fno)
-                    motion.regist_bf(half_bf, target_bone_name, half_fno)
+                    half_fnos.append(half_fno)
+
+        # 分割キーはまとめて登録
+        if len(half_fnos) > 0:
+            motion.regist_bfs(target_bone_name, half_fnos)
 
 
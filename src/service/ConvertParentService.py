@@ -11,6 +11,7 @@ from mmd.PmxData import PmxModel # noqa
 from mmd.VmdData import VmdMotion, VmdBoneFrame, VmdCameraFrame, VmdInfoIk, VmdLightFrame, VmdMorphFrame, VmdShadowFrame, VmdShowIkFrame # noqa
 from mmd.VmdWriter import VmdWriter
 from module.MMath import MRect, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
+from module.MMath import qq_list_to_array, qq_array_multiply # noqa
 from utils import MServiceUtils, MBezierUtils # noqa
 from utils.MLogger import MLogger # noqa
 from utils.MException import SizingException, MKilledException
@@ -19,6 +20,9 @@ logger = MLogger(__name__, level=1)
 
 
 class ConvertParentService():
+    # 全親移植で扱うボーン（これ以外のボーンは読み込み時に展開しない）
+    TARGET_BONE_NAMES = ["全ての親", "センター", "センター親", "グルーブ", "腰", "上半身", "下半身", "左足ＩＫ", "右足ＩＫ", "左足IK親", "右足IK親"]
+
     def __init__(self, options: MParentOptions):
         self.options = options
 
@@ -90,123 +94,50 @@ class ConvertParentService():
 
         for bone_name in [center_bone_name]:
             if bone_name in model.bones:
-                prev_sep_fno = 0
-                fno = 0
                 fnos = motion.get_bone_fnos(bone_name, root_bone_name)
+                motion.regist_bfs(bone_name, fnos)
 
-                for fno in fnos:
-                    bf = motion.calc_bf(bone_name, fno)
-                    motion.regist_bf(bf, bone_name, fno)
-            
-                    if fno // 2000 > prev_sep_fno and fnos[-1] > 0:
-                        logger.count(f"【準備 - {bone_name}】", fno, fnos)
-                        prev_sep_fno = fno // 2000
-
-                logger.count(f"【準備 - {bone_name}】", fno, fnos)
+                logger.count(f"【準備 - {bone_name}】", fnos[-1] if len(fnos) > 0 else 0, fnos)
 
         if self.options.center_rotatation_flg:
             for bone_name in [center_bone_name, upper_bone_name, lower_bone_name]:
                 if bone_name in model.bones:
-                    prev_sep_fno = 0
-                    fno = 0
                     fnos = motion.get_bone_fnos(bone_name, center_bone_name, root_bone_name)
+                    motion.regist_bfs(bone_name, fnos)
 
-                    for fno in fnos:
-                        bf = motion.calc_bf(bone_name, fno)
-                        motion.regist_bf(bf, bone_name, fno)
-
-                        if fno // 2000 > prev_sep_fno and fnos[-1] > 0:
-                            logger.count(f"【準備 - {bone_name}】", fno, fnos)
-                            prev_sep_fno = fno // 2000
-                    
-                    logger.count(f"【準備 - {bone_name}】", fno, fnos)
+                    logger.count(f"【準備 - {bone_name}】", fnos[-1] if len(fnos) > 0 else 0, fnos)
 
         for bone_name in [right_leg_ik_bone_name, left_leg_ik_bone_name]:
             if bone_name in model.bones:
-                prev_sep_fno = 0
-                fno = 0
                 fnos = motion.get_bone_fnos(bone_name, root_bone_name, left_leg_ik_parent_bone_name, right_leg_ik_parent_bone_name)
+                motion.regist_bfs(bone_name, fnos)
 
-                for fno in fnos:
-                    bf = motion.calc_bf(bone_name, fno)
-                    motion.regist_bf(bf, bone_name, fno)
-            
-                    if fno // 2000 > prev_sep_fno and fnos[-1] > 0:
-                        logger.count(f"【準備 - {bone_name}】", fno, fnos)
-                        prev_sep_fno = fno // 2000
-                
-                logger.count(f"【準備 - {bone_name}】", fno, fnos)
+                logger.count(f"【準備 - {bone_name}】", fnos[-1] if len(fnos) > 0 else 0, fnos)
 
         logger.info("移植開始", decoration=MLogger.DECORATION_LINE)
 
         # センターの移植
         for bone_name in [center_bone_name]:
             if bone_name in model.bones:
-                prev_sep_fno = 0
-                fno = 0
-                links = model.create_link_2_top_one(bone_name, is_defined=False)
                 fnos = motion.get_bone_fnos(bone_name, root_bone_name)
 
-                # 移植
-                for fno in fnos:
-                    root_bf = motion.calc_bf(root_bone_name, fno)
-                    center_parent_bf = motion.calc_bf(center_parent_bone_name, fno)
-
-                    bf = motion.calc_bf(bone_name, fno)
-                    # logger.info("f: %s, prev bf.position: %s", fno, bf.position)
-
-                    # relative_3ds_dic = MServiceUtils.calc_relative_position(model, links, motion, fno)
-                    # [logger.info("R %s", v.to_log()) for v in relative_3ds_dic]
-                    global_3ds_dic = MServiceUtils.calc_global_pos(model, links, motion, fno)
-                    bone_global_pos = global_3ds_dic[bone_name]
-                    # [logger.info("G %s: %s", k, v.to_log()) for k, v in global_3ds_dic.items()]
-                    # logger.info("f: %s, bone_global_pos: %s", fno, bone_global_pos)
-
-                    # グローバル位置からの差(センター親があった場合、それも加味して入れてしまう)
-                    bf.position = bone_global_pos - model.bones[bone_name].position
-                    # logger.info("f: %s, bf.position: %s", fno, bf.position)
+                # 移植(センター親があった場合、それも加味して入れてしまう)
+                self.transplant_bone(bone_name, center_parent_bone_name, root_bone_name, fnos)
 
-                    # 回転の吸収
-                    bf.rotation = root_bf.rotation * center_parent_bf.rotation * bf.rotation
-
-                    motion.regist_bf(bf, bone_name, fno)
-
-                    if fno // 2000 > prev_sep_fno and fnos[-1] > 0:
-                        logger.count(f"【移植 - {bone_name}】", fno, fnos)
-                        prev_sep_fno = fno // 2000
-
-                logger.count(f"【移植 - {bone_name}】", fno, fnos)
+                logger.count(f"【移植 - {bone_name}】", fnos[-1] if len(fnos) > 0 else 0, fnos)
 
         # 足IKの移植
         for bone_name, parent_bone_name in [(right_leg_ik_bone_name, right_leg_ik_parent_bone_name), (left_leg_ik_bone_name, left_leg_ik_parent_bone_name)]:
             if bone_name in model.bones:
-                prev_sep_fno = 0
-                fno = 0
-                links = model.create_link_2_top_one(bone_name, is_defined=False)
                 fnos = motion.get_bone_fnos(bone_name, root_bone_name)
 
-                # 移植
-                for fno in fnos:
-                    root_bf = motion.calc_bf(root_bone_name, fno)
-                    leg_ik_parent_bf = motion.calc_bf(parent_bone_name, fno)
-
-                    bf = motion.calc_bf(bone_name, fno)
-                    global_3ds_dic = MServiceUtils.calc_global_pos(model, links, motion, fno)
-                    bone_global_pos = global_3ds_dic[bone_name]
-
-                    # グローバル位置からの差(足IK親があった場合、それも加味して入れてしまう)
-                    bf.position = bone_global_pos - model.bones[bone_name].position
+                # 移植(足IK親があった場合、それも加味して入れてしまう)
+                self.transplant_bone(bone_name, parent_bone_name, root_bone_name, fnos)
 
-                    # 回転
-                    bf.rotation = root_bf.rotation * leg_ik_parent_bf.rotation * bf.rotation
+                logger.count(f"【移植 - {bone_name}】", fnos[-1] if len(fnos) > 0 else 0, fnos)
 
-                    motion.regist_bf(bf, bone_name, fno)
-
-                    if fno // 2000 > prev_sep_fno and fnos[-1] > 0:
-                        logger.count(f"【移植 - {bone_name}】", fno, fnos)
-                        prev_sep_fno = fno // 2000
-
-                logger.count(f"【移植 - {bone_name}】", fno, fnos)
+        # 読み込み時に展開されていない場合、ここで展開してから削除する
+        motion.load_bones(root_bone_name, center_parent_bone_name, left_leg_ik_parent_bone_name, right_leg_ik_parent_bone_name)
 
         # 全ての親削除
         if root_bone_name in motion.bones:
@@ -282,6 +213,30 @@ class ConvertParentService():
         
         return True
 
+    # 全ての親と指定親の変形を、指定ボーンの全キーフレに一括で吸収させる
+    def transplant_bone(self, bone_name: str, parent_bone_name: str, root_bone_name: str, fnos: list):
+        motion = self.options.motion
+        model = self.options.model
+
+        if len(fnos) == 0:
+            return
+
+        links = model.create_link_2_top_one(bone_name, is_defined=False)
+
+        # 全キーフレのグローバル位置を行列の積でまとめて求める
+        global_3ds_dic = MServiceUtils.calc_global_pos_array(model, links, motion, fnos)
+
+        # グローバル位置からの差
+        positions = global_3ds_dic[bone_name] - model.bones[bone_name].position.data()
+
+        # 回転の吸収
+        root_qqs = qq_list_to_array([motion.calc_bf(root_bone_name, fno).rotation for fno in fnos])
+        parent_qqs = qq_list_to_array([motion.calc_bf(parent_bone_name, fno).rotation for fno in fnos])
+        bone_qqs = qq_list_to_array([motion.calc_bf(bone_name, fno).rotation for fno in fnos])
+        rotations = qq_array_multiply(qq_array_multiply(root_qqs, parent_qqs), bone_qqs)
+
+        motion.regist_bfs(bone_name, fnos, positions=positions, rotations=rotations)
+
     # 不要キー削除
     def remove_unnecessary_bf(self, bone_name: str):
         try:
@@ -1,12 +1,11 @@
 # -*- coding: utf-8 -*-
 #
-import copy
 import math
 import logging
 import os
 import traceback
 import itertools
-import random
+import numpy as np
 from datetime import datetime
 
 from mmd.VmdWriter import VmdWriter
@@ -20,6 +19,17 @@ logger = MLogger(__name__)
 
 
 class MorphBlendService():
+    # 1ファイルあたりの出力フレーム数上限
+    MAX_FRAME_CNT = 1000
+    # 1ファイルあたりの出力キー数上限
+    MAX_KEY_CNT = 19000
+    # 全組合せを出力するファイル数の上限（これより多くなる場合、ランダム）
+    MAX_FILE_CNT = 20
+    # ランダムの場合の出力フレーム数
+    RANDOM_FRAME_CNT = 1000
+    # 一度に生成する組合せ数
+    CHUNK_SIZE = 500
+
     def __init__(self, options: MBlendOptions):
         self.options = options
 
@@ -61,10 +71,6 @@ class MorphBlendService():
 
         dt_now = datetime.now()
 
-        blend_fpath = "{0}\\{1}_blend_{2:%Y%m%d_%H%M%S}.vmd".format(pmx_dir_path, pmx_file_name, dt_now)
-
-        bone_motion = VmdMotion()
-
         # 処理対象モーフ名（文字列）
         target_morphs = self.options.eye_list + self.options.eyebrow_list + self.options.lip_list + self.options.other_list
 
@@ -73,87 +79,96 @@ class MorphBlendService():
         for mk, mv in self.options.model.morphs.items():
             if mv.display and mv.name in target_morphs:
                 all_morphs.append(mv)
-                bone_motion.morphs[mk] = {}
-
-        # 変化量(少ない方のの割合を多くする)
-        ratio_values = [self.options.inc_value * x for x in range(math.ceil(self.options.min_value / self.options.inc_value), \
-                        math.ceil(self.options.max_value / self.options.inc_value) + 1) if self.options.min_value <= self.options.inc_value * x <= self.options.max_value]
-        ratio_lower_values = [self.options.inc_value * x for x in range(math.ceil(self.options.min_value / self.options.inc_value), \
-                              math.ceil(self.options.max_value / self.options.inc_value / 2) + 1) if self.options.min_value <= self.options.inc_value * x <= self.options.max_value]
-        ratio_zero_values = [0 for x in range(len(all_morphs))]
-
-        # 全体の比率増減量
-        ratio_total_values = copy.deepcopy(ratio_values)
-        ratio_total_values.extend(ratio_lower_values)
-        ratio_total_values.extend(ratio_lower_values)
-        ratio_total_values.extend(ratio_zero_values)
-
-        # モーフの組合せ数
-        morph_comb_cnt = 1
+
+        # 変化量
+        ratio_ary = np.array([self.options.inc_value * x for x in range(math.ceil(self.options.min_value / self.options.inc_value), \
+                              math.ceil(self.options.max_value / self.options.inc_value) + 1) \
+                              if self.options.min_value <= self.options.inc_value * x <= self.options.max_value], dtype=np.float64)
+
         # 変化量の組合せ数
-        ratio_product_cnt = 1
-        for n in range(len(all_morphs), 0, -1):
-            morph_comb_cnt *= n
-            ratio_product_cnt *= len(ratio_values)
+        ratio_product_cnt = len(ratio_ary) ** len(all_morphs) if len(all_morphs) > 0 and len(ratio_ary) > 0 else 0
 
-        morph_total_cnt = 0
+        # 1ファイルに収まるフレーム数（上限を超える場合、複数ファイルに分けて出力する）
+        file_frame_cnt = max(1, min(self.MAX_FRAME_CNT, self.MAX_KEY_CNT // max(1, len(all_morphs))))
 
-        if morph_comb_cnt * ratio_product_cnt <= 1000:
-            # モーフの組合せ
-            morph_comb = list(itertools.combinations(all_morphs, len(all_morphs)))
-            logger.debug("morph_comb: %s", len(morph_comb))
-            
-            # 変化量の直積（同じ値を許容する）
-            ratio_product = list(itertools.product(ratio_values, repeat=len(all_morphs)))
-            logger.debug("ratio_product: %s", len(ratio_product))
+        # 全組合せが上限ファイル数に収まる場合は全組合せを複数ファイルに分けて出力、収まらない場合はランダム
+        # （「モーフ数の階乗×組合せ数」が1000以下の場合だけ全組合せを出力していた判定から、実際の出力ファイル数での判定に変更）
+        is_product = -(-ratio_product_cnt // file_frame_cnt) <= self.MAX_FILE_CNT
+        total_frame_cnt = ratio_product_cnt if is_product else self.RANDOM_FRAME_CNT
+        file_cnt = max(1, -(-total_frame_cnt // file_frame_cnt))
 
-            # 組合せが1000以下なら組合せをそのまま出力
-            brend_mr_pairs_list = list(itertools.product(morph_comb, ratio_product))
-            logger.debug("brend_mr_pairs_list: %s", len(brend_mr_pairs_list))
+        if not is_product:
+            logger.warning("変化量の組合せ数(%s)が多く、%sファイルに収まらないため、ランダムに%sフレーム出力します。", \
+                           ratio_product_cnt, self.MAX_FILE_CNT, self.RANDOM_FRAME_CNT, decoration=MLogger.DECORATION_BOX)
 
-            for mframe, (morphs, ratios) in enumerate(brend_mr_pairs_list):
-                # 上限までしか登録しない
-                if morph_total_cnt > 19000:
-                    break
+        file_idx = 0
+        mframe = 0
+        bone_motion = self.create_blend_motion(all_morphs)
 
-                for morph, ratio in zip(morphs, ratios):
+        for ratios_ary in self.generate_blend_ratios(ratio_ary, len(all_morphs), is_product, total_frame_cnt):
+            for ratios in ratios_ary:
+                for morph, ratio in zip(all_morphs, ratios):
                     vmd_morph = VmdMorphFrame()
                     vmd_morph.fno = mframe
                     vmd_morph.set_name(morph.name)
-                    vmd_morph.ratio = ratio
+                    vmd_morph.ratio = float(ratio)
                     vmd_morph.key = True
-                    
+
                     bone_motion.morphs[morph.name][mframe] = vmd_morph
                     logger.test(vmd_morph)
 
-                    morph_total_cnt += 1
+                mframe += 1
 
-        else:
-            # 組合せが1000より多い場合、ランダム
-            for mframe in range(1000):
-                # 上限までしか登録しない
-                if morph_total_cnt > 19000:
+                if mframe >= file_frame_cnt:
+                    # 上限まで登録したら、一旦出力して次のファイルへ
+                    self.write_blend_motion(bone_motion, pmx_dir_path, pmx_file_name, dt_now, file_idx, file_cnt)
+                    file_idx += 1
+                    mframe = 0
+                    bone_motion = self.create_blend_motion(all_morphs)
+
+        if mframe > 0 or file_idx == 0:
+            # 残りを出力
+            self.write_blend_motion(bone_motion, pmx_dir_path, pmx_file_name, dt_now, file_idx, file_cnt)
+
+        return True
+
+    # ブレンド比率の組合せを、CHUNK_SIZE件ずつの配列（組合せ数×モーフ数）で生成する
+    def generate_blend_ratios(self, ratio_ary: np.ndarray, morph_cnt: int, is_product: bool, frame_cnt: int):
+        if morph_cnt == 0 or len(ratio_ary) == 0:
+            return
+
+        if is_product:
+            # 変化量の直積（同じ値を許容する）を、必要な分だけ順番に取り出す
+            product_iter = itertools.product(range(len(ratio_ary)), repeat=morph_cnt)
+            while True:
+                ratio_idxs = list(itertools.islice(product_iter, self.CHUNK_SIZE))
+                if len(ratio_idxs) == 0:
                     break
 
-                for morph in all_morphs:
-                    ratio = ratio_total_values[random.randint(0, len(ratio_values) - 1)]
+                yield ratio_ary[np.array(ratio_idxs, dtype=np.int64)]
+        else:
+            # ランダムの場合、チャンク単位でまとめて変化量を選ぶ
+            for start_frame in range(0, frame_cnt, self.CHUNK_SIZE):
+                yield ratio_ary[np.random.randint(0, len(ratio_ary), size=(min(self.CHUNK_SIZE, frame_cnt - start_frame), morph_cnt))]
 
-                    vmd_morph = VmdMorphFrame()
-                    vmd_morph.fno = mframe
-                    vmd_morph.set_name(morph.name)
-                    vmd_morph.ratio = ratio
-                    vmd_morph.key = True
-                    
-                    bone_motion.morphs[morph.name][mframe] = vmd_morph
-                    logger.test(vmd_morph)
+    # 出力用のモーションを生成する
+    def create_blend_motion(self, all_morphs: list):
+        bone_motion = VmdMotion()
+
+        for morph in all_morphs:
+            bone_motion.morphs[morph.name] = {}
+
+        return bone_motion
+
+    # ブレンドモーションを出力する（複数ファイルの場合、連番を付ける）
+    def write_blend_motion(self, bone_motion: VmdMotion, pmx_dir_path: str, pmx_file_name: str, dt_now: datetime, file_idx: int, file_cnt: int):
+        if file_cnt > 1:
+            blend_fpath = "{0}\\{1}_blend_{2:%Y%m%d_%H%M%S}_{3:02d}.vmd".format(pmx_dir_path, pmx_file_name, dt_now, file_idx + 1)
+        else:
+            blend_fpath = "{0}\\{1}_blend_{2:%Y%m%d_%H%M%S}.vmd".format(pmx_dir_path, pmx_file_name, dt_now)
 
-                    morph_total_cnt += 1
-        
         data_set = MOptionsDataSet(bone_motion, self.options.model, self.options.model, blend_fpath, False, False, [], None, 0, [])
 
         VmdWriter(data_set).write()
 
         logger.info("モーフブレンドVMD: %s", blend_fpath, decoration=MLogger.DECORATION_BOX)
-
-        return True
-
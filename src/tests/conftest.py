@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+import struct
+
+import pytest
+
+# ボーンキーフレの補間曲線（MMDの初期値）
+DEFAULT_INTERPOLATION = bytes([20, 20, 0, 0, 20, 20, 20, 20, 107, 107, 107, 107, 107, 107, 107, 107] * 4)
+
+
+# テスト用のVMDバイト列を生成
+# bones: (ボーン名, フレーム番号, 位置(x, y, z), 回転(x, y, z, w)) のリスト
+# morphs: (モーフ名, フレーム番号, 度数) のリスト
+def build_vmd(bones=(), morphs=(), model_name="テストモデル"):
+    buffer = bytearray()
+    buffer += b"Vocaloid Motion Data 0002".ljust(30, b"\0")
+    buffer += model_name.encode("shift-jis").ljust(20, b"\0")
+
+    buffer += struct.pack("<I", len(bones))
+    for (bone_name, fno, position, rotation) in bones:
+        buffer += bone_name.encode("shift-jis").ljust(15, b"\0")
+        buffer += struct.pack("<I3f4f", fno, *position, *rotation)
+        buffer += DEFAULT_INTERPOLATION
+
+    buffer += struct.pack("<I", len(morphs))
+    for (morph_name, fno, ratio) in morphs:
+        buffer += morph_name.encode("shift-jis").ljust(15, b"\0")
+        buffer += struct.pack("<If", fno, ratio)
+
+    # カメラ・照明・セルフ影・IK
+    buffer += struct.pack("<4I", 0, 0, 0, 0)
+
+    return bytes(buffer)
+
+
+@pytest.fixture
+def vmd_path(tmp_path):
+    path = tmp_path / "test.vmd"
+    path.write_bytes(build_vmd(
+        bones=[("センター", 0, (0, 0, 0), (0, 0, 0, 1)), ("センター", 10, (1, 2, 3), (0, 0, 0, 1)),
+               ("上半身", 0, (0, 0, 0), (0.1, 0, 0, 0.99498744)), ("上半身", 5, (0, 0, 0), (0, 0.1, 0, 0.99498744))],
+        morphs=[("あ", 0, 0), ("あ", 10, 1), ("い", 3, 0.5), ("まばたき", 7, 0.25)]))
+
+    return str(path)
+
+
+@pytest.fixture
+def duplicate_vmd_path(tmp_path):
+    # 同じフレーム番号のキーが重複しているVMD（読み込み時は最初のキーを優先）
+    path = tmp_path / "duplicate.vmd"
+    path.write_bytes(build_vmd(
+        bones=[("センター", 0, (0, 0, 0), (0, 0, 0, 1)), ("センター", 10, (1, 2, 3), (0, 0, 0, 1)), ("センター", 10, (4, 5, 6), (0, 0, 0, 1)),
+               ("上半身", 0, (0, 0, 0), (0.1, 0, 0, 0.99498744))],
+        morphs=[("あ", 0, 0), ("あ", 0, 1), ("い", 3, 0.5)]))
+
+    return str(path)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+import math
+import random
+
+import numpy as np
+import pytest
+
+from module.MMath import MVector3D, MQuaternion, MMatrix4x4
+from mmd.PmxData import Sphere, Box, Capsule, get_collisions
+
+# 押し出し後の点を判定する際、境界から内側に戻す割合
+BOUNDARY_MARGIN = 1e-6
+
+
+# ボーンの位置・回転と剛体の位置・回転・サイズをランダムに決めた剛体
+def create_obb(rng, shape_class):
+    bone_pos = MVector3D(rng.uniform(-5, 5), rng.uniform(5, 15), rng.uniform(-5, 5))
+    bone_matrix = MMatrix4x4()
+    bone_matrix.setToIdentity()
+    bone_matrix.translate(bone_pos)
+    bone_matrix.rotate(MQuaternion.fromEulerAngles(rng.uniform(-90, 90), rng.uniform(-90, 90), rng.uniform(-90, 90)))
+
+    shape_size = MVector3D(rng.uniform(0.5, 2), rng.uniform(0.5, 2), rng.uniform(0.5, 2))
+    shape_position = bone_pos + MVector3D(rng.uniform(-1, 1), rng.uniform(-1, 1), rng.uniform(-1, 1))
+    shape_rotation = MVector3D(math.radians(rng.uniform(-90, 90)), math.radians(rng.uniform(-90, 90)), math.radians(rng.uniform(-90, 90)))
+
+    return shape_class(0, shape_size, shape_position, shape_rotation, "ボーン", bone_pos, {"ボーン": bone_matrix}, False, rng.random() < 0.5, False, False, False)
+
+
+# 剛体の周辺にばらまいた点
+def create_points(rng, obbs, cnt):
+    points = []
+    for _ in range(cnt):
+        obb = rng.choice(obbs)
+        points.append((obb.origin + MVector3D(rng.uniform(-3, 3), rng.uniform(-3, 3), rng.uniform(-3, 3))).data())
+
+    return np.array(points, dtype=np.float64)
+
+
+def get_scalar_collision(obb, point, base_size):
+    collision, near_collision, *_ = obb.get_collistion(MVector3D(*point), MVector3D(), 1e9, base_size)
+    return collision, near_collision
+
+
+@pytest.fixture(params=[Sphere, Box, Capsule], ids=["sphere", "box", "capsule"])
+def shape_class(request):
+    return request.param
+
+
+@pytest.mark.parametrize("base_size", [1.0, 1.3])
+class TestGetCollisions:
+    def test_masks(self, shape_class, base_size):
+        rng = random.Random(1)
+        obbs = [create_obb(rng, shape_class) for _ in range(5)]
+        points = create_points(rng, obbs, 400)
+
+        collisions, near_collisions, _ = get_collisions(obbs, points, base_size)
+
+        for pidx, point in enumerate(points):
+            for oidx, obb in enumerate(obbs):
+                assert (collisions[pidx, oidx], near_collisions[pidx, oidx]) == get_scalar_collision(obb, point, base_size), (pidx, oidx)
+
+        # 衝突ありと衝突なしの両方を確認できている
+        assert 0 < np.count_nonzero(collisions) < collisions.size
+
+    def test_penetrations(self, shape_class, base_size):
+        rng = random.Random(2)
+        obbs = [create_obb(rng, shape_class) for _ in range(5)]
+        points = create_points(rng, obbs, 400)
+
+        collisions, _, penetrations = get_collisions(obbs, points, base_size)
+
+        # 衝突していない組み合わせは押し出さない
+        assert np.all(penetrations[~collisions] == 0)
+
+        # 押し出した点は剛体の外（近くにはある）
+        for pidx, oidx in zip(*np.nonzero(collisions)):
+            pushed_point = points[pidx] + penetrations[pidx, oidx] * (1 - BOUNDARY_MARGIN)
+            assert get_scalar_collision(obbs[oidx], pushed_point, base_size) == (False, True), (pidx, oidx)
+
+    def test_mixed_shapes(self, base_size):
+        rng = random.Random(3)
+        obbs = [create_obb(rng, shape_class) for shape_class in [Sphere, Box, Capsule, Box, Sphere, Capsule]]
+        points = create_points(rng, obbs, 200)
+
+        collisions, near_collisions, penetrations = get_collisions(obbs, points, base_size)
+
+        assert collisions.shape == near_collisions.shape == (len(points), len(obbs))
+        assert penetrations.shape == (len(points), len(obbs), 3)
+
+        # 剛体ごとに判定しても同じ結果になる
+        for oidx, obb in enumerate(obbs):
+            single_collisions, single_near_collisions, single_penetrations = get_collisions([obb], points, base_size)
+            assert np.array_equal(collisions[:, oidx], single_collisions[:, 0])
+            assert np.array_equal(near_collisions[:, oidx], single_near_collisions[:, 0])
+            assert np.array_equal(penetrations[:, oidx], single_penetrations[:, 0])
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#
+import hashlib
+import json
+import os
+import mmap
+
+import pytest
+
+from utils import MFileUtils
+from mmd.VmdReader import VmdReader
+from mmd.PmxReader import PmxReader
+from mmd.VpdReader import VpdReader
+
+
+# 従来のハッシュ値の求め方（最後の塊を二回ハッシュに含める）
+def legacy_digest(file_path):
+    sha1 = hashlib.sha1()
+
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2048 * sha1.block_size), b''):
+            sha1.update(chunk)
+
+    sha1.update(chunk)
+    sha1.update(file_path.encode('utf-8'))
+
+    return sha1.hexdigest()
+
+
+@pytest.fixture(autouse=True)
+def file_digests(monkeypatch):
+    digests = {}
+    monkeypatch.setattr(MFileUtils, "file_digests", digests)
+
+    return digests
+
+
+CHUNK_SIZE = 2048 * hashlib.sha1().block_size
+
+
+@pytest.fixture(params=[1, 1000, CHUNK_SIZE, CHUNK_SIZE + 1, CHUNK_SIZE * 2 + 5])
+def data_path(request, tmp_path):
+    path = tmp_path / "data.vmd"
+    path.write_bytes(bytes(range(256)) * (request.param // 256) + bytes(request.param % 256))
+
+    return str(path)
+
+
+class TestCalcFileDigest:
+
+    def test_stream(self, data_path):
+        assert MFileUtils.calc_file_digest(data_path) == legacy_digest(data_path)
+
+    def test_buffer(self, data_path):
+        with open(data_path, "rb") as f:
+            buffer = f.read()
+
+        assert MFileUtils.calc_file_digest(data_path, buffer) == legacy_digest(data_path)
+
+    def test_mmap(self, data_path):
+        with open(data_path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        assert MFileUtils.calc_file_digest(data_path, buffer) == legacy_digest(data_path)
+        # ハッシュ計算後に閉じられる
+        buffer.close()
+
+    def test_empty(self, tmp_path):
+        path = tmp_path / "empty.vmd"
+        path.write_bytes(b"")
+
+        assert MFileUtils.calc_file_digest(str(path)) == MFileUtils.calc_file_digest(str(path), b"")
+
+    def test_readers(self, data_path):
+        assert VmdReader(data_path).hexdigest() == legacy_digest(data_path)
+        assert PmxReader(data_path).hexdigest() == legacy_digest(data_path)
+
+    def test_cached(self, data_path, file_digests):
+        digest = MFileUtils.calc_file_digest(data_path)
+
+        assert file_digests[data_path][2] == digest
+        assert MFileUtils.get_cached_digest(data_path) == digest
+
+
+VPD_TEXT = """Vocaloid Pose Data file
+
+テストモデル.osm;		// 親ファイル名
+1;				// 総ポーズボーン数
+
+Bone0{センター
+  1.000000,2.000000,3.000000;				// trans x,y,z
+  0.000000,0.000000,0.000000,1.000000;		// Quaternion x,y,z,w
+}
+"""
+
+
+class TestVpdDigest:
+
+    def test_read_data(self, tmp_path):
+        path = tmp_path / "pose.vpd"
+        path.write_bytes(VPD_TEXT.encode("shift-jis"))
+
+        motion = VpdReader(str(path)).read_data()
+
+        assert motion.bones["センター"][0].position.y() == 2
+        assert motion.digest == legacy_digest(str(path))
+
+    def test_dir_data(self, tmp_path):
+        paths = []
+        for n in range(2):
+            path = tmp_path / "pose{0}.vpd".format(n)
+            path.write_bytes(VPD_TEXT.encode("shift-jis"))
+            paths.append(str(path))
+
+        sha1 = hashlib.sha1()
+        for path in paths:
+            sha1.update(legacy_digest(path).encode('utf-8'))
+
+        assert VpdReader.read_dir_data(str(tmp_path)).digest == sha1.hexdigest()
+
+
+class TestDigestCache:
+
+    def test_buffer_without_stat(self, data_path, file_digests):
+        with open(data_path, "rb") as f:
+            buffer = f.read()
+
+        # 読み込み時のファイル情報がない場合、キャッシュしない
+        MFileUtils.calc_file_digest(data_path, buffer)
+
+        assert data_path not in file_digests
+
+    def test_written_after_read(self, vmd_path, file_digests):
+        reader = VmdReader(vmd_path)
+        motion = reader.read_data()
+
+        # 読み込み後、キャッシュ登録前に書き換えられた場合でも、古いハッシュ値は使わない
+        file_digests.clear()
+        with open(vmd_path, "ab") as f:
+            f.write(b"\0")
+
+        assert reader.hexdigest(reader.buffer, reader.buffer_stat) == motion.digest
+        assert MFileUtils.get_cached_digest(vmd_path) is None
+        assert VmdReader(vmd_path).hexdigest() != motion.digest
+
+
+    def test_save_and_read(self, vmd_path, tmp_path, file_digests):
+        digest = MFileUtils.calc_file_digest(vmd_path)
+        MFileUtils.save_digest_cache(str(tmp_path))
+
+        file_digests.clear()
+        MFileUtils.read_digest_cache(str(tmp_path))
+
+        assert MFileUtils.get_cached_digest(vmd_path) == digest
+
+    def test_old_cache_ignored(self, vmd_path, tmp_path):
+        # 形式の違う（ハッシュ値の求め方が違う）キャッシュは使わない
+        stat = os.stat(vmd_path)
+        with open(str(tmp_path / "digest.json"), "w", encoding="utf-8") as f:
+            json.dump({vmd_path: [stat.st_size, stat.st_mtime_ns, "old"]}, f)
+
+        MFileUtils.read_digest_cache(str(tmp_path))
+
+        assert MFileUtils.get_cached_digest(vmd_path) is None
+        assert MFileUtils.calc_file_digest(vmd_path) == legacy_digest(vmd_path)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+import pytest
+
+from mmd.VmdReader import VmdReader
+
+
+class TestLoadOptions:
+
+    def test_filtered_options(self, vmd_path):
+        assert VmdReader(vmd_path).get_load_options() == VmdReader(vmd_path).get_load_options()
+        assert VmdReader(vmd_path, morph_names=["い", "あ"]).get_load_options() == VmdReader(vmd_path, morph_names=["あ", "い"]).get_load_options()
+        assert VmdReader(vmd_path, bone_names=[], morph_names=["あ"]).get_load_options() != VmdReader(vmd_path).get_load_options()
+        assert VmdReader(vmd_path, is_mmap=True).get_load_options() != VmdReader(vmd_path).get_load_options()
+
+    def test_filtered_read(self, vmd_path):
+        motion = VmdReader(vmd_path, bone_names=[], morph_names=["あ"]).read_data()
+
+        assert list(motion.morphs.keys()) == ["あ"]
+        assert sorted(motion.raw_morphs.keys()) == ["い", "まばたき"]
+
+
+class PathCtrl:
+
+    def __init__(self, path):
+        self.path = path
+
+    def GetPath(self):
+        return self.path
+
+
+# 画面部品を作らずに読み込み処理だけ使えるファイルピッカー
+def create_picker(path):
+    pytest.importorskip("wx")
+    from form.parts.BaseFilePickerCtrl import BaseFilePickerCtrl
+
+    picker = BaseFilePickerCtrl.__new__(BaseFilePickerCtrl)
+    picker.title = "テスト"
+    picker.file_ctrl = PathCtrl(path)
+    picker.file_type = ("vmd", "vpd")
+    picker.set_no = 0
+    picker.is_aster = False
+    picker.is_save = False
+    picker.required = True
+    picker.data = None
+    picker.data_signature = None
+    picker.data_load_options = None
+
+    return picker
+
+
+class TestPickerLoad:
+
+    def test_filtered_then_unfiltered(self, vmd_path):
+        picker = create_picker(vmd_path)
+
+        assert picker.load(bone_names=[], morph_names=["あ"])
+        filtered_data = picker.data
+        assert list(picker.data.morphs.keys()) == ["あ"]
+
+        # 同じファイルでも、展開対象が違う場合は読み直す
+        assert picker.load()
+        assert picker.data is not filtered_data
+        assert sorted(picker.data.morphs.keys()) == ["あ", "い", "まばたき"]
+        assert sorted(picker.data.bones.keys()) == ["センター", "上半身"]
+
+    def test_same_options_reused(self, vmd_path):
+        picker = create_picker(vmd_path)
+
+        assert picker.load(bone_names=[], morph_names=["あ"])
+        filtered_data = picker.data
+
+        assert picker.load(bone_names=[], morph_names=["あ"])
+        assert picker.data is filtered_data
+
+    def test_closed_data_reloaded(self, vmd_path):
+        picker = create_picker(vmd_path)
+
+        assert picker.load(is_mmap=True)
+        mmap_data = picker.data
+        picker.close_data()
+
+        # 閉じたメモリマップは使い回さず、次回は読み直す
+        assert mmap_data.raw_buffer is None
+        assert picker.data is None
+        assert picker.load(is_mmap=True)
+        assert picker.data is not mmap_data
+        assert not picker.data.raw_buffer.closed
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#
+import io
+import random
+import struct
+from types import SimpleNamespace
+
+import pytest
+
+from module.MMath import MVector2D, MVector3D, MVector4D, MQuaternion
+from mmd.PmxData import Vertex, Bdef1, Bdef2, Bdef4, Sdef, VertexMorphOffset, UVMorphData, BoneMorphData, MaterialMorphData, GroupMorphData
+from mmd.PmxWriter import PmxWriter, TYPE_FLOAT, TYPE_BYTE, TYPE_UNSIGNED_BYTE, TYPE_SHORT, TYPE_UNSIGNED_SHORT, TYPE_INT
+
+# 各型で出力可能なIndexの範囲
+INDEX_RANGES = {TYPE_BYTE: (-1, 127), TYPE_UNSIGNED_BYTE: (0, 255), TYPE_SHORT: (-1, 32767), TYPE_UNSIGNED_SHORT: (0, 65535), TYPE_INT: (-1, 2 ** 31 - 1)}
+
+# Indexサイズが 1,2,4 になるデータ数
+INDEX_SIZE_COUNTS = [10, 1000, 100000]
+
+
+# 一括出力前の、1件ずつ出力していた頂点データ
+def legacy_write_vertices(fout, vertices, bone_idx_type):
+    for vertex in vertices:
+        fout.write(struct.pack(TYPE_FLOAT, float(vertex.position.x())))
+        fout.write(struct.pack(TYPE_FLOAT, float(vertex.position.y())))
+        fout.write(struct.pack(TYPE_FLOAT, float(vertex.position.z())))
+        fout.write(struct.pack(TYPE_FLOAT, float(vertex.normal.x())))
+        fout.write(struct.pack(TYPE_FLOAT, float(vertex.normal.y())))
+        fout.write(struct.pack(TYPE_FLOAT, float(vertex.normal.z())))
+        fout.write(struct.pack(TYPE_FLOAT, float(vertex.uv.x())))
+        fout.write(struct.pack(TYPE_FLOAT, float(vertex.uv.y())))
+        for uv in vertex.extended_uvs:
+            fout.write(struct.pack(TYPE_FLOAT, float(uv.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(uv.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(uv.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(uv.w())))
+
+        if type(vertex.deform) is Bdef1:
+            fout.write(struct.pack(TYPE_BYTE, 0))
+            fout.write(struct.pack(bone_idx_type, int(vertex.deform.index0)))
+        elif type(vertex.deform) is Bdef2:
+            fout.write(struct.pack(TYPE_BYTE, 1))
+            fout.write(struct.pack(bone_idx_type, int(vertex.deform.index0)))
+            fout.write(struct.pack(bone_idx_type, int(vertex.deform.index1)))
+            fout.write(struct.pack(TYPE_FLOAT, vertex.deform.weight0))
+        elif type(vertex.deform) is Bdef4:
+            fout.write(struct.pack(TYPE_BYTE, 2))
+            fout.write(struct.pack(bone_idx_type, int(vertex.deform.index0)))
+            fout.write(struct.pack(bone_idx_type, int(vertex.deform.index1)))
+            fout.write(struct.pack(bone_idx_type, int(vertex.deform.index2)))
+            fout.write(struct.pack(bone_idx_type, int(vertex.deform.index3)))
+            fout.write(struct.pack(TYPE_FLOAT, vertex.deform.weight0))
+            fout.write(struct.pack(TYPE_FLOAT, vertex.deform.weight1))
+            fout.write(struct.pack(TYPE_FLOAT, vertex.deform.weight2))
+            fout.write(struct.pack(TYPE_FLOAT, vertex.deform.weight3))
+        elif type(vertex.deform) is Sdef:
+            fout.write(struct.pack(TYPE_BYTE, 3))
+            fout.write(struct.pack(bone_idx_type, int(vertex.deform.index0)))
+            fout.write(struct.pack(bone_idx_type, int(vertex.deform.index1)))
+            fout.write(struct.pack(TYPE_FLOAT, vertex.deform.weight0))
+            for v in (vertex.deform.sdef_c, vertex.deform.sdef_r0, vertex.deform.sdef_r1):
+                fout.write(struct.pack(TYPE_FLOAT, float(v.x())))
+                fout.write(struct.pack(TYPE_FLOAT, float(v.y())))
+                fout.write(struct.pack(TYPE_FLOAT, float(v.z())))
+
+        fout.write(struct.pack(TYPE_FLOAT, float(vertex.edge_factor)))
+
+
+# 一括出力前の、1件ずつ出力していたモーフのオフセットデータ
+def legacy_write_morph_offsets(fout, offsets, vertex_idx_type, bone_idx_type, material_idx_type, morph_idx_type):
+    for offset in offsets:
+        if type(offset) is VertexMorphOffset:
+            fout.write(struct.pack(vertex_idx_type, offset.vertex_index))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.position_offset.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.position_offset.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.position_offset.z())))
+        elif type(offset) is UVMorphData:
+            fout.write(struct.pack(vertex_idx_type, offset.vertex_index))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.uv.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.uv.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.uv.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.uv.w())))
+        elif type(offset) is BoneMorphData:
+            fout.write(struct.pack(bone_idx_type, offset.bone_index))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.position.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.position.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.position.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.rotation.x())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.rotation.y())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.rotation.z())))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.rotation.scalar())))
+        elif type(offset) is MaterialMorphData:
+            fout.write(struct.pack(material_idx_type, offset.material_index))
+            fout.write(struct.pack(TYPE_BYTE, int(offset.calc_mode)))
+            for v in (offset.diffuse, offset.specular, offset.specular_factor, offset.ambient, offset.edge_color, offset.edge_size,
+                      offset.texture_factor, offset.sphere_texture_factor, offset.toon_texture_factor):
+                if isinstance(v, MVector4D):
+                    fout.write(struct.pack(TYPE_FLOAT, float(v.x())))
+                    fout.write(struct.pack(TYPE_FLOAT, float(v.y())))
+                    fout.write(struct.pack(TYPE_FLOAT, float(v.z())))
+                    fout.write(struct.pack(TYPE_FLOAT, float(v.w())))
+                elif isinstance(v, MVector3D):
+                    fout.write(struct.pack(TYPE_FLOAT, float(v.x())))
+                    fout.write(struct.pack(TYPE_FLOAT, float(v.y())))
+                    fout.write(struct.pack(TYPE_FLOAT, float(v.z())))
+                else:
+                    fout.write(struct.pack(TYPE_FLOAT, float(v)))
+        elif type(offset) is GroupMorphData:
+            fout.write(struct.pack(morph_idx_type, offset.morph_index))
+            fout.write(struct.pack(TYPE_FLOAT, float(offset.value)))
+
+
+def rand_value(rng):
+    # float32で丸めが発生する値を使う
+    return rng.uniform(-100, 100)
+
+
+def rand_index(rng, idx_type):
+    return rng.randint(*INDEX_RANGES[idx_type])
+
+
+def rand_vector3(rng):
+    return MVector3D(rand_value(rng), rand_value(rng), rand_value(rng))
+
+
+def rand_vector4(rng):
+    return MVector4D(rand_value(rng), rand_value(rng), rand_value(rng), rand_value(rng))
+
+
+def create_deform(rng, deform_type, bone_idx_type):
+    indexes = [rand_index(rng, bone_idx_type) for _ in range(4)]
+    if deform_type is Bdef1:
+        return Bdef1(indexes[0])
+    elif deform_type is Bdef2:
+        return Bdef2(indexes[0], indexes[1], rng.random())
+    elif deform_type is Bdef4:
+        return Bdef4(*indexes, rng.random(), rng.random(), rng.random(), rng.random())
+    return Sdef(indexes[0], indexes[1], rng.random(), rand_vector3(rng), rand_vector3(rng), rand_vector3(rng))
+
+
+def create_vertices(rng, cnt, bone_idx_type, deform_types=(Bdef1, Bdef2, Bdef4, Sdef), extended_uv_cnts=(0, 1, 2, 3, 4)):
+    vertices = {}
+    for vidx in range(cnt):
+        deform = create_deform(rng, rng.choice(deform_types), bone_idx_type)
+        extended_uvs = [rand_vector4(rng) for _ in range(rng.choice(extended_uv_cnts))]
+        vertices[vidx] = Vertex(vidx, rand_vector3(rng), rand_vector3(rng), MVector2D(rng.random(), rng.random()), extended_uvs, deform, rng.random())
+
+    return vertices
+
+
+def create_offset(rng, offset_type, index_types):
+    vertex_idx_type, bone_idx_type, material_idx_type, morph_idx_type = index_types
+    if offset_type is VertexMorphOffset:
+        return VertexMorphOffset(rand_index(rng, vertex_idx_type), rand_vector3(rng))
+    elif offset_type is UVMorphData:
+        return UVMorphData(rand_index(rng, vertex_idx_type), rand_vector4(rng))
+    elif offset_type is BoneMorphData:
+        return BoneMorphData(rand_index(rng, bone_idx_type), rand_vector3(rng), MQuaternion(rand_value(rng), rand_value(rng), rand_value(rng), rand_value(rng)))
+    elif offset_type is MaterialMorphData:
+        return MaterialMorphData(rand_index(rng, material_idx_type), rng.randint(0, 1), rand_vector4(rng), rand_vector3(rng), rand_value(rng), rand_vector3(rng),
+                                 rand_vector4(rng), rand_value(rng), rand_vector4(rng), rand_vector4(rng), rand_vector4(rng))
+    return GroupMorphData(rand_index(rng, morph_idx_type), rand_value(rng))
+
+
+@pytest.fixture(params=INDEX_SIZE_COUNTS, ids=["1byte", "2byte", "4byte"])
+def index_types(request):
+    writer = PmxWriter()
+    _, vertex_idx_type = writer.define_vertex_index_size(request.param)
+    _, idx_type = writer.define_index_size(request.param)
+
+    # 頂点・ボーン・材質・モーフ
+    return vertex_idx_type, idx_type, idx_type, idx_type
+
+
+class TestWriteVertices:
+    @pytest.mark.parametrize("deform_type", [Bdef1, Bdef2, Bdef4, Sdef])
+    @pytest.mark.parametrize("extended_uv_cnt", [0, 1, 2, 3, 4])
+    def test_single_type(self, deform_type, extended_uv_cnt, index_types):
+        bone_idx_type = index_types[1]
+        vertices = create_vertices(random.Random(1), 50, bone_idx_type, deform_types=(deform_type,), extended_uv_cnts=(extended_uv_cnt,))
+        self.assert_same_bytes(vertices, bone_idx_type)
+
+    def test_mixed_types(self, index_types):
+        bone_idx_type = index_types[1]
+        vertices = create_vertices(random.Random(2), 500, bone_idx_type)
+        self.assert_same_bytes(vertices, bone_idx_type)
+
+    def test_multiple_chunks(self, monkeypatch):
+        # チャンクをまたいでも頂点順が保たれる
+        monkeypatch.setattr("mmd.PmxWriter.VERTEX_CHUNK_SIZE", 7)
+        vertices = create_vertices(random.Random(3), 100, TYPE_SHORT)
+        self.assert_same_bytes(vertices, TYPE_SHORT)
+
+    def test_empty(self):
+        self.assert_same_bytes({}, TYPE_BYTE)
+
+    def assert_same_bytes(self, vertices, bone_idx_type):
+        expected = io.BytesIO()
+        legacy_write_vertices(expected, vertices.values(), bone_idx_type)
+
+        actual = io.BytesIO()
+        PmxWriter().write_vertices(actual, SimpleNamespace(vertex_dict=vertices), bone_idx_type)
+
+        assert actual.getvalue() == expected.getvalue()
+
+
+class TestWriteIndices:
+    def test_indices(self, index_types):
+        vertex_idx_type = index_types[0]
+        rng = random.Random(4)
+        indices = {iidx: [rand_index(rng, vertex_idx_type) for _ in range(3)] for iidx in range(100)}
+
+        expected = io.BytesIO()
+        for index_list in indices.values():
+            for index in index_list:
+                expected.write(struct.pack(vertex_idx_type, index))
+
+        actual = io.BytesIO()
+        PmxWriter().write_indices(actual, SimpleNamespace(indices=indices), vertex_idx_type)
+
+        assert actual.getvalue() == expected.getvalue()
+
+
+class TestWriteMorphOffsets:
+    @pytest.mark.parametrize("offset_type", [VertexMorphOffset, UVMorphData, BoneMorphData, MaterialMorphData, GroupMorphData])
+    def test_single_type(self, offset_type, index_types):
+        rng = random.Random(5)
+        offsets = [create_offset(rng, offset_type, index_types) for _ in range(30)]
+        self.assert_same_bytes(offsets, index_types)
+
+    def test_mixed_types(self, index_types):
+        rng = random.Random(6)
+        offset_types = [VertexMorphOffset, UVMorphData, BoneMorphData, MaterialMorphData, GroupMorphData]
+        offsets = [create_offset(rng, rng.choice(offset_types), index_types) for _ in range(100)]
+        self.assert_same_bytes(offsets, index_types)
+
+    def test_empty(self, index_types):
+        self.assert_same_bytes([], index_types)
+
+    def assert_same_bytes(self, offsets, index_types):
+        expected = io.BytesIO()
+        legacy_write_morph_offsets(expected, offsets, *index_types)
+
+        actual = io.BytesIO()
+        PmxWriter().write_morph_offsets(actual, offsets, *index_types)
+
+        assert actual.getvalue() == expected.getvalue()
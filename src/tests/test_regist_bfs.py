@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+import random
+
+import pytest
+
+from module.MMath import MVector3D, MQuaternion
+from mmd.VmdData import VmdMotion, VmdBoneFrame
+from utils import MBezierUtils
+
+BONE_NAME = "センター"
+
+# 一括登録と1件ずつの登録で許容する誤差
+TOLERANCE = 1e-6
+
+# 補間曲線のインデックス（回転, 移動X, 移動Y, 移動Z）
+INTERPOLATION_IDXS = [
+    (MBezierUtils.R_x1_idxs, MBezierUtils.R_y1_idxs, MBezierUtils.R_x2_idxs, MBezierUtils.R_y2_idxs),
+    (MBezierUtils.MX_x1_idxs, MBezierUtils.MX_y1_idxs, MBezierUtils.MX_x2_idxs, MBezierUtils.MX_y2_idxs),
+    (MBezierUtils.MY_x1_idxs, MBezierUtils.MY_y1_idxs, MBezierUtils.MY_x2_idxs, MBezierUtils.MY_y2_idxs),
+    (MBezierUtils.MZ_x1_idxs, MBezierUtils.MZ_y1_idxs, MBezierUtils.MZ_x2_idxs, MBezierUtils.MZ_y2_idxs),
+]
+
+
+def rand_rotation(rng):
+    return MQuaternion.fromEulerAngles(rng.uniform(-90, 90), rng.uniform(-90, 90), rng.uniform(-90, 90))
+
+
+# キーをランダムに配置したモーション
+def create_motion(rng, key_cnt):
+    motion = VmdMotion()
+    motion.bones[BONE_NAME] = {}
+
+    for fno in sorted(rng.sample(range(0, 100), key_cnt)):
+        bf = VmdBoneFrame(fno)
+        bf.set_name(BONE_NAME)
+        bf.position = MVector3D(rng.uniform(-10, 10), rng.uniform(-10, 10), rng.uniform(-10, 10))
+        bf.rotation = rand_rotation(rng)
+        bf.org_rotation = rand_rotation(rng)
+        for x1_idxs, y1_idxs, x2_idxs, y2_idxs in INTERPOLATION_IDXS:
+            for idxs in (x1_idxs, y1_idxs, x2_idxs, y2_idxs):
+                value = rng.randint(0, 127)
+                for idx in idxs:
+                    bf.interpolation[idx] = value
+        bf.key = True
+        bf.read = True
+        motion.bones[BONE_NAME][fno] = bf
+        motion.last_motion_frame = max(motion.last_motion_frame, fno)
+
+    return motion
+
+
+# 登録対象（フレーム番号, 位置, 回転）
+def create_targets(rng, cnt):
+    return [(rng.randint(0, 110), MVector3D(rng.uniform(-10, 10), rng.uniform(-10, 10), rng.uniform(-10, 10)), rand_rotation(rng)) for _ in range(cnt)]
+
+
+# 1件ずつ登録
+def regist_sequential(motion, targets, is_value):
+    for fno, position, rotation in targets:
+        bf = motion.calc_bf(BONE_NAME, fno)
+        if is_value:
+            bf.position = position
+            bf.rotation = rotation
+        motion.regist_bf(bf, BONE_NAME, fno)
+
+
+# 一括登録
+def regist_bulk(motion, targets, is_value):
+    fnos = [fno for fno, _, _ in targets]
+    if is_value:
+        motion.regist_bfs(BONE_NAME, fnos, positions=[position for _, position, _ in targets], rotations=[rotation for _, _, rotation in targets])
+    else:
+        motion.regist_bfs(BONE_NAME, fnos)
+
+
+def qq_values(qq):
+    return [qq.scalar(), qq.x(), qq.y(), qq.z()]
+
+
+def assert_same_frames(expected_motion, actual_motion):
+    expected_frames = expected_motion.bones[BONE_NAME]
+    actual_frames = actual_motion.bones[BONE_NAME]
+
+    assert sorted(actual_frames.keys()) == sorted(expected_frames.keys())
+
+    for fno, expected_bf in expected_frames.items():
+        actual_bf = actual_frames[fno]
+        assert actual_bf.key == expected_bf.key, fno
+        assert actual_bf.read == expected_bf.read, fno
+        assert actual_bf.interpolation == expected_bf.interpolation, fno
+        assert actual_bf.position.data() == pytest.approx(expected_bf.position.data(), abs=TOLERANCE), fno
+        assert qq_values(actual_bf.rotation) == pytest.approx(qq_values(expected_bf.rotation), abs=TOLERANCE), fno
+        assert qq_values(actual_bf.org_rotation) == pytest.approx(qq_values(expected_bf.org_rotation), abs=TOLERANCE), fno
+
+
+class TestRegistBfs:
+    @pytest.mark.parametrize("is_value", [True, False], ids=["value", "current"])
+    @pytest.mark.parametrize("seed", range(200))
+    def test_same_as_regist_bf(self, seed, is_value):
+        rng = random.Random(seed)
+        expected_motion = create_motion(rng, 6)
+        actual_motion = expected_motion.copy()
+        targets = create_targets(rng, 5)
+
+        regist_sequential(expected_motion, targets, is_value)
+        regist_bulk(actual_motion, targets, is_value)
+
+        assert_same_frames(expected_motion, actual_motion)
+
+    def test_empty_bone(self):
+        rng = random.Random(1)
+        expected_motion = VmdMotion()
+        actual_motion = VmdMotion()
+        targets = create_targets(rng, 5)
+
+        regist_sequential(expected_motion, targets, True)
+        regist_bulk(actual_motion, targets, True)
+
+        assert_same_frames(expected_motion, actual_motion)
+
+    def test_many_keys(self):
+        rng = random.Random(2)
+        expected_motion = create_motion(rng, 30)
+        actual_motion = expected_motion.copy()
+        targets = [(fno, *target[1:]) for fno, target in zip(range(0, 110), create_targets(rng, 110))]
+
+        regist_sequential(expected_motion, targets, True)
+        regist_bulk(actual_motion, targets, True)
+
+        assert_same_frames(expected_motion, actual_motion)
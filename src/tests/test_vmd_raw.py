@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+import pickle
+from types import SimpleNamespace
+
+import pytest
+
+from module.MMath import MVector3D, MQuaternion
+from mmd.VmdReader import VmdReader
+from mmd.VmdWriter import VmdWriter
+from utils.MException import SizingException
+
+
+# VmdWriterで出力して、出力したファイルを読み直す
+def write_and_read(motion, tmp_path):
+    output_path = str(tmp_path / "output.vmd")
+    data_set = SimpleNamespace(output_vmd_path=output_path, motion=motion, rep_model=SimpleNamespace(name="テストモデル"))
+    VmdWriter(data_set).write()
+
+    return output_path, VmdReader(output_path).read_data()
+
+
+@pytest.fixture(params=[False, True], ids=["read", "mmap"])
+def motion(request, vmd_path):
+    motion = VmdReader(vmd_path, is_mmap=request.param).read_data()
+    motion.load_bones(*motion.raw_bones.keys())
+    motion.load_morphs(*motion.raw_morphs.keys())
+
+    return motion
+
+
+class TestRawPassThrough:
+
+    def test_unchanged_write(self, motion, vmd_path, tmp_path):
+        output_path, _ = write_and_read(motion, tmp_path)
+
+        # 何も変更しなければ、キーフレは読み込み時のバイト列のまま
+        with open(vmd_path, "rb") as f:
+            org_buffer = f.read()
+        with open(output_path, "rb") as f:
+            output_buffer = f.read()
+
+        assert output_buffer[50:] == org_buffer[50:]
+
+    def test_bone_in_place_edit(self, motion, tmp_path):
+        motion.bones["センター"][10].position = MVector3D(5, 6, 7)
+        motion.bones["上半身"][5].rotation = MQuaternion(1, 0, 0, 0)
+
+        _, output_motion = write_and_read(motion, tmp_path)
+
+        assert output_motion.bones["センター"][10].position.to_log() == MVector3D(5, 6, 7).to_log()
+        assert output_motion.bones["センター"][0].position.to_log() == MVector3D().to_log()
+        assert output_motion.bones["上半身"][5].rotation.scalar() == 1
+        assert output_motion.bones["上半身"][0].rotation.x() == pytest.approx(0.1)
+
+    def test_bone_nested_edit(self, motion, tmp_path):
+        # 位置・補間曲線の中身を直接書き換えても、その時点で変更済みになる
+        motion.bones["センター"][10].position.setY(8)
+        motion.bones["上半身"][5].interpolation[0] = 64
+
+        assert "センター" not in motion.unchanged_bones
+        assert "上半身" not in motion.unchanged_bones
+
+        _, output_motion = write_and_read(motion, tmp_path)
+
+        assert output_motion.bones["センター"][10].position.y() == 8
+        assert output_motion.bones["上半身"][5].interpolation[0] == 64
+
+    def test_copy_edit(self, motion, tmp_path):
+        # コピー先の変更は、コピー元の未変更に影響しない
+        copy_motion = motion.copy()
+        copy_motion.bones["センター"][10].position = MVector3D(5, 6, 7)
+        copy_motion.morphs["い"][3].ratio = 0.75
+
+        assert "センター" not in copy_motion.unchanged_bones
+        assert "い" not in copy_motion.unchanged_morphs
+        assert "センター" in motion.unchanged_bones
+        assert "い" in motion.unchanged_morphs
+
+        _, output_motion = write_and_read(copy_motion, tmp_path)
+
+        assert output_motion.bones["センター"][10].position.to_log() == MVector3D(5, 6, 7).to_log()
+        assert output_motion.morphs["い"][3].ratio == 0.75
+
+    def test_bone_frame_added(self, motion, tmp_path):
+        bf = motion.bones["センター"][10].copy()
+        bf.fno = 20
+        motion.bones["センター"][20] = bf
+
+        _, output_motion = write_and_read(motion, tmp_path)
+
+        assert sorted(output_motion.bones["センター"].keys()) == [0, 10, 20]
+
+    def test_morph_in_place_edit(self, motion, tmp_path):
+        motion.morphs["い"][3].ratio = 0.75
+
+        _, output_motion = write_and_read(motion, tmp_path)
+
+        assert output_motion.morphs["い"][3].ratio == 0.75
+        assert output_motion.morphs["あ"][10].ratio == 1
+        assert output_motion.morphs["まばたき"][7].ratio == 0.25
+
+
+class TestClose:
+
+    def test_close_mmap(self, vmd_path, tmp_path):
+        motion = VmdReader(vmd_path, is_mmap=True).read_data()
+        motion.load_bones(*motion.raw_bones.keys())
+        motion.load_morphs(*motion.raw_morphs.keys())
+        copy_motion = motion.copy()
+        raw_buffer = motion.raw_buffer
+
+        motion.close()
+
+        # メモリマップはバイト列にコピーせずに閉じて、コピー先も読み込み元を手放す
+        assert raw_buffer.closed
+        assert motion.raw_buffer is None
+        assert copy_motion.raw_buffer is None
+
+        # 展開済みのキーフレは展開済みの値で出力する
+        _, output_motion = write_and_read(motion, tmp_path)
+        assert sorted(output_motion.bones.keys()) == ["センター", "上半身"]
+        assert sorted(output_motion.morphs.keys()) == ["あ", "い", "まばたき"]
+        assert output_motion.bones["センター"][10].position.to_log() == MVector3D(1, 2, 3).to_log()
+        assert output_motion.morphs["い"][3].ratio == 0.5
+
+        # 二回目は何もしない
+        motion.close()
+
+    def test_closed_raw_frames(self, vmd_path):
+        motion = VmdReader(vmd_path, is_mmap=True).read_data()
+        copy_motion = motion.copy()
+
+        motion.close()
+
+        # 未展開のキーフレは、閉じた後は参照できない
+        with pytest.raises(SizingException):
+            motion.load_morphs("い")
+        with pytest.raises(SizingException):
+            copy_motion.get_raw_bone_offsets()
+
+
+class TestDuplicateRecord:
+
+    @pytest.mark.parametrize("reader_kwargs", [dict(is_mmap=True), dict(bone_names=["上半身"], morph_names=["い"]), dict(is_mmap=True, bone_names=["上半身"])],
+                             ids=["mmap", "filter", "mmap_filter"])
+    def test_same_as_default(self, duplicate_vmd_path, tmp_path, reader_kwargs):
+        (tmp_path / "default").mkdir()
+        (tmp_path / "raw").mkdir()
+
+        default_path, default_motion = write_and_read(VmdReader(duplicate_vmd_path).read_data(), tmp_path / "default")
+        raw_path, raw_motion = write_and_read(VmdReader(duplicate_vmd_path, **reader_kwargs).read_data(), tmp_path / "raw")
+
+        # 未展開のキーフレも、同じフレーム番号は最初のキーだけ出力する
+        with open(default_path, "rb") as f:
+            default_size = len(f.read())
+        with open(raw_path, "rb") as f:
+            raw_size = len(f.read())
+        assert raw_size == default_size
+
+        assert raw_motion.motion_cnt == default_motion.motion_cnt == 3
+        assert raw_motion.morph_cnt == default_motion.morph_cnt == 2
+        assert raw_motion.bones["センター"][10].position.to_log() == MVector3D(1, 2, 3).to_log()
+        assert raw_motion.morphs["あ"][0].ratio == 0
+
+
+class TestPickle:
+
+    def test_frame_pickle(self, motion):
+        # 別プロセスに渡したキーフレは値だけ引き継ぎ、読み込み元の未変更には影響しない
+        bf = pickle.loads(pickle.dumps(motion.bones["センター"][10]))
+        mf = pickle.loads(pickle.dumps(motion.morphs["い"][3]))
+
+        bf.position = MVector3D(5, 6, 7)
+        mf.ratio = 0.75
+
+        assert "センター" in motion.unchanged_bones
+        assert "い" in motion.unchanged_morphs
+        assert (bf.name, bf.bname, bf.fno, bf.key, bf.read) == ("センター", motion.bones["センター"][10].bname, 10, True, True)
+        assert bf.interpolation[:4] == [20, 20, 0, 0]
+        assert (mf.name, mf.fno, mf.ratio) == ("い", 3, 0.75)
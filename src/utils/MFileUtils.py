@@ -6,15 +6,26 @@ import sys
 import os
 import json
 import glob
+import hashlib
 import traceback
 from pathlib import Path
 import re
+import threading
 import _pickle as cPickle
 
 from utils.MLogger import MLogger  # noqa
 
 logger = MLogger(__name__)
 
+# ファイルハッシュ値キャッシュ（キー：ファイルパス、値：[ファイルサイズ, 更新日時, ハッシュ値]）
+file_digests = {}
+# ファイルハッシュ値キャッシュのロック（読み込みスレッドから参照・登録される）
+digest_lock = threading.Lock()
+# ファイルハッシュ値キャッシュの最大件数
+DIGEST_CACHE_MAX = 200
+# ファイルハッシュ値キャッシュの形式（ハッシュ値の求め方が変わったら上げて、古いキャッシュは使わない）
+DIGEST_CACHE_VERSION = 2
+
 
 # リソースファイルのパス
 def resource_path(relative):
@@ -78,6 +89,9 @@ def read_history(mydir_path):
         except Exception:
             file_hitories = cPickle.loads(cPickle.dumps(base_file_hitories, -1))
 
+    # 履歴と一緒にハッシュ値キャッシュも読み込む
+    read_digest_cache(mydir_path)
+
     return file_hitories
 
 
@@ -89,6 +103,136 @@ def save_history(mydir_path, file_hitories):
     except Exception as e:
         logger.error("履歴ファイルの保存に失敗しました", e, decoration=MLogger.DECORATION_BOX)
 
+    # 履歴と一緒にハッシュ値キャッシュも保存
+    save_digest_cache(mydir_path)
+
+
+# ファイルハッシュ値キャッシュ読み込み
+def read_digest_cache(mydir_path):
+    try:
+        with open(os.path.join(mydir_path, "digest.json"), "r", encoding="utf-8") as f:
+            digest_cache = json.load(f)
+
+        if digest_cache.get("version") != DIGEST_CACHE_VERSION:
+            # 形式が違うキャッシュは使わない
+            return
+
+        with digest_lock:
+            file_digests.update(digest_cache["digests"])
+    except Exception:
+        # 読み込めなかった場合、キャッシュなしで続ける
+        pass
+
+
+# ファイルハッシュ値キャッシュ保存
+def save_digest_cache(mydir_path):
+    with digest_lock:
+        digest_cache = {"version": DIGEST_CACHE_VERSION, "digests": dict(file_digests)}
+
+    try:
+        with open(os.path.join(mydir_path, "digest.json"), "w", encoding="utf-8") as f:
+            json.dump(digest_cache, f, ensure_ascii=False)
+    except Exception as e:
+        logger.error("ハッシュ値キャッシュの保存に失敗しました", e, decoration=MLogger.DECORATION_BOX)
+
+
+# ファイルサイズ・更新日時が前回と同じ場合、キャッシュしているハッシュ値を返す（なければNone）
+def get_cached_digest(file_path: str):
+    with digest_lock:
+        if file_path not in file_digests:
+            return None
+
+        size, mtime, digest = file_digests[file_path]
+
+    try:
+        stat = os.stat(file_path)
+    except Exception:
+        return None
+
+    if size == stat.st_size and mtime == stat.st_mtime_ns:
+        return digest
+
+    return None
+
+
+# ファイルのハッシュ値をキャッシュに登録
+# stat: ハッシュ値を求めた中身を読む前に取得したファイル情報（読み込み後に書き換えられた場合、次回はサイズか更新日時が違うので使われない）
+def regist_digest(file_path: str, digest: str, stat: os.stat_result):
+    with digest_lock:
+        # 最新を末尾にして、古いものから削除
+        file_digests.pop(file_path, None)
+        file_digests[file_path] = [stat.st_size, stat.st_mtime_ns, digest]
+
+        for old_file_path in list(file_digests.keys())[:-DIGEST_CACHE_MAX]:
+            del file_digests[old_file_path]
+
+
+# ファイルのハッシュ値（ファイルパス込み）
+# 読み込み済みのバイト列がある場合、ファイルを読み直さずにそれを使う
+# buffer_stat: 読み込み済みのバイト列を読む前に取得したファイル情報（ない場合、キャッシュに登録しない）
+def calc_file_digest(file_path: str, buffer=None, buffer_stat=None):
+    # ファイルが前回から変わってない場合、キャッシュを使う
+    digest = get_cached_digest(file_path)
+    if digest:
+        return digest
+
+    sha1 = hashlib.sha1()
+    chunk_size = 2048 * sha1.block_size
+
+    # 最後の塊はもう一度ハッシュに含める（過去のハッシュ値と同じ値にするため）
+    if buffer is not None:
+        stat = buffer_stat
+
+        with memoryview(buffer) as view:
+            sha1.update(view)
+
+            if len(view) > 0:
+                sha1.update(view[((len(view) - 1) // chunk_size * chunk_size):])
+    else:
+        chunk = b''
+        with open(file_path, 'rb') as f:
+            # 読む前のファイル情報でキャッシュに登録する
+            stat = os.fstat(f.fileno())
+
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                sha1.update(chunk)
+
+        sha1.update(chunk)
+
+    # ファイルパスをハッシュに含める
+    sha1.update(file_path.encode('utf-8'))
+
+    digest = sha1.hexdigest()
+    if stat:
+        regist_digest(file_path, digest, stat)
+
+    return digest
+
+
+# 変更検知用シグネチャで部分ハッシュを取る先頭・末尾のバイト数
+SIGNATURE_PARTIAL_SIZE = 65536
+
+
+# ファイルの変更検知用シグネチャ（サイズ・更新日時・先頭末尾の部分ハッシュ）
+# ファイル全体は読まないので、読み込み前の変更チェックに使う
+def get_file_signature(file_path: str):
+    stat = os.stat(file_path)
+    sha1 = hashlib.sha1()
+
+    with open(file_path, "rb") as f:
+        # 先頭
+        sha1.update(f.read(SIGNATURE_PARTIAL_SIZE))
+
+        if stat.st_size > SIGNATURE_PARTIAL_SIZE * 2:
+            # 末尾（小さいファイルは先頭の続きを全部読む）
+            f.seek(-SIGNATURE_PARTIAL_SIZE, os.SEEK_END)
+        sha1.update(f.read(SIGNATURE_PARTIAL_SIZE))
+
+    # ファイルパスをハッシュに含める
+    sha1.update(file_path.encode('utf-8'))
+
+    return "{0}:{1}:{2}".format(stat.st_size, stat.st_mtime_ns, sha1.hexdigest())
+
 
 # パス解決
 def get_mydir_path(exec_path):
@@ -8,6 +8,7 @@ from libc.math cimport sin, cos, acos, atan2, asin, pi, sqrt
 
 from module.MParams import BoneLinks # noqa
 from module.MMath import MRect, MVector2D, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
+from module.MMath import qq_list_to_array, qq_array_multiply, qq_array_to_matrix, qq_array_from_matrix, qq_array_rotate, qq_array_rotation_to # noqa
 from mmd.PmxData import PmxModel, Bone, Vertex, Material, Morph, DisplaySlot, RigidBody, Joint # noqa
 from mmd.VmdData import VmdMotion, VmdBoneFrame, VmdCameraFrame, VmdInfoIk, VmdLightFrame, VmdMorphFrame, VmdShadowFrame, VmdShowIkFrame # noqa
 from module.MOptions import MOptionsDataSet # noqa
@@ -24,7 +25,7 @@ def calc_IK(model: PmxModel, links: BoneLinks, motion: VmdMotion, fno: int, targ
     c_calc_IK(model, links, motion, fno, target_pos, ik_links, max_count)
 
 cdef c_calc_IK(PmxModel model, BoneLinks links, VmdMotion motion, int fno, MVector3D target_pos, BoneLinks ik_links, int max_count):
-    cdef list bone_name_list = list(ik_links.all().keys())[1:]
+    cdef list bone_name_list = ik_links.names()[1:]
     cdef str bone_name
     cdef VmdBoneFrame bf
 
@@ -226,6 +227,48 @@ cdef tuple c_separate_local_qq(int fno, str bone_name, MQuaternion qq, MVector3D
 
     return (x_qq, y_qq, z_qq, yz_qq)
 
+# c_separate_local_qq の配列版（qq_ary: N×4）
+# 全フレームの回転をまとめて分離する
+def separate_local_qq_array(qq_ary: np.ndarray, global_x_axis: MVector3D):
+    # ローカル座標系（ボーンベクトルが（1，0，0）になる空間）の向き
+    cdef np.ndarray local_axis = np.array([1, 0, 0], dtype=np.float64)
+    cdef np.ndarray global_axis = np.array([global_x_axis.x(), global_x_axis.y(), global_x_axis.z()], dtype=np.float64)
+
+    # グローバル座標系（Ａスタンス）からローカル座標系への変換
+    cdef np.ndarray global2local_qq = qq_array_rotation_to(global_axis, local_axis)
+    cdef np.ndarray local2global_qq = qq_array_rotation_to(local_axis, global_axis)
+
+    # X成分を抽出する ------------
+
+    cdef np.ndarray qq_mat = qq_array_to_matrix(qq_ary)
+
+    # YZの回転量（自身のねじれを無視する）
+    cdef np.ndarray yz_qq = qq_array_rotation_to(global_axis, np.einsum('nij,j->ni', qq_mat, global_axis))
+    cdef np.ndarray yz_mat = qq_array_to_matrix(yz_qq)
+
+    # YZ回転からZ成分を抽出する --------------
+
+    cdef np.ndarray z1_vec = np.einsum('nij,j->ni', yz_mat, qq_array_rotate(global2local_qq, local_axis))
+    z1_vec[:, 2] = 0                    # Z方向の移動量を潰す
+
+    # ローカル軸からZを潰した移動への回転量をグローバル座標系の回転に戻す
+    cdef np.ndarray local_z_qq = qq_array_rotation_to(local_axis, z1_vec)
+    cdef np.ndarray z_qq = qq_array_from_matrix(qq_array_to_matrix(local_z_qq) @ qq_array_to_matrix(local2global_qq))
+    cdef np.ndarray z_mat_inv = np.transpose(qq_array_to_matrix(z_qq), (0, 2, 1))
+
+    # YZ回転からY成分だけ取り出す -----------
+
+    cdef np.ndarray y2_qq = qq_array_from_matrix(yz_mat @ z_mat_inv)
+
+    # X成分の捻れが混入したので、XY回転からYZ回転を取り出すことでXキャンセルをかける。
+    cdef np.ndarray y_qq = qq_array_rotation_to(global_axis, qq_array_rotate(y2_qq, global_axis))
+
+    # Xを再度求める -------------
+
+    cdef np.ndarray x_qq = qq_array_from_matrix(np.transpose(qq_array_to_matrix(y_qq), (0, 2, 1)) @ qq_mat @ z_mat_inv)
+
+    return x_qq, y_qq, z_qq, yz_qq
+
 # 正面向きの情報を含むグローバル位置
 def calc_front_global_pos(model: PmxModel, links: BoneLinks, motion: VmdMotion, fno: int, limit_links=None, direction_limit_links=None):
     return_tuple = c_calc_front_global_pos(model, links, motion, fno, limit_links, direction_limit_links)
@@ -272,7 +315,7 @@ cdef tuple c_calc_global_pos(PmxModel model, BoneLinks links, VmdMotion motion,
     cdef MQuaternion q
     cdef MMatrix4x4 mm
 
-    for n, (lname, v, q) in enumerate(zip(links.all().keys(), trans_vs, add_qs)):
+    for n, (lname, v, q) in enumerate(zip(links.names(), trans_vs, add_qs)):
         # 行列を生成
         mm = MMatrix4x4()
         # 初期化
@@ -291,19 +334,16 @@ cdef tuple c_calc_global_pos(PmxModel model, BoneLinks links, VmdMotion motion,
     cdef MVector3D local_axis
     cdef MQuaternion local_axis_qq
 
-    for n, (lname, v) in enumerate(zip(links.all().keys(), trans_vs)):
+    for n, (lname, v) in enumerate(zip(links.names(), trans_vs)):
         if n == 0:
             mm = MMatrix4x4()
             mm.setToIdentity()
-
-        for m in range(n):
-            # 最後のひとつ手前までループ
-            if m == 0:
-                # 0番目の位置を初期値とする
-                mm = matrixs[0].copy()
-            else:
-                # 自分より前の行列結果を掛け算する
-                mm *= matrixs[m]
+        elif n == 1:
+            # 0番目の位置を初期値とする
+            mm = matrixs[0].copy()
+        else:
+            # 自分より前の行列結果を掛け算する（ひとつ前までの累積に掛ける）
+            mm *= matrixs[n - 1]
         
         # 自分は、位置だけ掛ける
         global_3ds_dic[lname] = mm * v
@@ -323,7 +363,7 @@ cdef tuple c_calc_global_pos(PmxModel model, BoneLinks links, VmdMotion motion,
                 # ローカル軸が設定されていない場合、計算
 
                 # 自身から親を引いた軸の向き
-                local_axis = model.bones[lname].position - links.get(lname, offset=-1).position
+                local_axis = model.bones[lname].position - links.get_by_index(n - 1).position
                 local_axis_qq = MQuaternion.fromDirection(local_axis.normalized(), MVector3D(0, 0, 1))
             else:
                 # ローカル軸が設定されている場合、その値を採用
@@ -336,6 +376,60 @@ cdef tuple c_calc_global_pos(PmxModel model, BoneLinks links, VmdMotion motion,
     return (global_3ds_dic, total_mats)
 
 
+# calc_global_pos の複数フレーム一括版
+# fnos: フレーム番号リスト
+# bone_cache: ボーン名をキーに、フレームごとの相対位置・回転配列を保持する辞書（同じfnosで複数リンクを計算する場合に共有する）
+# 戻り値: ボーン名をキーに、グローバル位置配列（N×3）を保持する辞書（return_matrixの場合、グローバル行列配列（N×4×4）も返す）
+def calc_global_pos_array(model: PmxModel, links: BoneLinks, motion: VmdMotion, fnos: list, bone_cache=None, return_matrix=False):
+    cdef int fno_cnt = len(fnos)
+    cdef int n
+    cdef str lname
+    cdef Bone link_bone
+    cdef list bfs
+    cdef np.ndarray trans_ary, total_mat, local_mat
+    cdef dict global_3ds_dic = {}
+    cdef dict total_mats = {}
+
+    if bone_cache is None:
+        bone_cache = {}
+
+    # 累積行列（初期値は単位行列）
+    total_mat = np.tile(np.eye(4, dtype=np.float64), (fno_cnt, 1, 1))
+
+    cdef list relative_positions = links.relative_positions()
+
+    for n, lname in enumerate(links.names()):
+        link_bone = links.get_by_index(n)
+
+        if lname not in bone_cache:
+            # 同じボーンのキーフレは一度だけ求める
+            bfs = [motion.calc_bf(link_bone.name, fno) for fno in fnos]
+            bone_cache[lname] = (np.array([bf.position.data() for bf in bfs], dtype=np.float64).reshape(fno_cnt, 3), \
+                                 qq_list_to_array([deform_rotation(model, motion, bf) for bf in bfs]))
+
+        # 位置：自身から親の位置を引いた相対位置（一番親は、グローバル座標を考慮）
+        trans_ary = bone_cache[lname][0] + relative_positions[n].data()
+
+        # 自分は、位置だけ掛ける
+        global_3ds_dic[lname] = np.einsum('nij,nj->ni', total_mat[:, :3, :3], trans_ary) + total_mat[:, :3, 3]
+
+        # 行列を生成（移動→回転）
+        local_mat = np.tile(np.eye(4, dtype=np.float64), (fno_cnt, 1, 1))
+        local_mat[:, :3, :3] = qq_array_to_matrix(bone_cache[lname][1])
+        local_mat[:, :3, 3] = trans_ary
+
+        # 最後の行列をかけ算する
+        total_mat = total_mat @ local_mat
+
+        if return_matrix:
+            total_mats[lname] = total_mat
+
+    if return_matrix:
+        return global_3ds_dic, total_mats
+
+    return global_3ds_dic
+
+
 # 指定された方向に向いた場合の位置情報を返す
 cpdef dict calc_global_pos_by_direction(MQuaternion direction_qq, dict target_pos_3ds_dic):
     cdef dict direction_pos_dic = {}
@@ -373,8 +467,8 @@ cdef list c_calc_relative_position(PmxModel model, BoneLinks links, VmdMotion mo
     cdef Bone link_bone
     cdef VmdBoneFrame fill_bf
 
-    for link_idx, link_bone_name in enumerate(links.all()):
-        link_bone = links.get(link_bone_name)
+    for link_idx, link_bone_name in enumerate(links.names()):
+        link_bone = links.get_by_index(link_idx)
 
         if not limit_links or (limit_links and limit_links.get(link_bone_name)):
             # 上限リンクがある倍、ボーンが存在している場合のみ、モーション内のキー情報を取得
@@ -390,7 +484,7 @@ cdef list c_calc_relative_position(PmxModel model, BoneLinks links, VmdMotion mo
             trans_vs.append(link_bone.position + fill_bf.position)
         else:
             # 位置：自身から親の位置を引いた相対位置
-            trans_vs.append(link_bone.position + fill_bf.position - links.get(link_bone_name, offset=-1).position)
+            trans_vs.append(link_bone.position + fill_bf.position - links.get_by_index(link_idx - 1).position)
 
     return trans_vs
 
@@ -407,8 +501,8 @@ cdef list c_calc_relative_rotation(PmxModel model, BoneLinks links, VmdMotion mo
     cdef VmdBoneFrame fill_bf
     cdef MQuaternion rot
 
-    for link_idx, link_bone_name in enumerate(links.all()):
-        link_bone = links.get(link_bone_name)
+    for link_idx, link_bone_name in enumerate(links.names()):
+        link_bone = links.get_by_index(link_idx)
 
         if not limit_links or (limit_links and limit_links.get(link_bone_name)):
             # 上限リンクがある場合、ボーンが存在している場合のみ、モーション内のキー情報を取得